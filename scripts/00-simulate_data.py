@@ -8,125 +8,36 @@
 
 
 #### Workspace setup ####
+import os
+import sys
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
-np.random.seed(302)
-
-
-## Simulated situation attributes ##
-
-# The possible incident types causing the delay
-sim_incident_types = [
-    "Equipment/Mechanical",
-    "Miscellaneous",
-    "Security/Safety",
-    "Operator"
-]
-
-# Expected distribution of incident types
-sim_incident_probabilities = [
-    0.3,
-    0.2,
-    0.4,
-    0.2
-]
-
-# The days of the week the buses and subways operate
-sim_operating_days = [
-    "Sunday",
-    "Monday",
-    "Tuesday",
-    "Wednesday",
-    "Thursday",
-    "Friday",
-    "Saturday"
-]
-
-# Assumption that delays change depending on the day
-sim_probability_of_subway_delay = [
-    0.18,  # Sort of high on Sundays
-    0.14,  # Slightly lower as people go back to school/work
-    0.10,  # Low on Tuesday
-    0.10,  # Low on Wednesday
-    0.11,  # Low on Thursday
-    0.17,  # High on Friday
-    0.20   # High on Saturday
-]
-
-# Sample 1 time from a possion dist with an average
-# of 20,000 delays in 1 day
-num_subway_delays = np.random.poisson(20000)
-
-# Assumption that there are more bus delays (strong base since bus delay 
-# dataset is twice the size) and subway delays and bus delays are correlated
-num_bus_delays = int(1.5 * num_subway_delays)
-
-
-## Simulated situation attributes ##
-
-# The possible incident types causing the delay
-sim_incident_types = [
-    "Equipment/Mechanical",
-    "Miscellaneous",
-    "Security/Safety",
-    "Operator"
-]
-
-# Expected distribution of incident types
-sim_incident_probabilities = [
-    0.3,
-    0.2,
-    0.4,
-    0.2
-]
-
-# The days of the week the buses and subways operate
-sim_operating_days = [
-    "Sunday",
-    "Monday",
-    "Tuesday",
-    "Wednesday",
-    "Thursday",
-    "Friday",
-    "Saturday"
-]
-
-# Assumption that delays change depending on the day
-sim_probability_of_subway_delay = [
-    0.18,  # Sort of high on Sundays
-    0.14,  # Slightly lower as people go back to school/work
-    0.10,  # Low on Tuesday
-    0.10,  # Low on Wednesday
-    0.11,  # Low on Thursday
-    0.17,  # High on Friday
-    0.20   # High on Saturday
-]
-
-# Sample 1 time from a possion dist with an average
-# of 20,000 delays in 1 day
-num_subway_delays = np.random.poisson(20000)
-
-# Assumption that there are more bus delays (strong base since bus delay 
-# dataset is twice the size) and subway delays and bus delays are correlated
-num_bus_delays = int(1.5 * num_subway_delays)
-
-
-# Simulate delays happening
-sim_data_subway = pd.DataFrame({
-    "day": np.random.choice(sim_operating_days, size=num_subway_delays, p=sim_probability_of_subway_delay),
-    "time": np.random.normal(loc=17, scale=6, size=num_subway_delays) % 24,
-    "incident": np.random.choice(sim_incident_types, size=num_subway_delays, p=sim_incident_probabilities),
-    "delay_time": np.random.poisson(lam=30, size=num_subway_delays) + 1
-})
-
-sim_data_bus = pd.DataFrame({
-    "day": np.random.choice(sim_operating_days, size=num_bus_delays, p=sim_probability_of_subway_delay),
-    "time": np.random.normal(loc=17, scale=6, size=num_bus_delays) % 24,
-    "incident": np.random.choice(sim_incident_types, size=num_bus_delays, p=sim_incident_probabilities),
-    "delay_time": np.random.poisson(lam=30, size=num_bus_delays) + 1
-})
+# Make the ttc_analysis package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ttc_analysis.paths import RAW_BUS_DELAYS, RAW_SUBWAY_DELAYS, SIMULATION_DIR
+from ttc_analysis.simulate import BUS_INCIDENT_WEIGHTS, simulate_raw_data
+
+# Multiple of today's yearly volume to simulate (e.g. 10 or 1000 to
+# load-test the pipeline) and number of years to spread it over
+sim_scale = float(os.environ.get("TTC_SIMULATE_SCALE", 1))
+sim_years = int(os.environ.get("TTC_SIMULATE_YEARS", 1))
+
+
+## Simulate delays happening ##
+
+# Writes raw bus and subway tables in the format of the downloaded ones
+# under simulation/, along with a copy of the subway codes, so the other
+# scripts can be run on them from there
+simulate_raw_data(SIMULATION_DIR, scale=sim_scale, years=sim_years, seed=302)
+
+# Read a sample of the data back to check it
+sim_data_subway = pd.read_csv(SIMULATION_DIR / RAW_SUBWAY_DELAYS, nrows=100000)
+sim_data_bus = pd.read_csv(SIMULATION_DIR / RAW_BUS_DELAYS, nrows=100000)
 
 # Display the data
 print(sim_data_subway)
@@ -138,7 +49,8 @@ print(sim_data_bus)
 plt.figure(figsize=(12, 4))
 
 plt.subplot(1, 3, 1)
-plt.hist(sim_data_subway["time"], bins=np.arange(0, 24.2, 0.2), color="blue", alpha=0.75)
+sim_hours = pd.to_datetime(sim_data_subway["Time"], format="%H:%M")
+plt.hist(sim_hours.dt.hour + sim_hours.dt.minute / 60, bins=np.arange(0, 24.2, 0.2), color="blue", alpha=0.75)
 plt.title("A simulation of the amount of delays at a given time")
 plt.xlabel("Time (in military time hrs)")
 plt.ylabel("Number of delays")
@@ -150,29 +62,25 @@ plt.show()
 # Testing
 
 # Test that the incident types are limited to the set
-print(set(sim_data_subway["incident"].unique()) == set(sim_incident_types))
-print(set(sim_data_bus["incident"].unique()) == set(sim_incident_types))
+assert set(sim_data_bus["Incident"].unique()) <= set(BUS_INCIDENT_WEIGHTS)
 
 # Test that there are only 7 unique days
-print(len(sim_data_subway["day"].unique()) == 7)
-print(len(sim_data_bus["day"].unique()) == 7)
+assert len(sim_data_subway["Day"].unique()) == 7
+assert len(sim_data_bus["Day"].unique()) == 7
 
-# Test that delay times are all positive and reasonable; 
-# (between 1 minute to 5 hours) 
-print(sim_data_subway["delay_time"].min() >= 1)
-print(sim_data_subway["delay_time"].max() <= 60 * 5)
+# Test that delay times are all non-negative and fit the 16-bit schema
+# (at most 999 minutes)
+assert sim_data_subway["Min Delay"].min() >= 0
+assert sim_data_subway["Min Delay"].max() <= 999
 
-print(sim_data_bus["delay_time"].min() >= 1)
-print(sim_data_bus["delay_time"].max() <= 60 * 5)
+assert sim_data_bus["Min Delay"].min() >= 0
+assert sim_data_bus["Min Delay"].max() <= 999
 
 # Clean up workspace
 del (
-    num_bus_delays,
-    num_subway_delays,
     sim_data_bus,
     sim_data_subway,
-    sim_incident_probabilities,
-    sim_incident_types,
-    sim_operating_days,
-    sim_probability_of_subway_delay
+    sim_hours,
+    sim_scale,
+    sim_years
 )
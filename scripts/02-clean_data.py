@@ -8,132 +8,132 @@
 
 #### Workspace setup ####
 
-import pandas as pd
-
-#### Read and clean raw data ####
-
-## Read in Bus data
-raw_bus_data = pd.read_csv("inputs/data/raw_bus_delay_statistics.csv")
-
-# Clean names
-cleaned_bus_data = raw_bus_data.rename(columns=lambda x: x.strip().lower().replace(" ", "_"))
-
-# Select only relevant columns
-cleaned_bus_data = cleaned_bus_data[[
-    "date",
-    "time",
-    "day",
-    "incident",
-    "min_delay",
-    "min_gap"
-]]
-
-# Filter out situations in which the delay is 0, meaning the incident that
-# occurred didn't affect service
-cleaned_bus_data = cleaned_bus_data[cleaned_bus_data["min_gap"] > 0]
+import sys
+from pathlib import Path
 
-# Save cleaned bus data
-cleaned_bus_data.to_csv("inputs/data/bus_delay_statistics.csv", index=False)
+import pandas as pd
 
+# Make the shared ttc_analysis package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ttc_analysis import clean, schema, store, stream, validate
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.clean import (
+    CLEANED_CONSTRAINTS,
+    clean_bus_data,
+    clean_subway_codes,
+    clean_subway_data,
+    filter_subway_data
+)
+from ttc_analysis.paths import (
+    BUS_DELAYS,
+    FILTERED_SUBWAY_DELAYS,
+    RAW_BUS_DELAYS,
+    RAW_SUBWAY_CODES,
+    RAW_SUBWAY_DELAYS,
+    SUBWAY_CODES,
+    SUBWAY_DELAYS
+)
+from ttc_analysis.store import csv_path, parquet_path, write_table
+from ttc_analysis.stream import CHUNK_SIZE, consume, read_csv_chunks, validate_chunks, write_chunks
 
-## SUBWAY DATA
+# Each dataset below is skipped if its raw file, the cleaning code and the
+# chunk size are unchanged since the last run (see ttc_analysis/cache.py)
+cache = BuildCache()
+code = [clean, schema, store, stream, validate]
 
-# Read in subway statistics
-raw_subway_data = pd.read_csv("inputs/data/raw_subway_delay_statistics.csv")
+# The delay tables are read and cleaned in chunks of CHUNK_SIZE rows if the
+# TTC_CHUNK_SIZE environment variable is set, and whole otherwise (see
+# ttc_analysis/stream.py)
+params = {"chunk_size": CHUNK_SIZE}
 
-# Clean names
-cleaned_subway_data = raw_subway_data.rename(columns=lambda x: x.strip().lower().replace(" ", "_"))
+#### Read and clean raw data ####
 
-# Select only relevant columns
-cleaned_subway_data = cleaned_subway_data[[
-    "date",
-    "time",
-    "day",
-    "code",
-    "min_delay",
-    "min_gap",
-    "line"  # additional for subway (no similar grouping for buses)
-]]
+## Bus data
+bus_fingerprint = fingerprint(inputs=[RAW_BUS_DELAYS], modules=code, params=params)
 
-# Save cleaned subway data
-cleaned_subway_data.to_csv("inputs/data/subway_delay_statistics.csv", index=False)
+if cache.is_fresh("02-clean_data/bus", bus_fingerprint, [parquet_path(BUS_DELAYS)]):
+    print("Bus data unchanged since the last run, skipping")
+else:
+    raw_bus_data = read_csv_chunks(RAW_BUS_DELAYS)
 
-# The reason 2 different .csv files are stored is that the vast majority
-# of rows had a delay of 0 minutes. It seems as if a delay of 0 minutes
-# means a delay of < 1 minute which is reasonable for a subway system.
-# However, since this is an assumption, I also kept the filtered 
-# dataset for reference.
+    # Clean names, select relevant columns and drop rows that didn't
+    # affect service
+    cleaned_bus_data = validate_chunks(
+        map(clean_bus_data, raw_bus_data),
+        CLEANED_CONSTRAINTS["bus"],
+        "cleaned bus delays"
+    )
 
-# Filter out situations in which the delay is 0, meaning the incident that
-# occurred didn't affect service
-filtered_subway_data = cleaned_subway_data[cleaned_subway_data["min_delay"] > 0]
+    # Save cleaned bus data (typed Parquet, read back by 03-parse_codes)
+    consume(write_chunks(cleaned_bus_data, BUS_DELAYS))
+    cache.record("02-clean_data/bus", bus_fingerprint)
 
-# Save cleaned and filtered subway data
-filtered_subway_data.to_csv("inputs/data/filtered_subway_delay_statistics.csv", index=False)
+    del raw_bus_data, cleaned_bus_data
 
 
-# Read in subway codes
-raw_subway_codes = pd.read_csv("inputs/data/raw_subway_delay_codes.csv")
+## SUBWAY DATA
+subway_fingerprint = fingerprint(inputs=[RAW_SUBWAY_DELAYS], modules=code, params=params)
+subway_outputs = [
+    parquet_path(SUBWAY_DELAYS),
+    parquet_path(FILTERED_SUBWAY_DELAYS),
+    csv_path(FILTERED_SUBWAY_DELAYS)
+]
 
-# Clean names
-cleaned_subway_codes = raw_subway_codes.rename(columns=lambda x: x.strip().lower().replace(" ", "_"))
+if cache.is_fresh("02-clean_data/subway", subway_fingerprint, subway_outputs):
+    print("Subway data unchanged since the last run, skipping")
+else:
+    raw_subway_data = read_csv_chunks(RAW_SUBWAY_DELAYS)
 
-# Select sub_rmenu_code columns
-sub_rmenu_codes = cleaned_subway_codes[[
-    "sub_rmenu_code",
-    "code_description"
-]].rename(columns={
-    "sub_rmenu_code": "code",
-    "code_description": "code_description"
-})
+    # Clean names and select relevant columns
+    cleaned_subway_data = validate_chunks(
+        map(clean_subway_data, raw_subway_data),
+        CLEANED_CONSTRAINTS["subway"],
+        "cleaned subway delays"
+    )
 
-# Select srt_rmenu_code columns (Scarborough RT)
-srt_rmenu_codes = cleaned_subway_codes[[
-    "srt_rmenu_code",
-    "code_description.1"
-]].dropna(subset=["srt_rmenu_code"]).rename(columns={
-    "srt_rmenu_code": "code",
-    "code_description.1": "code_description"
-})
+    # Save cleaned subway data
+    cleaned_subway_data = write_chunks(cleaned_subway_data, SUBWAY_DELAYS)
 
-# Merge back in the 2 sets of codes
-merged_subway_codes = pd.concat([sub_rmenu_codes, srt_rmenu_codes], ignore_index=True)
+    # The reason 2 different subway tables are stored is that the vast majority
+    # of rows had a delay of 0 minutes. It seems as if a delay of 0 minutes
+    # means a delay of < 1 minute which is reasonable for a subway system.
+    # However, since this is an assumption, I also kept the filtered 
+    # dataset for reference.
+    filtered_subway_data = map(filter_subway_data, cleaned_subway_data)
 
-# Save cleaned code mappings
-merged_subway_codes.to_csv("inputs/data/subway_delay_codes.csv", index=False)
+    # Save cleaned and filtered subway data, also as CSV for reference. Each
+    # chunk goes through all of the steps above before the next is read
+    consume(write_chunks(filtered_subway_data, FILTERED_SUBWAY_DELAYS, export_csv=True))
+    cache.record("02-clean_data/subway", subway_fingerprint)
 
+    del raw_subway_data, cleaned_subway_data, filtered_subway_data
 
-#### Data Validation ####
 
-# Test that there are only 7 unique days
-assert cleaned_subway_data["day"].nunique() == 7
-assert cleaned_bus_data["day"].nunique() == 7
+## Subway codes
+codes_fingerprint = fingerprint(inputs=[RAW_SUBWAY_CODES], modules=code)
 
-# Test that delay times are positive
-assert cleaned_subway_data["min_delay"].min() >= 0
-assert cleaned_bus_data["min_delay"].min() >= 0
+if cache.is_fresh("02-clean_data/codes", codes_fingerprint, [parquet_path(SUBWAY_CODES)]):
+    print("Subway codes unchanged since the last run, skipping")
+else:
+    raw_subway_codes = pd.read_csv(RAW_SUBWAY_CODES)
 
-# Verify datatypes (informal check, not strict class testing like R)
-assert cleaned_subway_data["day"].dtype == "object"
-assert cleaned_bus_data["day"].dtype == "object"
+    # Merge the subway and Scarborough RT code tables
+    merged_subway_codes = clean_subway_codes(raw_subway_codes)
 
-# 'time' likely string or object unless parsed explicitly
-# skipping strict time type assertion (would require datetime parsing)
+    # Save cleaned code mappings
+    write_table(merged_subway_codes, SUBWAY_CODES)
+    cache.record("02-clean_data/codes", codes_fingerprint)
 
-assert pd.api.types.is_numeric_dtype(cleaned_subway_data["min_delay"])
-assert pd.api.types.is_numeric_dtype(cleaned_subway_data["min_gap"])
-assert pd.api.types.is_numeric_dtype(cleaned_bus_data["min_delay"])
-assert pd.api.types.is_numeric_dtype(cleaned_bus_data["min_gap"])
+    del raw_subway_codes, merged_subway_codes
 
 # Clean up workspace
 del (
-    cleaned_bus_data,
-    cleaned_subway_data,
-    raw_bus_data,
-    raw_subway_data,
-    raw_subway_codes,
-    sub_rmenu_codes,
-    srt_rmenu_codes,
-    merged_subway_codes,
-    filtered_subway_data
+    cache,
+    code,
+    params,
+    bus_fingerprint,
+    subway_fingerprint,
+    subway_outputs,
+    codes_fingerprint
 )
@@ -7,137 +7,142 @@
 # Prerequisites: 01-download_data, 02-clean_data
 
 #### Workspace setup ####
-import pandas as pd
+import sys
+from pathlib import Path
+
+# Make the shared ttc_analysis package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ttc_analysis import classify, clean, normalise, parse_codes, schema, shared, store, stream, validate
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.parse_codes import (
+    BUS_INCIDENT_CONSTRAINTS,
+    BUS_INCIDENT_MAP,
+    LINE_MAP,
+    LINE_PATTERNS,
+    SUBWAY_INCIDENT_RULES,
+    classify_subway_codes,
+    group_bus_incidents,
+    group_subway_incidents,
+    grouped_constraints,
+    ungrouped_subway_constraints
+)
+from ttc_analysis.paths import (
+    BUS_DELAYS,
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_CODES,
+    CLEANED_SUBWAY_DELAYS,
+    SUBWAY_CODES,
+    SUBWAY_DELAYS
+)
+from ttc_analysis.shared import publish_table
+from ttc_analysis.store import columns_path, csv_path, parquet_path, read_table, write_table
+from ttc_analysis.stream import CHUNK_SIZE, consume, read_table_chunks, validate_chunks, write_chunks
+
+# Each dataset below is skipped if its inputs, the grouping code, the
+# incident maps, incident rules and line map, and the chunk size are
+# unchanged since the last run (see ttc_analysis/cache.py). The delay tables
+# are read and grouped in chunks of CHUNK_SIZE rows if the TTC_CHUNK_SIZE
+# environment variable is set, and whole otherwise (see ttc_analysis/stream.py)
+cache = BuildCache()
+code = [classify, clean, normalise, parse_codes, schema, shared, store, stream, validate]
 
 ### Bus data ###
-
-# Load in non-grouped data
-bus_delay_data = pd.read_csv("inputs/data/bus_delay_statistics.csv")
-
-# Group bus incidents
-bus_incident_map = {
-    "Diversion": "Miscellaneous",
-    "Security": "Security/Safety",
-    "Cleaning - Unsanitary": "Security/Safety",
-    "Emergency Services": "Security/Safety",
-    "Collision - TTC": "Operator",
-    "Mechanical": "Equipment/Mechanical",
-    "Operations - Operator": "Operator",
-    "Investigation": "Security/Safety",
-    "Utilized Off Route": "Miscellaneous",
-    "General Delay": "Miscellaneous",
-    "Road Blocked - NON-TTC Collision": "Miscellaneous",
-    "Held By": "Miscellaneous",
-    "Vision": "Security/Safety"
-}
-
-cleaned_bus_delay_data = bus_delay_data.copy()
-cleaned_bus_delay_data["incident"] = cleaned_bus_delay_data["incident"].map(bus_incident_map)
-
-# Save cleaned data
-cleaned_bus_delay_data.to_csv("outputs/data/cleaned_bus_delay_statistics.csv", index=False)
+bus_fingerprint = fingerprint(
+    inputs=[parquet_path(BUS_DELAYS)],
+    modules=code,
+    params={"bus_incident_map": BUS_INCIDENT_MAP, "chunk_size": CHUNK_SIZE}
+)
+bus_outputs = [
+    parquet_path(CLEANED_BUS_DELAYS),
+    csv_path(CLEANED_BUS_DELAYS),
+    columns_path(CLEANED_BUS_DELAYS) / "schema.json"
+]
+
+if cache.is_fresh("03-parse_codes/bus", bus_fingerprint, bus_outputs):
+    print("Bus data unchanged since the last run, skipping")
+else:
+    # Load in non-grouped data
+    bus_delay_data = read_table_chunks(BUS_DELAYS)
+
+    # Group bus incidents (see BUS_INCIDENT_MAP in ttc_analysis/parse_codes.py),
+    # warning about incidents it doesn't group
+    bus_delay_data = validate_chunks(bus_delay_data, BUS_INCIDENT_CONSTRAINTS, "bus incidents")
+    cleaned_bus_delay_data = validate_chunks(
+        map(group_bus_incidents, bus_delay_data),
+        grouped_constraints("bus"),
+        "grouped bus delays"
+    )
+
+    # Save cleaned data (Parquet for 04-summarise_data, CSV for the paper)
+    consume(write_chunks(cleaned_bus_delay_data, CLEANED_BUS_DELAYS, export_csv=True))
+
+    # Publish a memory-mappable copy that any number of processes can load
+    # without each holding its own (see ttc_analysis/shared.py)
+    publish_table([parquet_path(CLEANED_BUS_DELAYS)], CLEANED_BUS_DELAYS)
+    cache.record("03-parse_codes/bus", bus_fingerprint)
+
+    del bus_delay_data, cleaned_bus_delay_data
 
 ### SUBWAY DATA ###
-
-# Read in subway codes
-subway_codes = pd.read_csv("inputs/data/subway_delay_codes.csv")
-
-# Section codes into incident groups
-def classify_subway_incident(code):
-    if str(code).startswith("E"):
-        return "Equipment/Mechanical"
-    if str(code).startswith(("MUI", "MUS", "MUP")):
-        return "Security/Safety"
-    if str(code).startswith("MUD") or str(code).startswith("MUE"):
-        return "Equipment/Mechanical"
-    if str(code).startswith("P"):
-        return "Equipment/Mechanical"
-    if str(code).startswith("S"):
-        return "Security/Safety"
-    if str(code).startswith("T"):
-        return "Operator"
-    return "Miscellaneous"
-
-cleaned_subway_codes = subway_codes.copy()
-cleaned_subway_codes["incident"] = cleaned_subway_codes["code"].apply(classify_subway_incident)
-
-# Save cleaned codes
-cleaned_subway_codes.to_csv("outputs/data/cleaned_subway_codes.csv", index=False)
-
-# Read in subway data
-subway_delay_data = pd.read_csv("inputs/data/subway_delay_statistics.csv")
-
-# Merge subway delay data with grouped code data
-cleaned_subway_delay_data = pd.merge(subway_delay_data, cleaned_subway_codes, on="code", how="inner")
-
-# Select and reorder relevant columns
-cleaned_subway_delay_data = cleaned_subway_delay_data[[
-    "date",
-    "time",
-    "day",
-    "incident",
-    "min_delay",
-    "min_gap",
-    "line"
-]]
-
-# Clean up line data
-line_map = {
-    "YU": "Yonge-University",
-    "YUS": "Yonge-University",
-    "BD": "Bloor-Danforth",
-    "BD LINE 2": "Bloor-Danforth",
-    "SRT": "Scarborough-RT",
-    "SHP": "Sheppard",
-    "YU / BD": "Yonge-University/Bloor-Danforth",
-    "BD/YU": "Yonge-University/Bloor-Danforth",
-    "YU/BD": "Yonge-University/Bloor-Danforth",
-    "YUS/BD": "Yonge-University/Bloor-Danforth",
-    "YU & BD": "Yonge-University/Bloor-Danforth",
-    "BLOOR DANFORTH & YONGE": "Yonge-University/Bloor-Danforth"
-}
-
-cleaned_subway_delay_data["line"] = cleaned_subway_delay_data["line"].map(line_map).fillna("Other")
-
-# Sort data by date and time
-cleaned_subway_delay_data = cleaned_subway_delay_data.sort_values(by=["date", "time"], ascending=[True, True])
-
-# Save cleaned subway data
-cleaned_subway_delay_data.to_csv("outputs/data/cleaned_subway_delay_statistics.csv", index=False)
-
-#### Data Validation ####
-
-valid_incidents = {"Equipment/Mechanical", "Miscellaneous", "Operator", "Security/Safety"}
-
-# Test that the incident types are limited to the set
-assert set(cleaned_subway_delay_data["incident"].unique()) == valid_incidents
-assert set(cleaned_bus_delay_data["incident"].dropna().unique()) <= valid_incidents
-
-# Test that there are only 7 unique days
-assert cleaned_subway_delay_data["day"].nunique() == 7
-assert cleaned_bus_delay_data["day"].nunique() == 7
-
-# Test that delay times are positive
-assert cleaned_subway_delay_data["min_delay"].min() >= 0
-assert cleaned_bus_delay_data["min_delay"].min() >= 0
-
-# Verify datatypes (approximate checks)
-assert cleaned_subway_delay_data["day"].dtype == "object"
-assert cleaned_subway_delay_data["incident"].dtype == "object"
-assert pd.api.types.is_numeric_dtype(cleaned_subway_delay_data["min_delay"])
-assert pd.api.types.is_numeric_dtype(cleaned_subway_delay_data["min_gap"])
-
-assert cleaned_bus_delay_data["day"].dtype == "object"
-assert cleaned_bus_delay_data["incident"].dtype == "object"
-assert pd.api.types.is_numeric_dtype(cleaned_bus_delay_data["min_delay"])
-assert pd.api.types.is_numeric_dtype(cleaned_bus_delay_data["min_gap"])
+subway_fingerprint = fingerprint(
+    inputs=[parquet_path(SUBWAY_DELAYS), parquet_path(SUBWAY_CODES)],
+    modules=code,
+    params={
+        "subway_incident_rules": SUBWAY_INCIDENT_RULES,
+        "line_map": LINE_MAP,
+        "line_patterns": LINE_PATTERNS,
+        "chunk_size": CHUNK_SIZE
+    }
+)
+subway_outputs = [
+    parquet_path(CLEANED_SUBWAY_DELAYS),
+    csv_path(CLEANED_SUBWAY_DELAYS),
+    columns_path(CLEANED_SUBWAY_DELAYS) / "schema.json",
+    parquet_path(CLEANED_SUBWAY_CODES),
+    csv_path(CLEANED_SUBWAY_CODES)
+]
+
+if cache.is_fresh("03-parse_codes/subway", subway_fingerprint, subway_outputs):
+    print("Subway data unchanged since the last run, skipping")
+else:
+    # Read in subway codes and section them into incident groups
+    subway_codes = read_table(SUBWAY_CODES)
+    cleaned_subway_codes = classify_subway_codes(subway_codes)
+
+    # Save cleaned codes
+    write_table(cleaned_subway_codes, CLEANED_SUBWAY_CODES, export_csv=True)
+
+    # Read in subway data
+    subway_delay_data = read_table_chunks(SUBWAY_DELAYS)
+
+    # Classify the delays with a known code (warning about the others, which
+    # are dropped, and about lines that can't be mapped), clean up line data
+    # and sort by date and time (within each chunk)
+    subway_delay_data = validate_chunks(
+        subway_delay_data,
+        ungrouped_subway_constraints(cleaned_subway_codes),
+        "ungrouped subway delays"
+    )
+    cleaned_subway_delay_data = validate_chunks(
+        (group_subway_incidents(chunk, cleaned_subway_codes) for chunk in subway_delay_data),
+        grouped_constraints("subway", all_incidents=True),
+        "grouped subway delays"
+    )
+
+    # Save cleaned subway data
+    consume(write_chunks(cleaned_subway_delay_data, CLEANED_SUBWAY_DELAYS, export_csv=True))
+    publish_table([parquet_path(CLEANED_SUBWAY_DELAYS)], CLEANED_SUBWAY_DELAYS)
+    cache.record("03-parse_codes/subway", subway_fingerprint)
+
+    del subway_codes, cleaned_subway_codes, subway_delay_data, cleaned_subway_delay_data
 
 # Clean up workspace
 del (
-    bus_delay_data, 
-    cleaned_bus_delay_data, 
-    subway_codes, 
-    cleaned_subway_codes, 
-    subway_delay_data, 
-    cleaned_subway_delay_data
+    cache,
+    code,
+    bus_fingerprint,
+    bus_outputs,
+    subway_fingerprint,
+    subway_outputs
 )
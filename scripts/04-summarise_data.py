@@ -7,110 +7,116 @@
 # Prerequisites: 01-download_data, 02-clean_data, 03-parse_codes
 
 #### Workspace setup ####
-import pandas as pd
-
-# Read in bus data
-bus_delay_data = pd.read_csv("outputs/data/cleaned_bus_delay_statistics.csv")
-
-# Ensure date is just the calendar date (not datetime with time)
-bus_delay_data["date"] = pd.to_datetime(bus_delay_data["date"]).dt.date
-
-
-avg_num_bus_delays_by_day = (
-    bus_delay_data
-    .groupby(["date", "day"], observed=False)  # observed=False ensures all day levels are preserved
-    .size()
-    .groupby(level="day", observed=False)
-    .mean()
-    .reset_index(name="mean_num_delays")
-)
-
-# Summarize into total delay time and number of delays per date (Jan 1st, 2nd, ...)
-total_bus_delay_time_by_date = (
-    bus_delay_data
-    .groupby(["date", "day"])
-    .agg(total_delay_time=("min_delay", "sum"), n=("min_delay", "count"))
-    .reset_index()
+import sys
+from pathlib import Path
+
+# Make the shared ttc_analysis package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ttc_analysis import cube, heavy_hitters, schema, store, stream, summarise
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.cube import BUS_CUBE_COLUMNS, SUBWAY_CUBE_COLUMNS, build_cube
+from ttc_analysis.paths import (
+    BUS_CUBE,
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_DELAYS,
+    SUBWAY_CUBE,
+    SUMMARY_DIR
 )
-total_bus_delay_time_by_date["mean_delay_time"] = total_bus_delay_time_by_date["total_delay_time"] / total_bus_delay_time_by_date["n"]
-
-# Summarize into the total number of delays per incident type (e.g. Equipment/Mechanical)
-total_num_bus_delays_by_incident = (
-    bus_delay_data
-    .groupby("incident")
-    .size()
-    .reset_index(name="n")
-)
-
-# Read in subway data
-subway_delay_data = pd.read_csv("outputs/data/cleaned_subway_delay_statistics.csv")
-
-# Ensure date is just the calendar date (not datetime with time)
-subway_delay_data["date"] = pd.to_datetime(subway_delay_data["date"]).dt.date
-
-# Summarize into average number of delays per day of the week (Mon, Tues, ...)
-delays_per_day_subway = (
-    subway_delay_data
-    .groupby(["date", "day"])
-    .size()
-    .reset_index(name="n")
-)
-
-avg_num_subway_delays_by_day = (
-    delays_per_day_subway
-    .groupby("day")
-    .agg(mean_num_delays=("n", "mean"))
-    .reset_index()
-)
-
-# Summarize into total delay time and number of delays per date (Jan 1st, 2nd, ...)
-total_subway_delay_time_by_date = (
-    subway_delay_data
-    .groupby(["date", "day"])
-    .agg(total_delay_time=("min_delay", "sum"), n=("min_delay", "count"))
-    .reset_index()
-)
-total_subway_delay_time_by_date["mean_delay_time"] = total_subway_delay_time_by_date["total_delay_time"] / total_subway_delay_time_by_date["n"]
-
-# Summarize into the total number of delays per incident type (e.g. Equipment/Mechanical)
-total_num_subway_delays_by_incident = (
-    subway_delay_data
-    .groupby("incident")
-    .size()
-    .reset_index(name="n")
-)
-
-# Summarize into the total number of delays per line (e.g. BY (Bloor-Yonge))
-total_num_subway_delays_by_line = (
-    subway_delay_data
-    .groupby("line")
-    .size()
-    .reset_index(name="n")
-)
-
-# Save all the data
-
-avg_num_bus_delays_by_day.to_csv("outputs/data/summaries/avg_num_bus_delays_by_day.csv", index=False)
-avg_num_subway_delays_by_day.to_csv("outputs/data/summaries/avg_num_subway_delays_by_day.csv", index=False)
-
-total_num_bus_delays_by_incident.to_csv("outputs/data/summaries/total_num_bus_delays_by_incident.csv", index=False)
-total_num_subway_delays_by_incident.to_csv("outputs/data/summaries/total_num_subway_delays_by_incident.csv", index=False)
-
-total_bus_delay_time_by_date.to_csv("outputs/data/summaries/total_bus_delay_time_by_date.csv", index=False)
-total_subway_delay_time_by_date.to_csv("outputs/data/summaries/total_subway_delay_time_by_date.csv", index=False)
-
-total_num_subway_delays_by_line.to_csv("outputs/data/summaries/total_num_subway_delays_by_line.csv", index=False)
+from ttc_analysis.store import parquet_path, write_table
+from ttc_analysis.stream import read_table_chunks, summarise_chunks
+from ttc_analysis.summarise import BUS_COLUMNS, SUBWAY_COLUMNS, save_summaries
+
+# Each dataset below is skipped if its cleaned table and the summary code
+# are unchanged since the last run (see ttc_analysis/cache.py). The cleaned
+# tables are read in chunks of CHUNK_SIZE rows if the TTC_CHUNK_SIZE
+# environment variable is set, and whole otherwise (see ttc_analysis/stream.py);
+# the summaries don't depend on the chunk size.
+cache = BuildCache()
+code = [cube, heavy_hitters, schema, store, stream, summarise]
+
+### Bus data ###
+bus_fingerprint = fingerprint(inputs=[parquet_path(CLEANED_BUS_DELAYS)], modules=code)
+bus_outputs = [
+    SUMMARY_DIR / "avg_num_bus_delays_by_day.csv",
+    SUMMARY_DIR / "total_bus_delay_time_by_date.csv",
+    SUMMARY_DIR / "total_num_bus_delays_by_incident.csv",
+    SUMMARY_DIR / "bus_delays_by_hour.csv",
+    SUMMARY_DIR / "bus_peak_periods.csv",
+    SUMMARY_DIR / "bus_delay_quantiles_by_date.csv",
+    SUMMARY_DIR / "bus_delay_quantiles_by_day.csv",
+    SUMMARY_DIR / "bus_delay_quantiles_by_incident.csv",
+    parquet_path(BUS_CUBE)
+]
+
+if cache.is_fresh("04-summarise_data/bus", bus_fingerprint, bus_outputs):
+    print("Bus data unchanged since the last run, skipping")
+else:
+    # Read in bus data; only the columns used by the summaries, already typed
+    # (a single datetime timestamp, categorical day and incident)
+    bus_delay_data = read_table_chunks(CLEANED_BUS_DELAYS, columns=BUS_COLUMNS)
+
+    # Average number of delays per day of the week, total delay time and number
+    # of delays per date, number of delays per incident type, and delays per
+    # hour of the day, day of the week and incident type with the peak period
+    # of each day
+    bus_summaries = summarise_chunks(bus_delay_data, "bus")
+
+    # Save the summaries (outputs/data/summaries/<name>.csv)
+    save_summaries(bus_summaries)
+
+    # Rollup cube over date, hour, day, incident and mode, from which other
+    # summaries can be derived without rereading the rows (see
+    # ttc_analysis/cube.py)
+    bus_cube = build_cube(read_table_chunks(CLEANED_BUS_DELAYS, columns=BUS_CUBE_COLUMNS), "bus")
+    write_table(bus_cube, BUS_CUBE)
+    cache.record("04-summarise_data/bus", bus_fingerprint)
+
+    del bus_delay_data, bus_summaries, bus_cube
+
+### Subway data ###
+subway_fingerprint = fingerprint(inputs=[parquet_path(CLEANED_SUBWAY_DELAYS)], modules=code)
+subway_outputs = [
+    SUMMARY_DIR / "avg_num_subway_delays_by_day.csv",
+    SUMMARY_DIR / "total_subway_delay_time_by_date.csv",
+    SUMMARY_DIR / "total_num_subway_delays_by_incident.csv",
+    SUMMARY_DIR / "total_num_subway_delays_by_line.csv",
+    SUMMARY_DIR / "subway_delays_by_hour.csv",
+    SUMMARY_DIR / "subway_peak_periods.csv",
+    SUMMARY_DIR / "subway_delay_quantiles_by_date.csv",
+    SUMMARY_DIR / "subway_delay_quantiles_by_day.csv",
+    SUMMARY_DIR / "subway_delay_quantiles_by_incident.csv",
+    SUMMARY_DIR / "subway_delay_quantiles_by_line.csv",
+    SUMMARY_DIR / "subway_top_stations.csv",
+    SUMMARY_DIR / "subway_top_vehicles.csv",
+    parquet_path(SUBWAY_CUBE)
+]
+
+if cache.is_fresh("04-summarise_data/subway", subway_fingerprint, subway_outputs):
+    print("Subway data unchanged since the last run, skipping")
+else:
+    # Read in subway data
+    subway_delay_data = read_table_chunks(CLEANED_SUBWAY_DELAYS, columns=SUBWAY_COLUMNS)
+
+    # Same summaries as for buses, plus the number of delays per line (the
+    # delays per hour are also split by line)
+    subway_summaries = summarise_chunks(subway_delay_data, "subway")
+
+    save_summaries(subway_summaries)
+
+    # Rollup cube, which for the subway also has the line
+    subway_cube = build_cube(read_table_chunks(CLEANED_SUBWAY_DELAYS, columns=SUBWAY_CUBE_COLUMNS), "subway")
+    write_table(subway_cube, SUBWAY_CUBE)
+    cache.record("04-summarise_data/subway", subway_fingerprint)
+
+    del subway_delay_data, subway_summaries, subway_cube
 
 # Clean up workspace
 del (
-    avg_num_bus_delays_by_day,
-    avg_num_subway_delays_by_day,
-    delays_per_day_subway,
-    bus_delay_data,
-    subway_delay_data,
-    total_bus_delay_time_by_date,
-    total_num_bus_delays_by_incident,
-    total_num_subway_delays_by_incident,
-    total_num_subway_delays_by_line,
-    total_subway_delay_time_by_date
+    cache,
+    code,
+    bus_fingerprint,
+    bus_outputs,
+    subway_fingerprint,
+    subway_outputs
 )
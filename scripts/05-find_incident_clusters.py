@@ -0,0 +1,58 @@
+#### Preamble ####
+# Purpose: Group subway delays into clusters of knock-on delays
+# Author: Daniel Hartono
+# Date: 23 January 2024
+# Contact: daniel.hartono@mail.utoronto.ca
+# License: MIT
+# Prerequisites: 01-download_data, 02-clean_data, 03-parse_codes
+
+#### Workspace setup ####
+import sys
+from pathlib import Path
+
+# Make the shared ttc_analysis package importable when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ttc_analysis import cascade, schema, store
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.cascade import WINDOW, find_clusters, summarise_root_incidents
+from ttc_analysis.paths import CLEANED_SUBWAY_DELAYS, SUBWAY_DELAY_CLUSTERS, SUMMARY_DIR
+from ttc_analysis.store import csv_path, parquet_path, write_table
+from ttc_analysis.summarise import save_summaries
+
+# Skipped if the cleaned subway table, the clustering code and the window
+# (TTC_CLUSTER_WINDOW minutes, see ttc_analysis/cascade.py) are unchanged
+# since the last run (see ttc_analysis/cache.py)
+cache = BuildCache()
+code = [cascade, schema, store]
+
+### Subway data ###
+cluster_fingerprint = fingerprint(
+    inputs=[parquet_path(CLEANED_SUBWAY_DELAYS)],
+    modules=code,
+    params={"window": WINDOW}
+)
+cluster_outputs = [
+    parquet_path(SUBWAY_DELAY_CLUSTERS),
+    csv_path(SUBWAY_DELAY_CLUSTERS),
+    SUMMARY_DIR / "subway_cascades_by_root_incident.csv"
+]
+
+if cache.is_fresh("05-find_incident_clusters/subway", cluster_fingerprint, cluster_outputs):
+    print("Subway data unchanged since the last run, skipping")
+else:
+    # Clusters of delays on the same line following each other within the
+    # window after the gaps in service before them, each line swept in its
+    # own process
+    subway_clusters = find_clusters(CLEANED_SUBWAY_DELAYS, WINDOW)
+    write_table(subway_clusters, SUBWAY_DELAY_CLUSTERS, export_csv=True)
+
+    # Number, size, span and delay time of the clusters per root incident
+    # type
+    save_summaries({"subway_cascades_by_root_incident": summarise_root_incidents(subway_clusters)})
+    cache.record("05-find_incident_clusters/subway", cluster_fingerprint)
+
+    del subway_clusters
+
+# Clean up workspace
+del cache, code, cluster_fingerprint, cluster_outputs
@@ -0,0 +1,24 @@
+"""Runs sharing the build cache keep each other's fingerprints."""
+
+import json
+
+from ttc_analysis.cache import BuildCache
+
+
+def test_concurrent_runs_keep_each_others_entries(tmp_path):
+    path = tmp_path / ".build_cache.json"
+    BuildCache(path).record("02-clean_data/bus", "a")
+
+    # Both read the cache before either records anything
+    first = BuildCache(path)
+    second = BuildCache(path)
+    first.record("03-parse_codes/bus", "b")
+    second.record("pipeline/subway", "c")
+    second.record("02-clean_data/bus", "d")
+
+    assert json.loads(path.read_text()) == {
+        "02-clean_data/bus": "d",
+        "03-parse_codes/bus": "b",
+        "pipeline/subway": "c"
+    }
+    assert not list(tmp_path.glob("*.tmp"))
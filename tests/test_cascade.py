@@ -0,0 +1,76 @@
+"""Subway delays are clustered by the gaps in service before them."""
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.cascade import cluster_delays, summarise_clusters, update_clusters
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.store import write_partition_table, write_table
+
+# Delays of two lines, with the cluster each should join with a 15-minute
+# window
+DELAYS = [
+    # time, line, min_delay, min_gap, station, cluster
+    ("00:00", "YU", 4, 10, "UNION STATION", 0),
+    ("00:25", "YU", 3, 5, "KING STATION", 0),  # 15 minutes after 00:10
+    ("00:46", "YU", 2, 60, None, 1),  # 16 minutes after 00:30
+    ("01:00", "YU", 0, 0, "UNION STATION", None),  # no delay, not clustered
+    ("01:30", "YU", 5, 5, "UNION STATION", 1),  # within the gap of 00:46, to 01:46
+    ("02:01", "YU", 1, 5, "FINCH STATION", 1),  # 15 minutes after 01:46
+    ("00:10", "BD", 6, 5, "KIPLING STATION", 0),  # other lines don't join
+    ("00:31", "BD", 2, 5, "KIPLING STATION", 1)
+]
+
+
+def delay_table(delays, date="2023-01-02"):
+    """Return the cleaned table of ``delays`` on ``date``."""
+    return apply_schema(pd.DataFrame({
+        "date": date,
+        "time": [delay[0] for delay in delays],
+        "incident": "Operator",
+        "min_delay": [delay[2] for delay in delays],
+        "min_gap": [delay[3] for delay in delays],
+        "line": [delay[1] for delay in delays],
+        "station": [delay[4] for delay in delays]
+    }))
+
+
+def test_delays_join_clusters_within_the_window():
+    clustered = cluster_delays(delay_table(DELAYS), window=15)
+
+    expected = sorted((line, time, cluster) for time, line, _, _, _, cluster in DELAYS if cluster is not None)
+    assert list(zip(clustered["line"], clustered["timestamp"].dt.strftime("%H:%M"), clustered["cluster"])) == expected
+
+    clusters = summarise_clusters(clustered).set_index(["line", "cluster"])
+    assert clusters.loc[("YU", 0), "span_minutes"] == 30
+    assert clusters.loc[("YU", 1), "n"] == 3
+    assert clusters.loc[("YU", 1), "total_delay_time"] == 8
+    assert clusters.loc[("YU", 1), "span_minutes"] == 80
+    # The root is the first delay, even without a station
+    assert pd.isna(clusters.loc[("YU", 1), "root_station"])
+    assert clusters.loc[("YU", 0), "root_station"] == "UNION STATION"
+
+
+def test_update_clusters_matches_full_recompute(tmp_path):
+    rng = np.random.default_rng(0)
+    partitions = tmp_path / "partitions"
+    path = tmp_path / "clusters"
+
+    def random_day(date, lines):
+        times = np.sort(rng.integers(0, 24 * 60, 200))
+        return delay_table([
+            (f"{time // 60:02d}:{time % 60:02d}", rng.choice(lines), int(rng.integers(0, 10)), int(rng.integers(0, 30)), "UNION STATION", None)
+            for time in times
+        ], date)
+
+    january = random_day("2023-01-31", ["YU", "BD"])
+    write_partition_table(january, partitions, pd.Period("2023-01", freq="M"), "part-0")
+    write_table(update_clusters(partitions, path), path)
+
+    # A new month with delays of YU only, the first just after January ends
+    february = random_day("2023-02-01", ["YU"])
+    write_partition_table(february, partitions, pd.Period("2023-02", freq="M"), "part-0")
+
+    updated = update_clusters(partitions, path, lines=["YU"])
+    recomputed = update_clusters(partitions, path)
+    pd.testing.assert_frame_equal(updated, recomputed, check_categorical=False)
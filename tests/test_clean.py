@@ -0,0 +1,32 @@
+"""Cleaning drops and reports delays it can't store."""
+
+import io
+
+import pandas as pd
+
+from ttc_analysis.clean import clean_bus_data, clean_subway_data
+
+RAW_BUS_DELAYS = """Date,Route,Time,Day,Location,Incident,Min Delay,Min Gap,Direction,Vehicle
+2023-01-01,36,02:30,Sunday,FINCH STATION,Diversion,81,111,N,8000
+2023-01-01,36,02:34,Sunday,FINCH STATION,Security,,44,N,8000
+2023-01-01,36,02:40,Sunday,FINCH STATION,Security,10,,N,8000
+"""
+
+RAW_SUBWAY_DELAYS = """Date,Time,Day,Station,Code,Min Delay,Min Gap,Bound,Line,Vehicle
+2023-01-01,02:22,Sunday,MUSEUM STATION,MUPAA,3,9,S,YU,5931
+2023-01-01,02:30,Sunday,KIPLING STATION,MUIS,,0,E,BD,5341
+2023-01-01,02:35,Sunday,KIPLING STATION,MUIS,0,,E,BD,
+"""
+
+
+def test_delays_without_a_length_are_dropped_and_reported(capsys):
+    bus = clean_bus_data(pd.read_csv(io.StringIO(RAW_BUS_DELAYS)))
+    subway = clean_subway_data(pd.read_csv(io.StringIO(RAW_SUBWAY_DELAYS)))
+
+    assert bus["min_delay"].tolist() == [81]
+    assert subway["min_delay"].tolist() == [3]
+    assert subway["min_gap"].dtype == "int16"
+
+    report = capsys.readouterr().err
+    assert "warning: min_delay required, 1 violation(s)" in report
+    assert "warning: min_gap required, 1 violation(s)" in report
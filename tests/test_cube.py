@@ -0,0 +1,81 @@
+"""Rollups of the cube match grouping the cleaned table directly."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ttc_analysis.cube import build_cube, compute_cube, cube_partitions, rollup, write_partition_cube
+from ttc_analysis.schema import apply_schema, calendar_dates, hours_of_day
+from ttc_analysis.store import write_partition_table
+
+# Dimensions of each rollup checked
+ROLLUPS = [[], ["day"], ["line", "hour"], ["date", "incident"]]
+
+
+def random_delays(rows=3000, seed=0):
+    """Return ``rows`` random subway delays over three months."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 90 * 24 * 60, rows), unit="min")
+    return apply_schema(pd.DataFrame({
+        "date": timestamps.strftime("%Y-%m-%d"),
+        "time": timestamps.strftime("%H:%M"),
+        "day": timestamps.day_name(),
+        "incident": rng.choice(["Operator", "Security/Safety", "Miscellaneous"], rows),
+        "min_delay": rng.geometric(0.2, rows) - 1,
+        "min_gap": rng.geometric(0.1, rows),
+        "line": rng.choice(["Yonge-University", "Bloor-Danforth", "Sheppard"], rows)
+    }))
+
+
+def grouped(delay_data, by):
+    """Return the rollup of ``by`` computed from the rows."""
+    delay_data = delay_data.assign(
+        date=calendar_dates(delay_data["timestamp"]),
+        hour=hours_of_day(delay_data["timestamp"])
+    )
+    if not by:
+        delay_data = delay_data.assign(everything=0)
+    groups = delay_data.groupby(by or ["everything"], observed=True)
+
+    expected = groups.size().rename("n").to_frame()
+    for column in ("min_delay", "min_gap"):
+        values = groups[column]
+        expected[f"total_{column}"] = values.sum().astype(np.int64)
+        expected[f"mean_{column}"] = values.mean()
+        expected[f"std_{column}"] = values.std()
+    return expected.reset_index(drop=not by)
+
+
+def assert_rollups_match(cube, delay_data):
+    for by in ROLLUPS:
+        rolled = rollup(cube, by).sort_values(by, ignore_index=True) if by else rollup(cube, by)
+        pd.testing.assert_frame_equal(
+            rolled.astype({"n": np.int64}),
+            grouped(delay_data, by),
+            check_categorical=False,
+            check_index_type=False,
+            check_dtype=False
+        )
+
+
+def test_rollup_matches_groupby():
+    delay_data = random_delays()
+    assert_rollups_match(compute_cube(delay_data, "subway"), delay_data)
+
+
+@pytest.mark.parametrize("stored_cubes", [False, True])
+def test_cube_of_partitions_matches_groupby(tmp_path, stored_cubes):
+    delay_data = random_delays()
+    months = delay_data["timestamp"].dt.to_period("M")
+    for month, month_data in delay_data.groupby(months):
+        write_partition_table(month_data, tmp_path, month, "part-0")
+        if stored_cubes:
+            write_partition_cube(month_data, tmp_path, month, "subway")
+
+    assert_rollups_match(cube_partitions(tmp_path, "subway", workers=1), delay_data)
+
+
+def test_cube_of_chunks_matches_groupby():
+    delay_data = random_delays()
+    chunks = (delay_data.iloc[piece] for piece in np.array_split(np.arange(len(delay_data)), 7))
+    assert_rollups_match(build_cube(chunks, "subway"), delay_data)
@@ -0,0 +1,157 @@
+"""Downloads are retried when the connection drops, and skipped when the
+workbook hasn't changed."""
+
+import functools
+import http.server
+import threading
+
+import openpyxl
+import pandas as pd
+import pytest
+import requests
+
+from ttc_analysis import download
+from ttc_analysis.clean import BUS_DELAY_COLUMNS
+from ttc_analysis.download import fetch
+
+URL = "https://example.com/delays.xlsx"
+
+# Validators of the served workbook
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 02 Oct 2023 12:00:00 GMT"
+
+
+class Response:
+    """A streamed response whose connection drops after the first chunk
+    if ``dropped``."""
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, dropped):
+        self.dropped = dropped
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield b"PK"
+        if self.dropped:
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+        yield b"workbook"
+
+
+class Session:
+    """Drops the connection of the first download."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        return Response(dropped=self.requests == 1)
+
+
+def test_dropped_download_is_retried(tmp_path):
+    session = Session()
+    path, downloaded = fetch(URL, tmp_path, session, backoff=0)
+
+    assert downloaded
+    assert session.requests == 2
+    assert path.read_bytes() == b"PKworkbook"
+
+
+def workbook_bytes(tmp_path):
+    """Return the bytes of a small bus delay workbook."""
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["Date", "Time", "Day", "Incident", "Min Delay", "Min Gap"])
+    workbook.active.append(["2023-01-01", "02:30", "Sunday", "Diversion", 81, 111])
+    workbook.save(tmp_path / "served.xlsx")
+    return (tmp_path / "served.xlsx").read_bytes()
+
+
+@pytest.fixture
+def server(tmp_path):
+    """A local HTTP server of a workbook, answering 304 to requests whose
+    validators match it; yields its URL and the headers of each request."""
+    body = workbook_bytes(tmp_path)
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            received.append(dict(self.headers))
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler) as httpd:
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{httpd.server_port}/delays.xlsx", received
+        httpd.shutdown()
+
+
+def counted(function, calls):
+    """Wrap ``function`` to append its arguments to ``calls``."""
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+@pytest.mark.parametrize("columns", [None, {"bus_delays": BUS_DELAY_COLUMNS}])
+def test_unchanged_workbook_is_not_downloaded_or_parsed_again(server, tmp_path, monkeypatch, columns):
+    url, received = server
+    parses = []
+    monkeypatch.setattr(download, "workbook_to_parquet", counted(download.workbook_to_parquet, parses))
+    monkeypatch.setattr(download.pd, "read_excel", counted(pd.read_excel, parses))
+
+    first = download.download_raw_data({"bus_delays": url}, tmp_path / "cache", columns=columns)
+    second = download.download_raw_data({"bus_delays": url}, tmp_path / "cache", columns=columns)
+
+    assert received[0].get("If-None-Match") is None
+    assert received[1]["If-None-Match"] == ETAG
+    assert received[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert len(parses) == 1
+    pd.testing.assert_frame_equal(first["bus_delays"], second["bus_delays"])
+
+
+class QuietFileHandler(http.server.SimpleHTTPRequestHandler):
+    """http.server's file server, without the request log."""
+
+    def log_message(self, *args):
+        pass
+
+
+def test_file_server_answers_not_modified(tmp_path):
+    """http.server's file server sends only Last-Modified."""
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "delays.xlsx").write_bytes(workbook_bytes(tmp_path))
+    handler = functools.partial(QuietFileHandler, directory=served)
+
+    with http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler) as httpd:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{httpd.server_port}/delays.xlsx"
+        _, first = fetch(url, tmp_path / "cache")
+        _, second = fetch(url, tmp_path / "cache")
+        httpd.shutdown()
+
+    assert first
+    assert not second
@@ -0,0 +1,59 @@
+"""Merged heavy-hitters sketches are exact when the keys fit, and keep
+the heavy keys within the error bound when they don't."""
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.heavy_hitters import heavy_hitters, merge_heavy_hitters, top_k
+
+
+def sketch_in_chunks(keys, weights, capacity, chunks=5):
+    """Sketch each of ``chunks`` pieces of the keys and merge the sketches."""
+    pieces = np.array_split(np.arange(len(keys)), chunks)
+    return merge_heavy_hitters(
+        (heavy_hitters(keys.iloc[piece], weights.iloc[piece], capacity) for piece in pieces),
+        capacity
+    )
+
+
+def estimates(sketch):
+    """Return the weights of the keys of ``sketch`` and its error."""
+    missing = sketch["station"].isna()
+    return sketch[~missing].set_index("station")["weight"], sketch.loc[missing, "weight"].sum()
+
+
+def random_stations(distinct, rows=5000, seed=0):
+    """Return random station keys with skewed frequencies, and weights."""
+    rng = np.random.default_rng(seed)
+    keys = pd.Series(rng.zipf(1.5, rows) % distinct, name="station").map("STATION {}".format)
+    return keys, pd.Series(rng.integers(1, 30, rows))
+
+
+def test_exact_when_the_keys_fit():
+    keys, weights = random_stations(distinct=20)
+    weighted, error = estimates(sketch_in_chunks(keys, weights, capacity=20))
+
+    assert error == 0
+    pd.testing.assert_series_equal(
+        weighted.sort_index(),
+        weights.groupby(keys).sum().rename("weight").sort_index(),
+        check_names=False
+    )
+
+
+def test_heavy_keys_kept_within_the_error_when_the_keys_dont_fit():
+    capacity = 5
+    keys, weights = random_stations(distinct=200)
+    exact = weights.groupby(keys).sum()
+    sketch = sketch_in_chunks(keys, weights, capacity)
+    weighted, error = estimates(sketch)
+
+    assert len(weighted) <= capacity
+    assert 0 < error <= exact.sum() / (capacity + 1)
+    assert (weighted <= exact[weighted.index]).all()
+    assert (weighted >= exact[weighted.index] - error).all()
+    assert set(exact[exact > exact.sum() / (capacity + 1)].index) <= set(weighted.index)
+
+    top = top_k(sketch, 3)
+    assert top["station"].iloc[0] == exact.idxmax()
+    assert (top["max_error"] == error).all()
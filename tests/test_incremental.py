@@ -0,0 +1,70 @@
+"""Ingesting the delay data in steps gives the same outputs as a full run."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from ttc_analysis.cube import MODE_CUBES
+from ttc_analysis.incremental import ingest
+from ttc_analysis.paths import (
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_DELAYS,
+    RAW_BUS_DELAYS,
+    RAW_SUBWAY_DELAYS,
+    SUBWAY_DELAY_CLUSTERS,
+    SUMMARY_DIR
+)
+from ttc_analysis.pipeline import run
+from ttc_analysis.simulate import simulate_raw_data
+from ttc_analysis.store import csv_path, read_table
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def simulated(tmp_path, monkeypatch):
+    """A copy of the data directories with a small simulated year of raw
+    delays, as the working directory."""
+    monkeypatch.chdir(REPO_DIR)
+    simulate_raw_data(tmp_path, scale=0.05, workers=1)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def outputs():
+    """Return the contents of the CSV outputs and the typed cubes."""
+    paths = sorted(SUMMARY_DIR.glob("*.csv")) + [
+        csv_path(CLEANED_BUS_DELAYS),
+        csv_path(CLEANED_SUBWAY_DELAYS),
+        csv_path(SUBWAY_DELAY_CLUSTERS)
+    ]
+    files = {str(path): path.read_text() for path in paths}
+    cubes = {mode: read_table(path) for mode, path in MODE_CUBES.items()}
+    return files, cubes
+
+
+def test_ingest_in_steps_matches_full_run(simulated):
+    full = {path: pd.read_csv(path) for path in (RAW_BUS_DELAYS, RAW_SUBWAY_DELAYS)}
+
+    # First the rows of the first few days (not every day of the week), then
+    # those published up to the middle of June, then the whole year
+    for published in ("2023-01-03", "2023-06-14"):
+        for path, raw in full.items():
+            raw[raw["Date"] <= published].to_csv(path, index=False)
+        ingest(download=False, workers=1)
+    for path, raw in full.items():
+        raw.to_csv(path, index=False)
+    added = ingest(download=False, workers=1)
+    assert added["bus"][0] == pd.Period("2023-06", freq="M")
+
+    ingested_files, ingested_cubes = outputs()
+
+    run(download=False, force=True, workers=1)
+    run_files, run_cubes = outputs()
+
+    assert ingested_files.keys() == run_files.keys()
+    for path, contents in run_files.items():
+        assert ingested_files[path] == contents, path
+    for mode, cube in run_cubes.items():
+        pd.testing.assert_frame_equal(ingested_cubes[mode], cube)
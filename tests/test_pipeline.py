@@ -0,0 +1,22 @@
+"""The pipeline's fingerprint covers the code it runs."""
+
+import ast
+import inspect
+
+from ttc_analysis import pipeline
+
+# Modules whose changes can't change the pipeline's outputs
+UNFINGERPRINTED = {"cache", "parallel", "paths"}
+
+
+def test_fingerprint_covers_every_imported_module():
+    imported = set()
+    for node in ast.walk(ast.parse(inspect.getsource(pipeline))):
+        if isinstance(node, ast.ImportFrom) and node.module == "ttc_analysis":
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module.startswith("ttc_analysis."):
+            imported.add(node.module.split(".")[1])
+
+    fingerprinted = {module.__name__.split(".")[-1] for module in pipeline.PIPELINE_MODULES}
+    assert "pipeline" in fingerprinted
+    assert imported - UNFINGERPRINTED <= fingerprinted
@@ -0,0 +1,70 @@
+"""Indexed queries return the same delays as filtering the table."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ttc_analysis import query
+from ttc_analysis.paths import CLEANED_SUBWAY_DELAYS
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.store import write_table
+
+# Filters of each query: start, end and the values of the indexed columns
+QUERIES = [
+    {},
+    {"start": "2023-01-03 05:17", "end": "2023-01-09"},
+    {"start": "2023-01-02", "end": "2023-01-02 00:01"},
+    {"start": "2023-02-01"},
+    {"line": "Bloor-Danforth", "day": ["Friday", "Saturday"]},
+    {"start": "2023-01-05", "end": "2023-01-12 13:00", "line": "Yonge-University", "incident": "Security/Safety"}
+]
+
+
+@pytest.fixture
+def delays(tmp_path, monkeypatch):
+    """A random cleaned subway table, unsorted, in a scratch working
+    directory, and its index split into small row groups."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(query, "ROW_GROUP_SIZE", 100)
+
+    rng = np.random.default_rng(0)
+    rows = 2000
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 14 * 24 * 60, rows), unit="min")
+    delay_data = apply_schema(pd.DataFrame({
+        "date": timestamps.strftime("%Y-%m-%d"),
+        "time": timestamps.strftime("%H:%M"),
+        "day": timestamps.day_name(),
+        "incident": rng.choice(["Operator", "Security/Safety", "Miscellaneous"], rows),
+        "min_delay": rng.integers(0, 30, rows),
+        "min_gap": rng.integers(0, 60, rows),
+        "line": rng.choice(["Yonge-University", "Bloor-Danforth"], rows)
+    }))
+    CLEANED_SUBWAY_DELAYS.parent.mkdir(parents=True)
+    write_table(delay_data, CLEANED_SUBWAY_DELAYS)
+    return delay_data
+
+
+def pandas_filter(delay_data, start=None, end=None, **filters):
+    """Return the delays matching the filters of a query, in timestamp
+    order."""
+    keep = pd.Series(True, index=delay_data.index)
+    if start is not None:
+        keep &= delay_data["timestamp"] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= delay_data["timestamp"] < pd.Timestamp(end)
+    for column, values in filters.items():
+        keep &= delay_data[column].isin([values] if isinstance(values, str) else values)
+    return delay_data[keep].sort_values("timestamp", kind="stable", ignore_index=True)
+
+
+@pytest.mark.parametrize("filters", QUERIES)
+def test_query_matches_pandas_filter(delays, filters):
+    index = query.load_index("subway")
+    expected = pandas_filter(delays, **filters)
+
+    result = index.query(**filters)
+    assert result["delays"] == len(expected)
+    assert result["total_delay"] == expected["min_delay"].sum()
+    assert result["total_gap"] == expected["min_gap"].sum()
+
+    pd.testing.assert_frame_equal(index.rows(**filters), expected, check_categorical=False)
@@ -0,0 +1,62 @@
+"""Published tables load back as they were written."""
+
+import mmap
+
+import pandas as pd
+
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.shared import load_table, publish_table
+from ttc_analysis.store import columns_path, parquet_path, write_table
+
+DELAYS = apply_schema(pd.DataFrame({
+    "date": ["2023-01-01", "2023-01-02"],
+    "time": ["02:30", "17:00"],
+    "day": ["Sunday", "Monday"],
+    "incident": ["Operator", "Security/Safety"],
+    "min_delay": [10, 30],
+    "min_gap": [20, 60]
+}))
+
+
+def publish(delay_data, path):
+    """Publish ``delay_data`` at ``path`` and load it back."""
+    write_table(delay_data, path)
+    publish_table([parquet_path(path)], path)
+    return load_table(path)
+
+
+def test_publish_round_trips(tmp_path):
+    path = tmp_path / "delays"
+
+    publish(DELAYS.iloc[:1], path)
+
+    # Left behind by a publish that was interrupted
+    previous = columns_path(path).with_name(columns_path(path).name + ".old")
+    previous.mkdir()
+    (previous / "schema.json").write_text("{}")
+
+    loaded = publish(DELAYS, path)
+    pd.testing.assert_frame_equal(loaded, DELAYS.astype({"incident": "category"}), check_categorical=False)
+
+
+def test_publish_empty_table(tmp_path):
+    loaded = publish(DELAYS.iloc[:0], tmp_path / "delays")
+    pd.testing.assert_frame_equal(loaded, DELAYS.iloc[:0], check_categorical=False)
+
+
+def is_mapped(values):
+    """Return whether ``values`` are a view of a memory-mapped file."""
+    while values is not None:
+        if isinstance(values, mmap.mmap):
+            return True
+        values = getattr(values, "base", None)
+    return False
+
+
+def test_every_column_is_memory_mapped(tmp_path):
+    loaded = publish(DELAYS, tmp_path / "delays")
+
+    for column in loaded:
+        values = loaded[column].array
+        values = values.codes if isinstance(values, pd.Categorical) else values.to_numpy()
+        assert is_mapped(values), column
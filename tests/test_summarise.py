@@ -0,0 +1,97 @@
+"""The summaries built from partial aggregates match the same summaries
+computed directly from the delays."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.stream import summarise_chunks
+from ttc_analysis.summarise import (
+    PEAK_HOURS,
+    QUANTILE_GROUPS,
+    QUANTILES,
+    compute_partials,
+    summarise_subway_data
+)
+
+DELAYS = apply_schema(pd.DataFrame({
+    "date": ["2023-01-01", "2023-01-01", "2023-01-02"],
+    "time": ["02:30", "02:45", "17:00"],
+    "day": ["Sunday", "Sunday", "Monday"],
+    "incident": ["Operator", None, None],
+    "min_delay": [10, 20, 30],
+    "min_gap": [20, 40, 60]
+}))
+
+
+def test_delays_without_an_incident_count_towards_the_hours():
+    by_hour = compute_partials(DELAYS, ["by_hour"])["by_hour"]
+
+    assert by_hour["n"].sum() == 3
+    assert by_hour["total_delay_time"].sum() == 60
+
+
+def random_delays(rows=3000, seed=0):
+    """Return ``rows`` random subway delays over two weeks."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 14 * 24 * 60, rows), unit="min")
+    return apply_schema(pd.DataFrame({
+        "date": timestamps.strftime("%Y-%m-%d"),
+        "time": timestamps.strftime("%H:%M"),
+        "day": timestamps.day_name(),
+        "incident": rng.choice(["Operator", "Security/Safety", "Miscellaneous"], rows),
+        "min_delay": rng.geometric(0.2, rows) - 1,
+        "min_gap": rng.geometric(0.1, rows),
+        "line": rng.choice(["Yonge-University", "Bloor-Danforth"], rows),
+        "station": rng.choice(["UNION STATION", "KIPLING STATION", "FINCH STATION"], rows),
+        "vehicle": rng.integers(0, 50, rows)
+    }))
+
+
+def brute_force_quantiles(delay_data, keys, value):
+    """Return the QUANTILES of ``value`` per ``keys``, sorting every group."""
+    grouped = delay_data.groupby(keys, observed=True)[value]
+    return pd.DataFrame({
+        f"{value}_p{quantile}": grouped.agg(lambda values: np.quantile(values, quantile / 100, method="inverted_cdf"))
+        for quantile in QUANTILES
+    })
+
+
+def brute_force_peaks(delay_data):
+    """Return the start hour, number of delays and total delay time of the
+    busiest PEAK_HOURS hours of each day of the week, trying every start."""
+    peaks = {}
+    for day, delays in delay_data.groupby("day", observed=True):
+        hours = delays["timestamp"].dt.hour
+        n = delays.groupby(hours).size().reindex(range(24), fill_value=0).to_numpy()
+        time = delays.groupby(hours)["min_delay"].sum().reindex(range(24), fill_value=0).to_numpy()
+        window = [[(start + offset) % 24 for offset in range(PEAK_HOURS)] for start in range(24)]
+        start = int(np.argmax([n[hours].sum() for hours in window]))
+        peaks[day] = (start, n[window[start]].sum(), time[window[start]].sum())
+    return peaks
+
+
+@pytest.mark.parametrize("chunks", [None, 7])
+def test_quantiles_and_peaks_match_brute_force(chunks):
+    delay_data = random_delays()
+    if chunks is None:
+        summaries = summarise_subway_data(delay_data)
+    else:
+        pieces = np.array_split(np.arange(len(delay_data)), chunks)
+        summaries = summarise_chunks((delay_data.iloc[piece] for piece in pieces), "subway")
+
+    direct = delay_data.assign(date=delay_data["timestamp"].dt.normalize())
+    for group, keys in QUANTILE_GROUPS.items():
+        quantiles = summaries[f"subway_delay_quantiles_by_{group}"].set_index(keys)
+        for value in ("min_delay", "min_gap"):
+            expected = brute_force_quantiles(direct, keys, value)
+            pd.testing.assert_frame_equal(
+                quantiles[expected.columns].astype(np.int64),
+                expected.astype(np.int64),
+                check_index_type=False
+            )
+
+    peaks = summaries["subway_peak_periods"].set_index("day")
+    for day, (start, n, time) in brute_force_peaks(delay_data).items():
+        assert (peaks.loc[day, "start_hour"], peaks.loc[day, "n"], peaks.loc[day, "total_delay_time"]) == (start, n, time)
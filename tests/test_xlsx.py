@@ -0,0 +1,38 @@
+"""Delays streamed out of a workbook match those read from its CSV copy."""
+
+import datetime
+import io
+
+import openpyxl
+import pandas as pd
+
+from ttc_analysis.clean import BUS_DELAY_COLUMNS, clean_bus_data
+from ttc_analysis.xlsx import workbook_to_parquet
+
+RAW_BUS_DELAYS = """Date,Route,Time,Day,Location,Incident,Min Delay,Min Gap,Direction,Vehicle
+2023-01-01,36,02:30,Sunday,FINCH STATION,Diversion,81,111,N,8000
+2023-01-02,36,23:59,Monday,FINCH STATION,Security,22,44,N,8000
+"""
+
+
+def test_workbook_and_csv_have_the_same_schema(tmp_path):
+    raw = pd.read_csv(io.StringIO(RAW_BUS_DELAYS))
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(list(raw.columns))
+    for row in raw.itertuples(index=False):
+        hours, minutes = map(int, row.Time.split(":"))
+        sheet.append([
+            datetime.datetime.fromisoformat(row.Date),
+            row.Route,
+            datetime.time(hours, minutes),
+            *row[3:]
+        ])
+    workbook.save(tmp_path / "delays.xlsx")
+    workbook_to_parquet(tmp_path / "delays.xlsx", tmp_path / "delays.parquet", BUS_DELAY_COLUMNS)
+
+    streamed = clean_bus_data(pd.read_parquet(tmp_path / "delays.parquet"))
+    from_csv = clean_bus_data(raw)
+
+    pd.testing.assert_frame_equal(streamed, from_csv)
@@ -0,0 +1,6 @@
+"""Shared helpers for the TTC delay analysis scripts.
+
+The numbered scripts under ``scripts/`` remain the entry points of the
+analysis; this package holds the pieces they have in common so that each
+script only describes its own step.
+"""
@@ -0,0 +1,217 @@
+"""Command line entry point, e.g. ``python -m ttc_analysis run``.
+
+Run from the repository root, like the numbered scripts.
+"""
+
+import argparse
+import sys
+
+import pandas as pd
+
+from ttc_analysis.benchmark import SCALES, STAGES, TOLERANCE, compare, load_results, run_benchmarks, save_results
+from ttc_analysis.cube import DIMENSIONS, MODE_CUBES, load_cube, rollup
+from ttc_analysis.figures import FIGURES, TABLES, build_figures
+from ttc_analysis.incremental import ingest
+from ttc_analysis.parallel import WORKERS
+from ttc_analysis.paths import BENCHMARK_RESULTS
+from ttc_analysis.pipeline import ARTIFACTS, DEFAULT_ARTIFACTS, run
+from ttc_analysis.query import MODE_TABLES, load_index
+from ttc_analysis.stream import CHUNK_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ttc_analysis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run",
+        help="download, clean, parse codes and summarise in one process"
+    )
+    run_parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="use the raw CSV files saved by a previous download"
+    )
+    run_parser.add_argument(
+        "--save",
+        nargs="*",
+        choices=ARTIFACTS,
+        default=list(DEFAULT_ARTIFACTS),
+        help="artifacts to write to disk (default: %(default)s)"
+    )
+    run_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rerun every branch even if its inputs haven't changed"
+    )
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of processes running the bus and subway branches (default: %(default)s)"
+    )
+
+    ingest_parser = commands.add_parser(
+        "ingest",
+        help="add newly published months to the partitioned store and summaries"
+    )
+    ingest_parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="use the raw CSV files saved by a previous download"
+    )
+    ingest_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="drop the partitioned store and ingest every month again"
+    )
+    ingest_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of processes storing and summarising months (default: %(default)s)"
+    )
+
+    query_parser = commands.add_parser(
+        "query",
+        help="total and mean delay of the cleaned delays matching a filter"
+    )
+    query_parser.add_argument("mode", choices=sorted(MODE_TABLES))
+    query_parser.add_argument("--start", help="first date or time to include, e.g. 2023-07-01")
+    query_parser.add_argument("--end", help="date or time to stop before, e.g. 2023-10-01")
+    query_parser.add_argument("--line", nargs="+", help="lines to include (subway only)")
+    query_parser.add_argument("--incident", nargs="+", help="incident groups to include")
+    query_parser.add_argument("--day", nargs="+", help="days of the week to include")
+    query_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="rebuild the index even if the cleaned table hasn't changed"
+    )
+
+    rollup_parser = commands.add_parser(
+        "rollup",
+        help="number, total, mean and spread of delays grouped by any dimensions of the cube"
+    )
+    rollup_parser.add_argument(
+        "by",
+        nargs="*",
+        help=f"dimensions to group by, any of {', '.join(DIMENSIONS)} (default: none, i.e. the grand total)"
+    )
+    rollup_parser.add_argument(
+        "--mode",
+        nargs="+",
+        choices=sorted(MODE_CUBES),
+        default=sorted(MODE_CUBES),
+        help="modes to include (default: %(default)s)"
+    )
+
+    figures_parser = commands.add_parser(
+        "figures",
+        help="redraw the figures and tables of the paper whose summaries changed"
+    )
+    figures_parser.add_argument(
+        "names",
+        nargs="*",
+        help=f"figures or tables to build, any of {', '.join(list(FIGURES) + list(TABLES))} (default: all)"
+    )
+    figures_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="redraw every figure and table even if its inputs haven't changed"
+    )
+    figures_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of processes drawing figures (default: %(default)s)"
+    )
+
+    benchmark_parser = commands.add_parser(
+        "benchmark",
+        help="time each stage on simulated data of increasing size"
+    )
+    benchmark_parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=float,
+        default=SCALES,
+        help="multiples of today's yearly volume to simulate (default: %(default)s)"
+    )
+    benchmark_parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES),
+        default=list(STAGES),
+        help="stages to run (default: all)"
+    )
+    benchmark_parser.add_argument("--repeat", type=int, default=1, help="runs of each stage, keeping the fastest")
+    benchmark_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="rows per chunk passed to the stages (default: %(default)s, i.e. whole tables)"
+    )
+    benchmark_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of processes passed to the stages (default: %(default)s)"
+    )
+    benchmark_parser.add_argument(
+        "--output",
+        default=BENCHMARK_RESULTS,
+        help="JSON file to save the results to (default: %(default)s)"
+    )
+    benchmark_parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    benchmark_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="relative slowdown or memory growth flagged as a regression (default: %(default)s)"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(download=not args.skip_download, save=args.save, force=args.force, workers=args.workers)
+    elif args.command == "ingest":
+        added = ingest(download=not args.skip_download, rebuild=args.rebuild, workers=args.workers)
+        for dataset, months in added.items():
+            print(f"{dataset}: added {', '.join(map(str, months)) or 'nothing new'}")
+    elif args.command == "query":
+        index = load_index(args.mode, rebuild=args.rebuild)
+        try:
+            result = index.query(args.start, args.end, line=args.line, incident=args.incident, day=args.day)
+        except ValueError as error:
+            parser.error(str(error))
+        for name, value in result.items():
+            print(f"{name}: {value:g}" if isinstance(value, float) else f"{name}: {value}")
+    elif args.command == "rollup":
+        try:
+            rolled = rollup(load_cube(args.mode), args.by)
+        except ValueError as error:
+            parser.error(str(error))
+        print(rolled.to_string(index=False))
+    elif args.command == "figures":
+        try:
+            built = build_figures(args.names or None, force=args.force, workers=args.workers)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"redrew {', '.join(built) or 'nothing, all up to date'}")
+    elif args.command == "benchmark":
+        results = run_benchmarks(args.scales, args.stages, args.repeat, args.chunk_size, args.workers)
+        save_results(results, args.output)
+        print(pd.DataFrame(results["results"]).to_string(index=False))
+
+        if args.baseline:
+            compared = compare(results, load_results(args.baseline), args.tolerance)
+            print()
+            print(compared.to_string(index=False))
+            if compared["regression"].any():
+                sys.exit("regressions against the baseline: " + ", ".join(
+                    f"{row.stage} at scale {row.scale:g}" for row in compared[compared["regression"]].itertuples()
+                ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Benchmarks of the pipeline stages on simulated data of increasing size.
+
+For each scale (a multiple of today's yearly volume, see
+``ttc_analysis.simulate``) ``run_benchmarks`` lays out simulated raw data
+under ``BENCHMARK_DIR/scale=<scale>`` and runs each of ``STAGES`` there in
+a fresh process, recording its wall time, peak resident memory (of the
+stage's main process, read from ``/proc`` so Linux only) and raw rows
+processed per second. The build cache is cleared before every run, so
+no stage is skipped.
+
+Results are saved as JSON and can be compared with a saved baseline
+(``compare``), flagging every stage that got slower or bigger by more than
+a tolerance, e.g.::
+
+    python -m ttc_analysis benchmark --scales 1 10 --output before.json
+    # ... change something ...
+    python -m ttc_analysis benchmark --scales 1 10 --baseline before.json
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.parallel import WORKERS
+from ttc_analysis.paths import BENCHMARK_DIR, BUILD_CACHE, RAW_BUS_DELAYS, RAW_SUBWAY_DELAYS
+from ttc_analysis.simulate import ROWS_PER_YEAR, simulate_raw_data
+from ttc_analysis.stream import CHUNK_SIZE
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+# Script (or "-m" and a module) and arguments of each benchmarked stage, run
+# from the simulated data's root
+STAGES = {
+    "02-clean_data": [str(REPO_DIR / "scripts" / "02-clean_data.py")],
+    "03-parse_codes": [str(REPO_DIR / "scripts" / "03-parse_codes.py")],
+    "04-summarise_data": [str(REPO_DIR / "scripts" / "04-summarise_data.py")],
+    "05-find_incident_clusters": [str(REPO_DIR / "scripts" / "05-find_incident_clusters.py")],
+    "pipeline": ["-m", "ttc_analysis", "run", "--skip-download", "--force"]
+}
+
+# Runs a stage like ``python <args>`` and, on exit, writes the peak resident
+# memory of the process (in KiB) to the file named by TTC_BENCHMARK_PEAK.
+# The high-water mark is read from /proc because ru_maxrss carries over the
+# benchmarking process's own peak through fork and exec.
+MEASURE = """
+import atexit, os, runpy, sys
+
+def record_peak():
+    with open("/proc/self/status") as status:
+        peak = next(line.split()[1] for line in status if line.startswith("VmHWM:"))
+    with open(os.environ["TTC_BENCHMARK_PEAK"], "w") as f:
+        f.write(peak)
+
+atexit.register(record_peak)
+if sys.argv[1] == "-m":
+    sys.argv = sys.argv[2:]
+    runpy.run_module(sys.argv[0], run_name="__main__", alter_sys=True)
+else:
+    sys.argv = sys.argv[1:]
+    runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# Default scales to benchmark
+SCALES = [1, 10]
+
+# Relative increase in time or memory over the baseline flagged as a regression
+TOLERANCE = 0.2
+
+
+def run_stage(args, root, env, log):
+    """Run ``python <args>`` in ``root`` and return its wall time (seconds)
+    and peak resident memory (MiB)."""
+    # Nothing may be skipped because it was already built
+    (root / BUILD_CACHE).unlink(missing_ok=True)
+
+    with tempfile.NamedTemporaryFile("r", suffix=".peak") as peak:
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", MEASURE, *args],
+            cwd=root,
+            env=dict(env, TTC_BENCHMARK_PEAK=peak.name),
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+        seconds = time.perf_counter() - start
+
+        if process.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed in {root}, see {log.name}")
+
+        return seconds, int(peak.read()) / 1024
+
+
+def run_benchmarks(scales=SCALES, stages=tuple(STAGES), repeat=1, chunk_size=CHUNK_SIZE,
+                   workers=WORKERS, directory=BENCHMARK_DIR):
+    """Benchmark ``stages`` on simulated data at each of ``scales`` and
+    return the results.
+
+    Each stage runs ``repeat`` times; its fastest time and largest peak
+    memory are kept. ``chunk_size`` and ``workers`` are passed on to the
+    stages (see ``ttc_analysis.stream`` and ``ttc_analysis.parallel``).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])))
+    env["TTC_WORKERS"] = str(workers)
+    if chunk_size is None:
+        env.pop("TTC_CHUNK_SIZE", None)
+    else:
+        env["TTC_CHUNK_SIZE"] = str(chunk_size)
+
+    results = []
+    for scale in scales:
+        root = Path(directory) / f"scale={scale:g}"
+        rows = sum(int(mode_rows * scale) for mode_rows in ROWS_PER_YEAR.values())
+
+        # The simulated data only depends on the scale and seed, so it is
+        # kept between benchmark runs
+        if not ((root / RAW_BUS_DELAYS).exists() and (root / RAW_SUBWAY_DELAYS).exists()):
+            simulate_raw_data(root, scale=scale, workers=workers)
+
+        with open(root / "benchmark.log", "w") as log:
+            for stage in stages:
+                runs = [run_stage(STAGES[stage], root, env, log) for _ in range(repeat)]
+                seconds = min(seconds for seconds, _ in runs)
+                results.append({
+                    "scale": scale,
+                    "stage": stage,
+                    "rows": rows,
+                    "seconds": seconds,
+                    "peak_rss_mb": max(peak for _, peak in runs),
+                    "rows_per_second": rows / seconds
+                })
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "chunk_size": chunk_size,
+            "workers": workers,
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+
+def save_results(results, path):
+    """Write benchmark results to the JSON file ``path``."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    """Read benchmark results saved by ``save_results``."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return a table of the time and memory of each stage and scale in
+    both ``results`` and ``baseline``, relative to the baseline, with a
+    ``regression`` column flagging increases above ``tolerance``."""
+    current = pd.DataFrame(results["results"]).set_index(["scale", "stage"])
+    before = pd.DataFrame(baseline["results"]).set_index(["scale", "stage"])
+    both = current.join(before, how="inner", lsuffix="", rsuffix="_baseline")
+
+    table = pd.DataFrame({
+        "seconds": both["seconds"],
+        "seconds_baseline": both["seconds_baseline"],
+        "time_ratio": both["seconds"] / both["seconds_baseline"],
+        "peak_rss_mb": both["peak_rss_mb"],
+        "peak_rss_mb_baseline": both["peak_rss_mb_baseline"],
+        "memory_ratio": both["peak_rss_mb"] / both["peak_rss_mb_baseline"]
+    })
+    table["regression"] = (table["time_ratio"] > 1 + tolerance) | (table["memory_ratio"] > 1 + tolerance)
+    return table.reset_index()
@@ -0,0 +1,123 @@
+"""Fingerprint-based build cache for skipping steps whose inputs haven't changed.
+
+A fingerprint combines the contents of a step's inputs (files or
+DataFrames), the source of the modules that implement it and the parameters
+it uses, such as ``BUS_INCIDENT_MAP`` or ``LINE_MAP``. After a step
+finishes, its fingerprint is recorded in ``BUILD_CACHE``; the next time the
+step is about to run with the same fingerprint, and its outputs still exist,
+it can be skipped.
+
+Scripts and pipeline runs may finish at the same time, so ``BuildCache``
+merges what it recorded into the entries on disk under a lock rather than
+overwriting them.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves aren't locked
+    fcntl = None
+
+import pandas as pd
+
+from ttc_analysis.paths import BUILD_CACHE
+
+# Read files in 1 MiB blocks when hashing them
+BLOCK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """Return the SHA-256 of the contents of ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_digest(df):
+    """Return a digest of the column names, types and values of ``df``."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint(inputs=(), frames=(), modules=(), params=None):
+    """Combine input files, DataFrames, module sources and parameters into
+    a single fingerprint.
+
+    ``params`` must be JSON serialisable (values that aren't are converted
+    with ``str``).
+    """
+    digest = hashlib.sha256()
+    for path in inputs:
+        digest.update(file_digest(path).encode())
+    for df in frames:
+        digest.update(frame_digest(df).encode())
+    for module in modules:
+        digest.update(file_digest(module.__file__).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on ``<path>.lock`` while the block runs."""
+    with open(path.with_name(path.name + ".lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_entries(path):
+    """Return the entries saved at ``path``, if any."""
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+class BuildCache:
+    """Fingerprints of the last successful run of each step, keyed by a
+    step name such as ``"03-parse_codes/bus"``."""
+
+    def __init__(self, path=BUILD_CACHE):
+        self.path = Path(path)
+        self.entries = read_entries(self.path)
+        self.recorded = {}
+
+    def is_fresh(self, key, fingerprint, outputs=()):
+        """True if ``key`` last ran with ``fingerprint`` and all of its
+        ``outputs`` are still on disk."""
+        return (
+            self.entries.get(key) == fingerprint
+            and all(Path(output).exists() for output in outputs)
+        )
+
+    def record(self, key, fingerprint):
+        """Record that ``key`` ran successfully with ``fingerprint``."""
+        self.entries[key] = fingerprint
+        self.recorded[key] = fingerprint
+        self.save()
+
+    def save(self):
+        """Merge the entries recorded here into those on disk, which other
+        runs may have saved since this cache was read."""
+        with locked(self.path):
+            self.entries = {**read_entries(self.path), **self.recorded}
+
+            # Write to a temporary file of our own first so an interrupted
+            # run can't leave a truncated cache behind
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.path.parent, prefix=self.path.name, suffix=".tmp", delete=False
+            ) as temporary:
+                temporary.write(json.dumps(self.entries, indent=2, sort_keys=True))
+            os.replace(temporary.name, self.path)
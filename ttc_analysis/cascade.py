@@ -0,0 +1,161 @@
+"""Group subway delays into clusters of knock-on delays (see 05-find_incident_clusters).
+
+One incident often delays trains for a while after it and leads to more
+delays on the same line. A delay joins the cluster of the delays before it
+on its line if it starts at most ``window`` minutes after the latest of
+their gaps in service ends (``timestamp + min_gap``), so clusters chain
+through overlapping gaps. The first delay of a cluster is its root.
+
+Clusters are found with one sort of each line's delays by timestamp and a
+single vectorised sweep over them (the running maximum of the ends of the
+gaps so far), so the work is O(n log n) whatever the number of years.
+``find_clusters`` reads and sweeps each line of the cleaned table in its
+own process; ``update_clusters`` sweeps again only the lines of the
+partitioned store that got new rows (see ``ttc_analysis.incremental``).
+
+Only delays of at least one minute are clustered: delays of 0 minutes
+didn't hold up service (see ``clean.filter_subway_data``).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.store import parquet_path, read_partitions, read_table
+
+# Minutes after the end of a cluster's gaps in service within which a delay
+# on the same line still joins it
+WINDOW = int(os.environ["TTC_CLUSTER_WINDOW"]) if os.environ.get("TTC_CLUSTER_WINDOW") else 15
+
+# Columns the clusters are found from
+CLUSTER_COLUMNS = ["timestamp", "incident", "min_delay", "min_gap", "line", "station"]
+
+# Label columns of the clusters, categorical as in the cleaned tables
+CLUSTER_CATEGORIES = ["line", "root_incident", "root_station"]
+
+
+@instrumented("transform")
+def cluster_delays(delay_data, window=WINDOW):
+    """Return the delays of ``delay_data`` of at least one minute, sorted
+    by line and timestamp, with the ``cluster`` each belongs to (numbered
+    from 0 within each line, in time order)."""
+    delays = delay_data[delay_data["min_delay"] > 0]
+    delays = delays.sort_values(["line", "timestamp"], kind="stable").reset_index(drop=True)
+
+    minutes = delays["timestamp"].to_numpy().astype("datetime64[m]").astype(np.int64)
+    ends = pd.Series(minutes + delays["min_gap"].to_numpy(), index=delays.index)
+
+    # Latest end of a gap among the earlier delays of the same line; a
+    # delay starting more than ``window`` minutes after it (or the first of
+    # its line) starts a new cluster
+    by_line = ends.groupby(delays["line"], observed=True, sort=False)
+    reach = by_line.cummax().groupby(delays["line"], observed=True, sort=False).shift()
+    starts = reach.isna().to_numpy() | (minutes > reach.to_numpy() + window)
+
+    clusters = pd.Series(np.cumsum(starts), index=delays.index)
+    first = clusters.groupby(delays["line"], observed=True, sort=False).transform("min")
+    return delays.assign(cluster=(clusters - first).astype(np.int64))
+
+
+@instrumented("groupby")
+def summarise_clusters(clustered):
+    """Return one row per cluster of ``cluster_delays``' output: its line,
+    root incident and station, first and last delay, span in minutes
+    (from the first delay to the end of the last gap), number of delays
+    and total delay time."""
+    # Totals in int64, which the int16 delays of a long cluster may not fit
+    clustered = clustered.assign(min_delay=clustered["min_delay"].astype(np.int64))
+    grouped = clustered.groupby(["line", "cluster"], observed=True, sort=False)
+    ends = clustered["timestamp"] + pd.to_timedelta(clustered["min_gap"].astype(np.int64), unit="m")
+
+    clusters = grouped.agg(
+        start=("timestamp", "first"),
+        last_delay=("timestamp", "last"),
+        n=("min_delay", "size"),
+        total_delay_time=("min_delay", "sum")
+    )
+
+    # The incident and station of the first delay, even where missing
+    # (the "first" aggregation would skip to the first one present)
+    roots = grouped.head(1).set_index(["line", "cluster"])
+    clusters["root_incident"] = roots["incident"]
+    clusters["root_station"] = roots["station"]
+    clusters["end"] = ends.groupby([clustered["line"], clustered["cluster"]], observed=True, sort=False).max()
+    clusters["span_minutes"] = ((clusters["end"] - clusters["start"]) // pd.Timedelta(minutes=1)).astype(np.int64)
+    clusters = clusters.drop(columns=["last_delay", "end"]).reset_index()
+
+    return clusters[[
+        "line",
+        "cluster",
+        "start",
+        "span_minutes",
+        "n",
+        "total_delay_time",
+        "root_incident",
+        "root_station"
+    ]]
+
+
+def line_clusters(path, line, window=WINDOW):
+    """Read the delays of one ``line`` of the table at ``path`` and return
+    its clusters."""
+    delay_data = apply_schema(pd.read_parquet(
+        parquet_path(path),
+        columns=CLUSTER_COLUMNS,
+        filters=[("line", "==", line)]
+    ))
+    return summarise_clusters(cluster_delays(delay_data, window))
+
+
+def find_clusters(path, window=WINDOW, workers=WORKERS):
+    """Return the clusters of every line of the cleaned subway table at
+    ``path``, each line swept in up to ``workers`` processes, in line
+    order."""
+    lines = pq.read_table(parquet_path(path), columns=["line"]).column("line").unique().to_pylist()
+    lines = sorted(line for line in lines if line is not None)
+
+    clusters = pd.concat(
+        map_in_processes(line_clusters, [(path, line, window) for line in lines], workers),
+        ignore_index=True
+    )
+    return clusters.astype(dict.fromkeys(CLUSTER_CATEGORIES, "category"))
+
+
+def update_clusters(directory, path, lines=None, window=WINDOW):
+    """Return the clusters of the partitioned subway store under
+    ``directory``: those of ``lines`` (all lines if None, or if no clusters
+    are stored at ``path`` yet) are found again from the whole history of
+    the line, and the other lines keep their stored clusters."""
+    delay_data = read_partitions(directory, columns=CLUSTER_COLUMNS)
+    if lines is None or not parquet_path(path).exists():
+        return summarise_clusters(cluster_delays(delay_data, window))
+
+    stored = read_table(path)
+    clusters = pd.concat([
+        stored[~stored["line"].isin(lines)],
+        summarise_clusters(cluster_delays(delay_data[delay_data["line"].isin(lines)], window))
+    ])
+    clusters = clusters.astype({"line": object}).sort_values(["line", "cluster"], kind="stable", ignore_index=True)
+    return clusters.astype(dict.fromkeys(CLUSTER_CATEGORIES, "category"))
+
+
+@instrumented("groupby")
+def summarise_root_incidents(clusters):
+    """Return, per root incident type, the number of clusters and of those
+    with knock-on delays, the mean number of delays and span of a cluster,
+    and the total delay time and its share of all the clusters' time."""
+    grouped = clusters.groupby("root_incident", observed=True)
+    summary = grouped.agg(
+        clusters=("n", "size"),
+        cascades=("n", lambda n: int((n > 1).sum())),
+        mean_delays=("n", "mean"),
+        mean_span_minutes=("span_minutes", "mean"),
+        total_delay_time=("total_delay_time", "sum")
+    )
+    summary["share_of_delay_time"] = summary["total_delay_time"] / clusters["total_delay_time"].sum()
+    return summary.reset_index()
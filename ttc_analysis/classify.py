@@ -0,0 +1,47 @@
+"""Vectorised classification of codes by declarative prefix rules.
+
+A rule set maps code prefixes to groups, e.g. ``{"MUD": "Equipment/Mechanical",
+"MU": "Miscellaneous"}``; a code belongs to the group of the longest prefix
+it starts with, so more specific rules never depend on the order they are
+written in. ``compile_prefix_rules`` turns a rule set into a function that
+classifies a whole column at once: the column is factorised, only its
+distinct codes are looked up (one dict lookup per distinct prefix length)
+and the groups are broadcast back to the rows as a categorical.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def compile_prefix_rules(rules, default):
+    """Return a function classifying a Series of codes with ``rules``.
+
+    Codes that match no prefix, and missing codes, get ``default``.
+    """
+    lengths = sorted({len(prefix) for prefix in rules}, reverse=True)
+    categories = sorted(set(rules.values()) | {default})
+    group_codes = {prefix: categories.index(group) for prefix, group in rules.items()}
+    default_code = categories.index(default)
+
+    def classify(codes):
+        codes = pd.Series(codes)
+        row_codes, distinct = pd.factorize(codes)
+        distinct = pd.Index(distinct).astype(str)
+
+        # Longest prefixes first, so the first match is the one that wins
+        groups = np.full(len(distinct), default_code)
+        unmatched = np.ones(len(distinct), dtype=bool)
+        for length in lengths:
+            matched = distinct.str[:length].map(group_codes).to_numpy(dtype="float64", na_value=np.nan)
+            hit = unmatched & ~np.isnan(matched)
+            groups[hit] = matched[hit]
+            unmatched &= ~hit
+
+        row_groups = np.where(row_codes >= 0, groups[row_codes], default_code)
+        return pd.Series(
+            pd.Categorical.from_codes(row_groups, categories=categories),
+            index=codes.index,
+            name=codes.name
+        )
+
+    return classify
@@ -0,0 +1,208 @@
+"""Clean the raw delay datasets (see 02-clean_data)."""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.schema import DAYS, NO_VEHICLE, apply_schema
+from ttc_analysis.validate import validate
+
+
+# Columns kept from the raw bus and subway delay tables
+BUS_DELAY_COLUMNS = [
+    "date",
+    "time",
+    "day",
+    "incident",
+    "min_delay",
+    "min_gap"
+]
+SUBWAY_DELAY_COLUMNS = [
+    "date",
+    "time",
+    "day",
+    "code",
+    "min_delay",
+    "min_gap",
+    "line",  # additional for subway (no similar grouping for buses)
+    "station",
+    "bound",
+    "vehicle"
+]
+
+# Columns to read from each raw delay table
+DELAY_COLUMNS = {
+    "bus_delays": BUS_DELAY_COLUMNS,
+    "subway_delays": SUBWAY_DELAY_COLUMNS
+}
+
+# Constraints on the cleaned delay tables (see ttc_analysis/validate.py),
+# whose schema is applied while cleaning
+DELAY_CONSTRAINTS = {
+    "timestamp": {"dtype": "datetime", "required": True},
+    "day": {"dtype": "category", "values": DAYS, "required": True, "all_occur": True},
+    "min_delay": {"dtype": "int16", "min": 0},
+    "min_gap": {"dtype": "int16", "min": 0}
+}
+CLEANED_CONSTRAINTS = {
+    "bus": DELAY_CONSTRAINTS,
+    "subway": {
+        **DELAY_CONSTRAINTS,
+        "station": {"dtype": "category"},
+        "bound": {"dtype": "category"},
+        "vehicle": {"dtype": "int16", "min": 0}
+    }
+}
+
+# Delays without a length or gap can't be stored in the 16-bit integer
+# columns, so they're reported and dropped while cleaning
+LENGTH_CONSTRAINTS = {
+    "min_delay": {"required": True, "severity": "warning"},
+    "min_gap": {"required": True, "severity": "warning"}
+}
+
+# Spelling fixes applied to the words of upper-cased station names, in order
+STATION_SPELLINGS = {
+    r"\s*\(.*$": "",  # trailing notes, e.g. "(APPROACHING)", often cut off
+    r"[\s/-]+$": "",
+    r"\b(STN|SATION|STAITON|STAION|STAT|STATI|STATIO)$": "STATION",  # also cut off at 22 characters
+    r"\b(STN|SATION|STAITON|STAION)\b": "STATION",
+    r"\bCTR\b": "CENTRE",
+    r"\bCAR HOUSE\b": "CARHOUSE",
+    r"\bBUILD[ -]UP\b": "BUILDUP",
+    r"\s+(BD|YUS|YU|SRT)\s+STATION\b": " STATION",  # platforms of interchange stations
+    r"\bSTATION\s+(BD|YUS|YU|SRT)$": "STATION"
+}
+
+# Misspelt or alternative names of stations, after the fixes above
+STATION_ALIASES = {
+    "GLENCARIN STATION": "GLENCAIRN STATION",
+    "GREEENWOOD YARD": "GREENWOOD YARD",
+    "ISLINTON STATION": "ISLINGTON STATION",
+    "MC COWAN STATION": "MCCOWAN STATION",
+    "QUEENS PARK STATION": "QUEEN'S PARK STATION",
+    "YONGE SHEPPARD STATION": "SHEPPARD-YONGE STATION",
+    "YORK UNIVERISTY STATION": "YORK UNIVERSITY STATION",
+    "DANFORTH DIVSION": "DANFORTH DIVISION"
+}
+
+compiled_spellings = [(re.compile(pattern), replacement) for pattern, replacement in STATION_SPELLINGS.items()]
+
+
+def clean_name(name):
+    """Lower-case a column name and replace spaces with underscores."""
+    return name.strip().lower().replace(" ", "_")
+
+
+def clean_names(df):
+    """Lower-case column names and replace spaces with underscores."""
+    return df.rename(columns=clean_name)
+
+
+def normalise_station(name):
+    """Return the normalised spelling of a raw station name, e.g.
+    "ST. GEORGE YUS STATION" becomes "ST GEORGE STATION"."""
+    name = " ".join(str(name).upper().replace(".", " ").split())
+    for pattern, replacement in compiled_spellings:
+        name = pattern.sub(replacement, name)
+    return STATION_ALIASES.get(name, name)
+
+
+def normalise_stations(stations):
+    """Normalise the spelling of a column of station names, normalising
+    each distinct name once."""
+    codes, uniques = pd.factorize(stations)
+
+    # Missing values (code -1) pick the NaN at the end
+    names = np.append(np.array([normalise_station(name) for name in uniques], dtype=object), np.nan)
+    return pd.Series(names[codes], index=stations.index, name=stations.name)
+
+
+def drop_missing_lengths(delay_data, mode):
+    """Report the ``mode`` delays without a length or gap and drop them."""
+    validate(delay_data, LENGTH_CONSTRAINTS, f"raw {mode} delay lengths")
+    return delay_data.dropna(subset=["min_delay", "min_gap"])
+
+
+@instrumented("transform")
+def clean_bus_data(raw_bus_data):
+    """Select the relevant bus columns and drop rows without a service gap
+    or a delay length."""
+    cleaned_bus_data = clean_names(raw_bus_data)
+
+    # Select only relevant columns
+    cleaned_bus_data = cleaned_bus_data[BUS_DELAY_COLUMNS]
+
+    # Filter out situations in which the delay is 0, meaning the incident that
+    # occurred didn't affect service
+    cleaned_bus_data = cleaned_bus_data[cleaned_bus_data["min_gap"] > 0]
+
+    return apply_schema(drop_missing_lengths(cleaned_bus_data, "bus"))
+
+
+@instrumented("transform")
+def clean_subway_data(raw_subway_data):
+    """Select the relevant subway columns, drop rows without a delay length
+    or gap and normalise station names."""
+    cleaned_subway_data = clean_names(raw_subway_data)
+
+    # Select only relevant columns
+    cleaned_subway_data = drop_missing_lengths(cleaned_subway_data[SUBWAY_DELAY_COLUMNS], "subway")
+
+    # Spell each station one way (kept as a categorical by the schema), and
+    # record delays without a vehicle number as NO_VEHICLE, as most already
+    # are
+    cleaned_subway_data = cleaned_subway_data.assign(
+        station=normalise_stations(cleaned_subway_data["station"]),
+        vehicle=cleaned_subway_data["vehicle"].fillna(NO_VEHICLE)
+    )
+
+    return apply_schema(cleaned_subway_data)
+
+
+@instrumented("transform")
+def filter_subway_data(cleaned_subway_data):
+    """Keep only subway delays of at least one minute.
+
+    The vast majority of rows have a delay of 0 minutes, which seems to mean
+    a delay of < 1 minute. Since this is an assumption, the filtered dataset
+    is kept alongside the full one for reference.
+    """
+    return cleaned_subway_data[cleaned_subway_data["min_delay"] > 0]
+
+
+@instrumented("transform")
+def clean_subway_codes(raw_subway_codes):
+    """Stack the subway and Scarborough RT code tables into one."""
+    cleaned_subway_codes = clean_names(raw_subway_codes)
+
+    # Select sub_rmenu_code columns
+    sub_rmenu_codes = cleaned_subway_codes[[
+        "sub_rmenu_code",
+        "code_description"
+    ]].rename(columns={
+        "sub_rmenu_code": "code",
+        "code_description": "code_description"
+    })
+
+    # Select srt_rmenu_code columns (Scarborough RT)
+    srt_rmenu_codes = cleaned_subway_codes[[
+        "srt_rmenu_code",
+        "code_description.1"
+    ]].dropna(subset=["srt_rmenu_code"]).rename(columns={
+        "srt_rmenu_code": "code",
+        "code_description.1": "code_description"
+    })
+
+    # Merge back in the 2 sets of codes
+    merged_subway_codes = pd.concat([sub_rmenu_codes, srt_rmenu_codes], ignore_index=True)
+
+    return apply_schema(merged_subway_codes)
+
+
+def validate_cleaned_data(cleaned_data, mode):
+    """Check a whole cleaned ``mode`` ("bus" or "subway") table against
+    ``CLEANED_CONSTRAINTS``; return the report."""
+    return validate(cleaned_data, CLEANED_CONSTRAINTS[mode], f"cleaned {mode} delays")
@@ -0,0 +1,150 @@
+"""Rollup cube of the cleaned delay tables (see 04-summarise_data).
+
+The cube holds one cell per combination of date, hour, day, incident, line
+and mode that has delays, with the number of delays and the sum and sum of
+squares of ``min_delay`` and ``min_gap``. Those are all sums, so any
+group-by over a subset of the dimensions is answered by adding up cells
+(``rollup``), and means and standard deviations are derived from the sums,
+without going back to the rows.
+
+Each mode's cube is stored separately (``BUS_CUBE`` and ``SUBWAY_CUBE``) and
+``load_cube`` stacks them. The partitioned store (see
+``ttc_analysis.incremental``) keeps the cube of each month next to its
+rows, and ``cube_partitions`` merges them.
+"""
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.paths import BUS_CUBE, SUBWAY_CUBE
+from ttc_analysis.schema import calendar_dates, hours_of_day
+from ttc_analysis.store import (
+    partition_path,
+    read_partitions,
+    read_table,
+    stored_partitions,
+    write_partition_table
+)
+
+# Columns each cube is built from
+BUS_CUBE_COLUMNS = ["timestamp", "day", "incident", "min_delay", "min_gap"]
+SUBWAY_CUBE_COLUMNS = ["timestamp", "day", "incident", "line", "min_delay", "min_gap"]
+
+# Dimensions and measured columns of the cube
+DIMENSIONS = ["date", "hour", "day", "incident", "line", "mode"]
+MEASURED = ["min_delay", "min_gap"]
+
+# Where each mode's cube is stored
+MODE_CUBES = {
+    "bus": BUS_CUBE,
+    "subway": SUBWAY_CUBE
+}
+
+
+@instrumented("groupby")
+def compute_cube(delay_data, mode):
+    """Return the cube cells of a cleaned ``mode`` ("bus" or "subway") table.
+
+    Bus delays have no line; their cells have a missing ``line``.
+    """
+    cells = pd.DataFrame({
+        "date": calendar_dates(delay_data["timestamp"]),
+        "hour": hours_of_day(delay_data["timestamp"]),
+        "day": delay_data["day"],
+        "incident": delay_data["incident"],
+        "line": delay_data["line"] if "line" in delay_data else pd.Categorical([None] * len(delay_data)),
+        "mode": pd.Categorical([mode] * len(delay_data))
+    })
+
+    for column in MEASURED:
+        values = delay_data[column].to_numpy().astype(np.int64)
+        cells[f"{column}_sum"] = values
+        cells[f"{column}_sumsq"] = values ** 2
+
+    grouped = cells.groupby(DIMENSIONS, observed=True, dropna=False)
+    cube = grouped.sum()
+    cube.insert(0, "n", grouped.size())
+    return cube.reset_index()
+
+
+@instrumented("merge")
+def merge_cubes(cubes):
+    """Combine the cube cells of separate pieces of a table (e.g. chunks)."""
+    stacked = pd.concat(list(cubes), ignore_index=True)
+    return stacked.groupby(DIMENSIONS, observed=True, dropna=False).sum().reset_index()
+
+
+def build_cube(chunks, mode):
+    """Return the cube of a cleaned ``mode`` table read in chunks, folding
+    each chunk into the cells as it is read."""
+    cube = None
+
+    for chunk in chunks:
+        chunk_cube = compute_cube(chunk, mode)
+        cube = chunk_cube if cube is None else merge_cubes([cube, chunk_cube])
+
+    return cube
+
+
+def write_partition_cube(delay_data, directory, month, mode):
+    """Compute and store the cube cells of one month of the partitioned
+    store; return them."""
+    cube = compute_cube(delay_data, mode)
+    write_partition_table(cube, directory, month, "cube")
+    return cube
+
+
+def read_partition_cube(directory, month, mode):
+    """Return the stored cube cells of one month, computing them from the
+    month's rows if they haven't been stored yet."""
+    path = partition_path(directory, month, "cube")
+    if not path.exists():
+        return write_partition_cube(read_partitions(directory, months=[month]), directory, month, mode)
+    return pd.read_parquet(path)
+
+
+def cube_partitions(directory, mode, workers=WORKERS):
+    """Return the cube of the whole partitioned store, merged from the cube
+    cells of each month (read in up to ``workers`` processes)."""
+    return merge_cubes(map_in_processes(
+        read_partition_cube,
+        [(directory, month, mode) for month in stored_partitions(directory)],
+        workers
+    ))
+
+
+def load_cube(modes=tuple(MODE_CUBES)):
+    """Read and stack the stored cubes of ``modes``."""
+    return pd.concat([read_table(MODE_CUBES[mode]) for mode in modes], ignore_index=True)
+
+
+def rollup(cube, by=()):
+    """Return the cube summed over every dimension not in ``by``.
+
+    Each group has the number of delays and the total, mean and (sample)
+    standard deviation of ``min_delay`` and ``min_gap``. Missing values of a
+    dimension in ``by`` (such as the line of bus delays) form their own
+    group.
+    """
+    by = list(by)
+    unknown = [dimension for dimension in by if dimension not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"unknown dimension(s) {unknown}; use some of {DIMENSIONS}")
+
+    sums = cube.drop(columns=[dimension for dimension in DIMENSIONS if dimension not in by])
+    if by:
+        sums = sums.groupby(by, observed=True, dropna=False).sum().reset_index()
+    else:
+        sums = sums.sum().to_frame().T
+
+    rolled = sums[by + ["n"]].copy()
+    for column in MEASURED:
+        total = sums[f"{column}_sum"]
+        squares = sums[f"{column}_sumsq"]
+        rolled[f"total_{column}"] = total
+        rolled[f"mean_{column}"] = total / sums["n"]
+        rolled[f"std_{column}"] = np.sqrt(((squares - total ** 2 / sums["n"]) / (sums["n"] - 1)).clip(lower=0))
+
+    return rolled
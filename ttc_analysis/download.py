@@ -0,0 +1,199 @@
+"""Download TTC delay data from opendatatoronto (see 01-download_data).
+
+The workbooks are downloaded concurrently and streamed into a local cache
+keyed by URL (``DOWNLOAD_CACHE_DIR``). The ETag and Last-Modified headers of
+each download are kept next to it and sent back as conditional request
+headers, so a workbook that hasn't changed on the portal is answered with
+``304 Not Modified`` and neither downloaded nor parsed again. Failed
+requests (connection errors, timeouts, 5xx responses) are retried with
+exponential backoff.
+
+When ``download_raw_data`` is given the columns to keep from a workbook, the
+workbook is streamed into a Parquet file with only those columns (see
+``ttc_analysis.xlsx``) instead of being read whole with ``read_excel``.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.paths import DOWNLOAD_CACHE_DIR, RAW_BUS_DELAYS, RAW_SUBWAY_CODES, RAW_SUBWAY_DELAYS
+from ttc_analysis.xlsx import workbook_to_parquet
+
+# Provided direct download links
+SUBWAY_CODES_URL = "https://ckan0.cf.opendata.inter.prod-toronto.ca/dataset/996cfe8d-fb35-40ce-b569-698d51fc683b/resource/3900e649-f31e-4b79-9f20-4731bbfd94f7/download/ttc-subway-delay-codes.xlsx"
+SUBWAY_DELAYS_URL = "https://ckan0.cf.opendata.inter.prod-toronto.ca/dataset/996cfe8d-fb35-40ce-b569-698d51fc683b/resource/2fbec48b-33d9-4897-a572-96c9f002d66a/download/ttc-subway-delay-2023.xlsx"
+BUS_DELAYS_URL = "https://ckan0.cf.opendata.inter.prod-toronto.ca/dataset/e271cdae-8788-4980-96ce-6a5c95bc6618/resource/10802a64-9ac0-4f2e-9538-04800a399d1e/download/ttc-bus-delay-data-2023.xlsx"
+
+# Where each raw table is downloaded from
+RAW_URLS = {
+    "subway_codes": SUBWAY_CODES_URL,
+    "subway_delays": SUBWAY_DELAYS_URL,
+    "bus_delays": BUS_DELAYS_URL
+}
+
+# Where each raw table is saved as CSV
+RAW_PATHS = {
+    "subway_codes": RAW_SUBWAY_CODES,
+    "subway_delays": RAW_SUBWAY_DELAYS,
+    "bus_delays": RAW_BUS_DELAYS
+}
+
+# Options for reading each workbook (the code workbook has a title row
+# above the header)
+READ_OPTIONS = {
+    "subway_codes": {"header": 1},
+    "subway_delays": {},
+    "bus_delays": {}
+}
+
+# Retry failed requests this many times, waiting BACKOFF * 2**attempt seconds
+RETRIES = 4
+BACKOFF = 1.0
+TIMEOUT = 60
+
+# Stream downloads to disk in 1 MiB chunks
+CHUNK_SIZE = 1 << 20
+
+
+def cache_paths(url, cache_dir=DOWNLOAD_CACHE_DIR):
+    """Return the cached file, its header metadata and its parsed table
+    for ``url``."""
+    key = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return (
+        cache_dir / f"{key}.xlsx",
+        cache_dir / f"{key}.json",
+        cache_dir / f"{key}.pkl"
+    )
+
+
+def streamed_path(url, columns, cache_dir=DOWNLOAD_CACHE_DIR):
+    """Return the Parquet file holding ``columns`` of the workbook of ``url``."""
+    path, _, _ = cache_paths(url, cache_dir)
+    key = hashlib.sha256(",".join(columns).encode()).hexdigest()[:8]
+    return path.with_name(f"{path.stem}-{key}.parquet")
+
+
+@instrumented("load")
+def fetch(url, cache_dir=DOWNLOAD_CACHE_DIR, session=requests, retries=RETRIES, backoff=BACKOFF):
+    """Download ``url`` into the cache unless the cached copy is current.
+
+    Returns the path of the cached file and whether it was (re)downloaded.
+    """
+    path, metadata_path, parsed_path = cache_paths(url, cache_dir)
+    metadata = json.loads(metadata_path.read_text()) if metadata_path.exists() else {}
+
+    headers = {}
+    if path.exists():
+        if "etag" in metadata:
+            headers["If-None-Match"] = metadata["etag"]
+        if "last_modified" in metadata:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code == 304:
+                    return path, False
+                response.raise_for_status()
+
+                # Stream into a temporary file so an interrupted download
+                # never replaces a good cached copy
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                temporary = path.with_name(path.name + ".tmp")
+                with open(temporary, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(temporary, path)
+
+                # Drop the tables parsed from the previous download
+                parsed_path.unlink(missing_ok=True)
+                for streamed in cache_dir.glob(f"{path.stem}-*.parquet"):
+                    streamed.unlink()
+
+                metadata = {"url": url}
+                if "ETag" in response.headers:
+                    metadata["etag"] = response.headers["ETag"]
+                if "Last-Modified" in response.headers:
+                    metadata["last_modified"] = response.headers["Last-Modified"]
+                metadata_path.write_text(json.dumps(metadata, indent=2))
+
+                return path, True
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.HTTPError,
+            requests.exceptions.ChunkedEncodingError  # connection dropped mid-download
+        ) as error:
+            # Client errors (404, 403, ...) won't get better by retrying
+            status = getattr(error.response, "status_code", None)
+            if attempt == retries or (status is not None and status < 500):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+@instrumented("load")
+def read_workbook(url, downloaded, cache_dir=DOWNLOAD_CACHE_DIR, columns=None, **read_options):
+    """Read the cached workbook of ``url``, reusing the table parsed on a
+    previous run if the workbook wasn't downloaded again.
+
+    If ``columns`` is given, only those (normalised) columns are read, by
+    streaming the workbook rather than with ``read_excel``.
+    """
+    path, _, parsed_path = cache_paths(url, cache_dir)
+
+    if columns is not None:
+        parsed_path = streamed_path(url, columns, cache_dir)
+        if downloaded or not parsed_path.exists():
+            temporary = parsed_path.with_name(parsed_path.name + ".tmp")
+            workbook_to_parquet(path, temporary, columns, header=read_options.get("header", 0))
+            os.replace(temporary, parsed_path)
+        return pd.read_parquet(parsed_path)
+
+    if not downloaded and parsed_path.exists():
+        return pd.read_pickle(parsed_path)
+
+    df = pd.read_excel(path, **read_options)
+    df.to_pickle(parsed_path)
+    return df
+
+
+def download_raw_data(urls=RAW_URLS, cache_dir=DOWNLOAD_CACHE_DIR, max_workers=len(RAW_URLS), columns=None):
+    """Download the raw subway codes, subway delays and bus delays.
+
+    ``urls`` maps the table names of ``RAW_PATHS`` to their download links
+    (e.g. a local server in tests). ``columns`` optionally maps table names
+    to the only columns to read from them. Returns a dict of DataFrames
+    keyed like ``urls``.
+    """
+    columns = columns or {}
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetches = {
+            name: pool.submit(fetch, url, cache_dir, session)
+            for name, url in urls.items()
+        }
+        downloaded = {name: future.result()[1] for name, future in fetches.items()}
+
+    return {
+        name: read_workbook(url, downloaded[name], cache_dir, columns.get(name), **READ_OPTIONS[name])
+        for name, url in urls.items()
+    }
+
+
+def save_raw_data(raw):
+    """Save the downloaded tables as CSV under ``inputs/data``."""
+    for name, df in raw.items():
+        df.to_csv(RAW_PATHS[name], index=False)
+
+
+@instrumented("load")
+def read_raw_data():
+    """Read the raw tables saved by a previous download."""
+    return {name: pd.read_csv(path) for name, path in RAW_PATHS.items()}
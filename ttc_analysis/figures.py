@@ -0,0 +1,272 @@
+"""Figures and tables of the paper, rebuilt only when their inputs change.
+
+Every figure and table in ``outputs/paper.qmd`` is declared below with the
+table it is drawn from (a summary written by 04-summarise_data, or a
+cleaned table for the samples), how it is drawn and its parameters, e.g.::
+
+    "avg_num_bus_delays_by_day": {
+        "input": SUMMARY_DIR / "avg_num_bus_delays_by_day.csv",
+        "plot": "days",
+        "params": {"color": "skyblue"}
+    }
+
+``build_figures`` fingerprints each one from its input, its parameters and
+this module (see ``ttc_analysis.cache``), redraws those whose fingerprint
+changed or whose file is missing, spread over up to ``workers`` processes
+(see ``ttc_analysis.parallel``), and leaves the rest alone. Figures are
+saved as ``FIGURE_DIR/<name>.png`` and tables as ``FIGURE_DIR/<name>.csv``,
+which the paper includes as they are, so rendering it after a data refresh
+only redraws what the refresh changed.
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.figure import Figure
+
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.paths import (
+    BUILD_CACHE,
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_DELAYS,
+    FIGURE_DIR,
+    SUMMARY_DIR
+)
+from ttc_analysis.store import csv_path
+
+# Days of the week in calendar order, for the axes
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Figure size in inches and resolution of the saved PNGs
+FIGURE_SIZE = (8, 4)
+DPI = 150
+
+# Figures of the paper, by name
+FIGURES = {
+    "bus_delays_by_hour": {
+        "input": SUMMARY_DIR / "bus_delays_by_hour.csv",
+        "plot": "hours",
+        "params": {"color": "blue"}
+    },
+    "subway_delays_by_hour": {
+        "input": SUMMARY_DIR / "subway_delays_by_hour.csv",
+        "plot": "hours",
+        "params": {"color": "red"}
+    },
+    "avg_num_bus_delays_by_day": {
+        "input": SUMMARY_DIR / "avg_num_bus_delays_by_day.csv",
+        "plot": "days",
+        "params": {"color": "skyblue"}
+    },
+    "avg_num_subway_delays_by_day": {
+        "input": SUMMARY_DIR / "avg_num_subway_delays_by_day.csv",
+        "plot": "days",
+        "params": {"color": "salmon"}
+    },
+    "total_bus_delay_time_by_date": {
+        "input": SUMMARY_DIR / "total_bus_delay_time_by_date.csv",
+        "plot": "dates",
+        "params": {"column": "total_delay_time", "label": "Total Delay Time (Minutes)", "color": "blue"}
+    },
+    "mean_bus_delay_time_by_date": {
+        "input": SUMMARY_DIR / "total_bus_delay_time_by_date.csv",
+        "plot": "dates",
+        "params": {"column": "mean_delay_time", "label": "Average Delay Time (Minutes)", "color": "green"}
+    },
+    "total_num_bus_delays_by_incident": {
+        "input": SUMMARY_DIR / "total_num_bus_delays_by_incident.csv",
+        "plot": "counts",
+        "params": {"key": "incident", "label": "Incident Type", "count_label": "Delay Count"}
+    },
+    "total_num_subway_delays_by_incident": {
+        "input": SUMMARY_DIR / "total_num_subway_delays_by_incident.csv",
+        "plot": "counts",
+        "params": {"key": "incident", "label": "Incident Type", "count_label": "Delay Count"}
+    },
+    "total_num_subway_delays_by_line": {
+        "input": SUMMARY_DIR / "total_num_subway_delays_by_line.csv",
+        "plot": "counts",
+        "params": {"key": "line", "label": "TTC Line", "count_label": "Number of Delays"}
+    }
+}
+
+# Tables of the paper, by name; ``columns`` maps the columns kept to their
+# headings
+TABLES = {
+    "sample_bus_delays": {
+        "input": csv_path(CLEANED_BUS_DELAYS),
+        "table": "head",
+        "params": {
+            "rows": 5,
+            "columns": {
+                "date": "Date",
+                "time": "Time",
+                "day": "Day",
+                "incident": "Incident",
+                "min_delay": "Min Delay",
+                "min_gap": "Min Gap"
+            }
+        }
+    },
+    "sample_subway_delays": {
+        "input": csv_path(CLEANED_SUBWAY_DELAYS),
+        "table": "head",
+        "params": {
+            "rows": 5,
+            "columns": {
+                "date": "Date",
+                "time": "Time",
+                "day": "Day",
+                "incident": "Incident",
+                "min_delay": "Min Delay",
+                "min_gap": "Min Gap",
+                "line": "Line"
+            }
+        }
+    },
+    "sample_bus_delay_time_by_date": {
+        "input": SUMMARY_DIR / "total_bus_delay_time_by_date.csv",
+        "table": "sample",
+        "params": {
+            "rows": 5,
+            "seed": 302,
+            "columns": {
+                "date": "Date",
+                "day": "Day",
+                "total_delay_time": "Total Delay Time",
+                "n": "Delay Count",
+                "mean_delay_time": "Average Delay Time"
+            }
+        }
+    }
+}
+
+
+def rotate_labels(ax):
+    """Slant the labels of the x axis, anchored at their right end."""
+    for label in ax.get_xticklabels():
+        label.set(rotation=60, ha="right")
+
+
+def plot_hours(data, ax, color):
+    """Bar per hour of the day of the number of delays."""
+    hourly = data.groupby("hour")["n"].sum().reindex(range(24), fill_value=0)
+    ax.bar(hourly.index, hourly.to_numpy(), width=1, align="edge", color=color, alpha=0.75)
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Count")
+    ax.set_xticks(range(0, 25, 2), [f"{hour}:00" for hour in range(0, 25, 2)])
+    rotate_labels(ax)
+
+
+def plot_days(data, ax, color):
+    """Bar per day of the week of the mean number of delays."""
+    daily = data.set_index("day")["mean_num_delays"].reindex(WEEKDAYS)
+    ax.bar(daily.index, daily.to_numpy(), color=color)
+    ax.set_xlabel("Day of the Week")
+    ax.set_ylabel("Mean Number of Delays")
+    rotate_labels(ax)
+
+
+def plot_dates(data, ax, column, label, color):
+    """Point per date of ``column``."""
+    ax.scatter(pd.to_datetime(data["date"]), data[column], color=color, alpha=0.6)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(label)
+
+
+def plot_counts(data, ax, key, label, count_label):
+    """Bar of the number of delays per ``key``, each in its own colour,
+    with a legend."""
+    bars = ax.bar(data[key], data["n"], color=colormaps["Set2"].colors[:len(data)])
+    ax.set_xlabel(label)
+    ax.set_ylabel(count_label)
+    rotate_labels(ax)
+    ax.legend(bars, data[key].tolist(), title=label, bbox_to_anchor=(1.05, 1), loc="upper left")
+
+
+def table_head(data, rows, columns):
+    """First ``rows`` rows of ``columns``."""
+    return data[list(columns)].head(rows).rename(columns=columns)
+
+
+def table_sample(data, rows, seed, columns):
+    """``rows`` rows of ``columns`` drawn at random with ``seed``."""
+    return data[list(columns)].sample(n=rows, random_state=seed).rename(columns=columns)
+
+
+# Ways of drawing a figure or making a table, by the name used in FIGURES
+# and TABLES
+PLOTS = {
+    "hours": plot_hours,
+    "days": plot_days,
+    "dates": plot_dates,
+    "counts": plot_counts
+}
+MAKE_TABLES = {
+    "head": table_head,
+    "sample": table_sample
+}
+
+
+def artifact_path(name, root="."):
+    """Return the file of the figure or table ``name``."""
+    return Path(root) / FIGURE_DIR / (f"{name}.png" if name in FIGURES else f"{name}.csv")
+
+
+def artifact_fingerprint(name, root="."):
+    """Fingerprint of the input, parameters and drawing code of ``name``."""
+    spec = FIGURES.get(name) or TABLES[name]
+    return fingerprint(inputs=[Path(root) / spec["input"]], modules=[sys.modules[__name__]], params=spec)
+
+
+@instrumented("write")
+def render(name, root="."):
+    """Draw the figure or make the table ``name`` and save it."""
+    path = artifact_path(name, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if name in TABLES:
+        spec = TABLES[name]
+        data = pd.read_csv(Path(root) / spec["input"])
+        MAKE_TABLES[spec["table"]](data, **spec["params"]).to_csv(path, index=False)
+        return
+
+    spec = FIGURES[name]
+    # A bare Figure rather than pyplot, so no display or global state is
+    # involved
+    fig = Figure(figsize=FIGURE_SIZE)
+    ax = fig.subplots()
+    PLOTS[spec["plot"]](pd.read_csv(Path(root) / spec["input"]), ax, **spec["params"])
+    ax.grid(axis="y", linestyle=":", linewidth=0.5)
+    fig.tight_layout()
+    fig.savefig(path, dpi=DPI)
+
+
+def build_figures(names=None, force=False, workers=WORKERS, root="."):
+    """Redraw the figures and tables ``names`` (all by default) whose input
+    or parameters changed since they were last drawn, or all of them if
+    ``force`` is set; return the names of those redrawn.
+
+    ``root`` is the repository root, e.g. ".." when called from the paper.
+    """
+    names = list(FIGURES) + list(TABLES) if names is None else list(names)
+    unknown = [name for name in names if name not in FIGURES and name not in TABLES]
+    if unknown:
+        raise ValueError(f"unknown figure(s) or table(s) {unknown}; use some of {list(FIGURES) + list(TABLES)}")
+
+    cache = BuildCache(Path(root) / BUILD_CACHE)
+    stale = {}
+    for name in names:
+        name_fingerprint = artifact_fingerprint(name, root)
+        if force or not cache.is_fresh(f"figures/{name}", name_fingerprint, [artifact_path(name, root)]):
+            stale[name] = name_fingerprint
+
+    map_in_processes(render, [(name, root) for name in stale], workers)
+    for name, name_fingerprint in stale.items():
+        cache.record(f"figures/{name}", name_fingerprint)
+
+    return list(stale)
@@ -0,0 +1,74 @@
+"""Bounded-memory top-K ("heavy hitters") of the keys of a delay table.
+
+Counting the delays (or minutes) of every station or vehicle exactly needs
+memory for every key ever seen. A heavy-hitters sketch keeps a weight for
+at most ``capacity`` keys instead, using the mergeable version of the
+Misra-Gries summary: whenever it holds more keys than that, the
+``capacity + 1``-th largest weight is subtracted from every key, keys left
+with nothing are dropped, and the subtracted amount is added to the
+sketch's error. Every estimated weight is then at most the true weight and
+at least the true weight minus the error, and any key with more than
+``total / (capacity + 1)`` of the weight is guaranteed to be kept.
+
+A sketch is a DataFrame with the key column and a ``weight`` column, plus
+one row with a missing key holding the error, so sketches of separate
+pieces of a table (chunks, months) can be stored with the other partial
+aggregates and merged with ``merge_heavy_hitters`` in any order.
+"""
+
+import pandas as pd
+
+# Keys kept per sketch; far more than the number of stations or vehicles,
+# so in practice the sketches are exact
+CAPACITY = 1000
+
+
+def truncate(weights, error, capacity):
+    """Return the sketch of ``weights`` (a Series indexed by key) with at
+    most ``capacity`` keys, and ``error`` carried over from the pieces it
+    was built from."""
+    weights = weights[weights > 0]
+    if len(weights) > capacity:
+        threshold = weights.nlargest(capacity + 1).iloc[-1]
+        weights = weights[weights > threshold] - threshold
+        error += threshold
+
+    sketch = weights.rename("weight").reset_index()
+
+    # A row with a missing key (keeping the key's type where it can hold
+    # missing values) carries the error
+    remainder = sketch.iloc[:0].reindex([len(sketch)]).assign(weight=error)
+    return pd.concat([sketch, remainder])
+
+
+def heavy_hitters(keys, weights=None, capacity=CAPACITY):
+    """Return the sketch of ``keys`` (a Series; missing keys are ignored),
+    each weighted by ``weights`` or counted once."""
+    if weights is None:
+        weights = pd.Series(1, index=keys.index)
+
+    totals = weights.astype("int64").groupby(keys, observed=True).sum()
+    return truncate(totals, 0, capacity)
+
+
+def merge_heavy_hitters(sketches, capacity=CAPACITY):
+    """Combine the sketches of separate pieces of a table."""
+    stacked = pd.concat(list(sketches), ignore_index=True)
+    key = stacked.columns[0]
+
+    missing = stacked[key].isna()
+    totals = stacked[~missing].groupby(key, observed=True)["weight"].sum()
+    return truncate(totals, stacked.loc[missing, "weight"].sum(), capacity)
+
+
+def top_k(sketch, k):
+    """Return the ``k`` heaviest keys of ``sketch``, heaviest first, with
+    their estimated weight and the most it may be short of the true
+    weight."""
+    key = sketch.columns[0]
+    missing = sketch[key].isna()
+
+    top = sketch[~missing].sort_values(["weight", key], ascending=[False, True], kind="stable").head(k)
+    top = top.assign(max_error=sketch.loc[missing, "weight"].sum())
+    top.insert(0, "rank", range(1, len(top) + 1))
+    return top.reset_index(drop=True)
@@ -0,0 +1,198 @@
+"""Append-only ingestion of newly published months of delay data.
+
+Delay data is published monthly, but each download contains the whole
+year. ``ingest`` compares the number of raw rows of each month in the
+download with the number recorded when the month was stored in the
+partitioned store (see ``ttc_analysis.store``), and only cleans, groups
+and stores the months that are new or have grown since, e.g. a month that
+was only partly published when it was first ingested. Such a month is
+rewritten whole. New months are appended to the cleaned CSV exports; if a
+stored month was rewritten the exports are written again from the store.
+The partial aggregates and cube cells of each month (see
+``ttc_analysis.summarise`` and ``ttc_analysis.cube``) are stored next to its
+rows and the summaries and cubes are merged from them, without reading the
+history again. The subway clusters (see ``ttc_analysis.cascade``) of the
+lines with new rows are found again.
+The memory-mappable copy of each cleaned table (see
+``ttc_analysis.shared``) is republished from the partitions.
+
+The new months are independent of each other, so their rows and partial
+aggregates are written in separate processes (see ``ttc_analysis.parallel``).
+
+Use ``rebuild=True`` to drop the store and start over, e.g. after a
+published month was corrected without changing its number of rows.
+"""
+
+import shutil
+
+import pandas as pd
+
+from ttc_analysis.cascade import summarise_root_incidents, update_clusters
+from ttc_analysis.clean import (
+    DELAY_COLUMNS,
+    clean_bus_data,
+    clean_names,
+    clean_subway_codes,
+    clean_subway_data
+)
+from ttc_analysis.cube import MODE_CUBES, cube_partitions, write_partition_cube
+from ttc_analysis.download import download_raw_data, read_raw_data
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.parse_codes import (
+    classify_subway_codes,
+    group_bus_incidents,
+    group_subway_incidents,
+    validate_bus_incidents,
+    validate_grouped_data,
+    validate_ungrouped_subway_data
+)
+from ttc_analysis.paths import (
+    BUS_PARTITIONS,
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_DELAYS,
+    SUBWAY_DELAY_CLUSTERS,
+    SUBWAY_PARTITIONS
+)
+from ttc_analysis.shared import publish_table
+from ttc_analysis.store import (
+    append_csv,
+    csv_path,
+    partition_path,
+    read_partitions,
+    stored_partitions,
+    write_partition_table,
+    write_table
+)
+from ttc_analysis.summarise import save_summaries, summarise_partitions, write_partition_partials
+
+
+def raw_months(raw_data):
+    """Return the month of each row of a raw delay table."""
+    dates = clean_names(raw_data)["date"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format="%Y-%m-%d")
+    return dates.dt.to_period("M")
+
+
+def stored_raw_rows(directory, month):
+    """Return the number of raw rows the stored ``month`` was ingested from,
+    or None if it isn't stored (or was stored without the count)."""
+    path = partition_path(directory, month, "source")
+    if not path.exists() or not partition_path(directory, month).exists():
+        return None
+    return int(pd.read_parquet(path)["raw_rows"].iloc[0])
+
+
+def select_changed_months(raw_data, directory):
+    """Return the rows of ``raw_data`` of the months that aren't stored yet
+    or whose number of raw rows changed since they were stored, and the
+    number of raw rows of each of those months."""
+    months = raw_months(raw_data)
+    raw_rows = months.value_counts()
+    changed = raw_rows[[stored_raw_rows(directory, month) != rows for month, rows in raw_rows.items()]]
+    return raw_data[months.isin(changed.index)], changed
+
+
+def store_month(month_data, directory, month, mode, raw_rows):
+    """Store (or replace) the rows of one month and, next to them, their
+    partial aggregates, cube cells and the number of raw rows they came
+    from."""
+    write_partition_table(month_data, directory, month, "part-0")
+    write_partition_partials(month_data, directory, month, mode)
+    write_partition_cube(month_data, directory, month, mode)
+    write_partition_table(pd.DataFrame({"raw_rows": [raw_rows]}), directory, month, "source")
+
+
+def store_new_rows(grouped_data, raw_rows, directory, export_path, mode, workers=WORKERS):
+    """Store the grouped rows of new or changed months, bring their CSV
+    export up to date and save the ``mode`` summaries and cube."""
+    stored = stored_partitions(directory)
+    row_months = grouped_data["timestamp"].dt.to_period("M")
+    months = sorted(row_months.unique())
+    map_in_processes(
+        store_month,
+        [(grouped_data[row_months == month], directory, month, mode, raw_rows[month]) for month in months],
+        workers
+    )
+
+    if not stored or any(month in stored for month in months):
+        # Write the export again so it matches the store exactly
+        csv_path(export_path).unlink(missing_ok=True)
+        append_csv(read_partitions(directory), export_path)
+    else:
+        append_csv(grouped_data, export_path)
+    publish_table([partition_path(directory, month) for month in stored_partitions(directory)], export_path)
+    save_summaries(summarise_partitions(directory, mode, workers))
+    write_table(cube_partitions(directory, mode, workers), MODE_CUBES[mode])
+
+    return months
+
+
+def ingest_bus_data(raw_bus_data, workers=WORKERS):
+    """Ingest the months of bus data that are new or changed."""
+    new_bus_data, raw_rows = select_changed_months(raw_bus_data, BUS_PARTITIONS)
+    if new_bus_data.empty:
+        return []
+
+    cleaned_bus_data = clean_bus_data(new_bus_data)
+    validate_bus_incidents(cleaned_bus_data)
+    grouped_bus_data = group_bus_incidents(cleaned_bus_data)
+    validate_grouped_data(grouped_bus_data, "bus", whole_table=False)
+
+    return store_new_rows(
+        grouped_bus_data,
+        raw_rows,
+        BUS_PARTITIONS,
+        CLEANED_BUS_DELAYS,
+        "bus",
+        workers
+    )
+
+
+def ingest_subway_data(raw_subway_data, raw_subway_codes, workers=WORKERS):
+    """Ingest the months of subway data that are new or changed."""
+    new_subway_data, raw_rows = select_changed_months(raw_subway_data, SUBWAY_PARTITIONS)
+    if new_subway_data.empty:
+        return []
+
+    cleaned_subway_codes = classify_subway_codes(clean_subway_codes(raw_subway_codes))
+    cleaned_subway_data = clean_subway_data(new_subway_data)
+    validate_ungrouped_subway_data(cleaned_subway_data, cleaned_subway_codes)
+    grouped_subway_data = group_subway_incidents(cleaned_subway_data, cleaned_subway_codes)
+    validate_grouped_data(grouped_subway_data, "subway", whole_table=False)
+
+    months = store_new_rows(
+        grouped_subway_data,
+        raw_rows,
+        SUBWAY_PARTITIONS,
+        CLEANED_SUBWAY_DELAYS,
+        "subway",
+        workers
+    )
+
+    # Clusters can run across months, so the lines with new rows are swept
+    # again over their whole history
+    lines = grouped_subway_data["line"].dropna().unique().tolist()
+    clusters = update_clusters(SUBWAY_PARTITIONS, SUBWAY_DELAY_CLUSTERS, lines)
+    write_table(clusters, SUBWAY_DELAY_CLUSTERS, export_csv=True)
+    save_summaries({"subway_cascades_by_root_incident": summarise_root_incidents(clusters)})
+
+    return months
+
+
+def ingest(download=True, rebuild=False, workers=WORKERS):
+    """Add newly published (or since grown) months to the store, exports
+    and summaries, handling up to ``workers`` months at a time.
+
+    Returns the months that were added or rewritten, per dataset.
+    """
+    if rebuild:
+        for directory in (BUS_PARTITIONS, SUBWAY_PARTITIONS):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    raw = download_raw_data(columns=DELAY_COLUMNS) if download else read_raw_data()
+
+    return {
+        "bus": ingest_bus_data(raw["bus_delays"], workers),
+        "subway": ingest_subway_data(raw["subway_delays"], raw["subway_codes"], workers)
+    }
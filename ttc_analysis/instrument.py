@@ -0,0 +1,330 @@
+"""Timing, memory and row-count instrumentation of the pipeline steps.
+
+Instrumentation is switched on with the ``TTC_INSTRUMENT`` environment
+variable, e.g. ``TTC_INSTRUMENT=1 python scripts/03-parse_codes.py``. Every
+load, transform, merge, group-by, validation and write of the pipeline then
+records a span: its wall time (and the time spent in it outside nested
+spans), its rows in and out, and the resident memory of the process when it
+ends. When the process exits, a JSON report of the run is written to
+``REPORT_DIR/<script or command>.json`` (or to ``TTC_INSTRUMENT`` itself if
+it names a ``.json`` file) and a summary per step is printed.
+
+``TTC_PROFILE`` adds a profile of the whole run to the report:
+``cprofile`` runs it under ``cProfile`` (and saves the stats next to the
+report, for ``pstats`` or snakeviz), ``sample`` samples the stack of the
+main thread every ``SAMPLE_INTERVAL`` seconds, which costs much less.
+
+Without ``TTC_INSTRUMENT`` nothing is recorded: ``instrumented`` returns the
+functions it decorates unchanged and ``span`` returns a shared object that
+does nothing.
+"""
+
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from inspect import isgeneratorfunction
+from pathlib import Path
+
+import pandas as pd
+
+from ttc_analysis.paths import REPORT_DIR
+
+# Where to write the run report, or None if instrumentation is off
+INSTRUMENT = os.environ.get("TTC_INSTRUMENT") or None
+ENABLED = INSTRUMENT is not None
+
+# "cprofile", "sample" or None
+PROFILE = os.environ.get("TTC_PROFILE") or None
+
+# Seconds between stack samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+# Frames listed in the profile section of the report
+PROFILE_TOP = 25
+
+# Spans recorded so far in this process, in the order they ended
+SPANS = []
+
+# Spans currently open, innermost last
+_open = []
+
+
+def rss_mb():
+    """Return the current resident memory of the process in MiB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of the process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def rows(value):
+    """Return the number of rows of a DataFrame or Series, or None."""
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+
+class Span:
+    """One timed step; set ``rows_out`` before it ends to record it."""
+
+    def __init__(self, name, kind, rows_in=None):
+        self.name = name
+        self.kind = kind
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.children_seconds = 0.0
+
+    def __enter__(self):
+        self.parent = _open[-1] if _open else None
+        _open.append(self)
+        self.rss_before = rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        _open.pop()
+        if self.parent is not None:
+            self.parent.children_seconds += seconds
+
+        rss_after = rss_mb()
+        SPANS.append({
+            "name": self.name,
+            "kind": self.kind,
+            "parent": self.parent.name if self.parent is not None else None,
+            "pid": os.getpid(),
+            "start": self.start - STARTED,
+            "seconds": seconds,
+            "self_seconds": seconds - self.children_seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rss_mb": rss_after,
+            "rss_change_mb": None if rss_after is None or self.rss_before is None else rss_after - self.rss_before,
+            "peak_rss_mb": peak_rss_mb()
+        })
+
+
+class NullSpan:
+    """Stand-in for ``Span`` when instrumentation is off."""
+
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, kind, rows_in=None):
+    """Return a context manager timing the step ``name`` of ``kind``
+    ("load", "transform", "merge", "groupby", "validate" or "write")."""
+    return Span(name, kind, rows_in) if ENABLED else NULL_SPAN
+
+
+def instrumented(kind, name=None):
+    """Decorate a step of ``kind`` so each call is recorded as a span, with
+    the rows of its first argument and of its result.
+
+    A generator of chunks is recorded one chunk at a time, each span
+    covering only the time taken to produce that chunk. Without
+    instrumentation the function is returned as it is.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        span_name = name or f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+        if isgeneratorfunction(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                return timed_chunks(function(*args, **kwargs), span_name, kind)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with Span(span_name, kind, rows(args[0]) if args else None) as step:
+                    result = function(*args, **kwargs)
+                    step.rows_out = rows(result)
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def timed_chunks(chunks, name, kind):
+    """Yield from ``chunks``, recording the production of each as a span."""
+    while True:
+        with Span(name, kind) as step:
+            chunk = next(chunks, None)
+            step.rows_out = rows(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def collect(function, *args):
+    """Return ``function(*args)`` and the spans recorded while it ran, for
+    passing spans recorded in worker processes back to the parent (see
+    ``ttc_analysis.parallel``)."""
+    first = len(SPANS)
+    result = function(*args)
+    spans = SPANS[first:]
+    del SPANS[first:]
+    return result, spans
+
+
+def summarise_spans(spans):
+    """Return the calls, total and self time, rows and peak memory of each
+    step."""
+    table = pd.DataFrame(spans)
+    if table.empty:
+        return table
+
+    def total(values):
+        return values.sum(min_count=1)
+
+    steps = (
+        table
+        .groupby(["name", "kind"], sort=False)
+        .agg(
+            calls=("seconds", "size"),
+            seconds=("seconds", "sum"),
+            self_seconds=("self_seconds", "sum"),
+            rows_in=("rows_in", total),
+            rows_out=("rows_out", total),
+            peak_rss_mb=("peak_rss_mb", "max")
+        )
+        .sort_values("self_seconds", ascending=False)
+        .reset_index()
+    )
+    return steps.astype({"rows_in": "Int64", "rows_out": "Int64"})
+
+
+def report_path():
+    """Return where the report of this process is written."""
+    if INSTRUMENT.endswith(".json"):
+        return Path(INSTRUMENT)
+
+    # Named after the script, or e.g. "ttc_analysis-run" for python -m
+    entry = Path(sys.argv[0])
+    name = entry.stem
+    if name == "__main__":
+        name = "-".join([entry.parent.name, *sys.argv[1:2]])
+    return REPORT_DIR / f"{name}.json"
+
+
+class StackSampler(threading.Thread):
+    """Count the functions on the main thread's stack every ``interval``
+    seconds."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.main = threading.main_thread().ident
+        self.samples = 0
+        self.leaf = Counter()
+        self.inclusive = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.main)
+            if frame is None:
+                continue
+
+            self.samples += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                where = f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+                if leaf:
+                    self.leaf[where] += 1
+                    leaf = False
+                if where not in seen:
+                    self.inclusive[where] += 1
+                    seen.add(where)
+                frame = frame.f_back
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "self": [{"function": where, "share": n / self.samples} for where, n in self.leaf.most_common(PROFILE_TOP)],
+            "cumulative": [{"function": where, "share": n / self.samples} for where, n in self.inclusive.most_common(PROFILE_TOP)]
+        } if self.samples else {"interval": self.interval, "samples": 0}
+
+
+def cprofile_report(profiler, path):
+    """Save the stats of ``profiler`` to ``path`` and return its top
+    functions by cumulative time."""
+    profiler.disable()
+    profiler.dump_stats(path)
+
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return {"stats": str(path), "top": text.getvalue().splitlines()}
+
+
+def write_report():
+    """Write the run report of this process and print its summary."""
+    path = report_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    steps = summarise_spans(SPANS)
+    report = {
+        "command": sys.argv,
+        "seconds": time.perf_counter() - STARTED,
+        "peak_rss_mb": peak_rss_mb(),
+        "steps": steps.to_dict("records"),
+        "spans": SPANS
+    }
+    if isinstance(profiler, cProfile.Profile):
+        report["profile"] = cprofile_report(profiler, path.with_suffix(".prof"))
+    elif isinstance(profiler, StackSampler):
+        report["profile"] = profiler.stop()
+
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(f"\nRun report ({report['seconds']:.2f}s, peak {report['peak_rss_mb']:.0f} MiB), saved to {path}:", file=sys.stderr)
+    if not steps.empty:
+        print(steps.to_string(index=False, float_format="{:.3f}".format), file=sys.stderr)
+
+
+STARTED = time.perf_counter()
+profiler = None
+
+if ENABLED:
+    if PROFILE == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif PROFILE == "sample":
+        profiler = StackSampler()
+        profiler.start()
+    elif PROFILE is not None:
+        raise ValueError(f"unknown TTC_PROFILE {PROFILE!r}; use cprofile or sample")
+
+    atexit.register(write_report)
@@ -0,0 +1,136 @@
+"""Map free-text label columns (lines, bus incidents) to canonical labels.
+
+A raw label column has a handful of distinct spellings repeated over
+every row, and new spellings keep appearing ("YU/BD", "YU / BD", "yu & bd",
+"BD LINE 2"). A ``Normaliser`` factorises the column, works out the label
+of each distinct spelling once and spreads the labels back over the rows
+through the integer codes, so the work grows with the number of spellings
+rather than rows.
+
+A spelling is first folded (``fold``: upper case, single spaces, hyphens
+as spaces and any ``/``, ``&``, ``+`` or ``,`` as a single ``/``) and then
+looked up in the normaliser's aliases (whose keys are folded the same
+way), then matched against its patterns (regular expressions on the
+folded spelling, tried in order). Spellings matching neither are
+unmapped: they get the default label (or stay missing), and ``mapped``
+flags them for the validation warnings that report them (see the
+``mapped_by`` rule of ``ttc_analysis.validate``).
+
+The label of every spelling seen is kept across runs in
+``NORMALISE_CACHE_DIR/<name>.json``, and thrown away whenever the aliases,
+patterns, default or this module change.
+"""
+
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis import cache
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.paths import NORMALISE_CACHE_DIR
+
+# Runs of separators between the parts of a label, e.g. "YU / BD", "YU&BD"
+SEPARATORS = re.compile(r"\s*[/&+,]\s*")
+HYPHENS = re.compile(r"\s*-\s*")
+
+
+def fold(spelling):
+    """Return the folded form of a spelling, ignoring case, spacing and
+    the choice of separator."""
+    text = HYPHENS.sub(" ", str(spelling).upper())
+    text = SEPARATORS.sub("/", " ".join(text.split()))
+    return text.strip("/")
+
+
+class Normaliser:
+    """Map the spellings of a label column to ``aliases`` (raw spelling to
+    label) or ``patterns`` (regular expression to label), or ``default``."""
+
+    def __init__(self, name, aliases, patterns=None, default=None, directory=NORMALISE_CACHE_DIR):
+        self.name = name
+        self.default = default
+        self.patterns = [(re.compile(pattern), label) for pattern, label in (patterns or {}).items()]
+
+        self.aliases = {}
+        for spelling, label in aliases.items():
+            key = fold(spelling)
+            if self.aliases.get(key, label) != label:
+                raise ValueError(f"{name} aliases map {key!r} to both {self.aliases[key]!r} and {label!r}")
+            self.aliases[key] = label
+
+        self.path = Path(directory) / f"{name}.json"
+        self.rules = cache.fingerprint(modules=[sys.modules[__name__]], params={
+            "aliases": aliases,
+            "patterns": patterns,
+            "default": default
+        })
+        self.labels = None
+
+    def load(self):
+        """Read the labels of the spellings seen by earlier runs, unless the
+        rules have changed since."""
+        self.labels = {}
+        if self.path.exists():
+            stored = json.loads(self.path.read_text())
+            if stored.get("rules") == self.rules:
+                self.labels = stored["labels"]
+
+    def save(self):
+        """Write the labels of every spelling seen so far."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps({"rules": self.rules, "labels": self.labels}, indent=2, sort_keys=True))
+        os.replace(temporary, self.path)
+
+    def label(self, spelling):
+        """Return the label of one spelling, or None if it is unmapped."""
+        key = fold(spelling)
+        if key in self.aliases:
+            return self.aliases[key]
+        for pattern, label in self.patterns:
+            if pattern.search(key):
+                return label
+        return None
+
+    def lookup(self, spellings):
+        """Return the labels (None if unmapped) of distinct spellings, from
+        the cache where they've been seen before."""
+        if self.labels is None:
+            self.load()
+
+        new = [str(spelling) for spelling in spellings if str(spelling) not in self.labels]
+        if new:
+            self.labels.update({spelling: self.label(spelling) for spelling in new})
+            self.save()
+        return [self.labels[str(spelling)] for spelling in spellings]
+
+    def mapped(self, values):
+        """Return whether each (non-missing) value of a Series has a label."""
+        codes, uniques = pd.factorize(values)
+        known = np.append(np.array([label is not None for label in self.lookup(uniques)], dtype=bool), True)
+        return pd.Series(known[codes], index=values.index, name=values.name)
+
+    @instrumented("transform", "normalise.labels")
+    def __call__(self, values):
+        """Return the labels of a Series of spellings as a categorical, with
+        the default for missing and unmapped spellings."""
+        codes, uniques = pd.factorize(values)
+        labels = self.lookup(uniques)
+
+        # Codes of the labels of the distinct spellings, plus the default for
+        # missing values (code -1, picking the last entry); categories are
+        # sorted, as the schema would sort them
+        labels = [self.default if label is None else label for label in labels] + [self.default]
+        categories = sorted({label for label in labels if label is not None})
+        positions = {label: position for position, label in enumerate(categories)}
+        label_codes = np.array([positions.get(label, -1) for label in labels])
+        return pd.Series(
+            pd.Categorical.from_codes(label_codes[codes], categories=categories),
+            index=values.index,
+            name=values.name
+        )
@@ -0,0 +1,49 @@
+"""Run independent pieces of work in a pool of processes.
+
+The bus and subway branches of the pipeline, and the months of the
+partitioned store, don't depend on each other. ``map_in_processes`` runs
+them in up to ``WORKERS`` processes and returns their results in the order
+they were submitted, so the merged output doesn't depend on which process
+finishes first.
+
+The number of workers defaults to the number of CPUs and can be set with
+the ``TTC_WORKERS`` environment variable or the ``--workers`` option of
+``python -m ttc_analysis``. With one worker everything runs in the calling
+process. Spans recorded by ``ttc_analysis.instrument`` in the workers are
+passed back and added to the calling process's run report.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from ttc_analysis import instrument
+
+# Number of worker processes
+WORKERS = int(os.environ["TTC_WORKERS"]) if os.environ.get("TTC_WORKERS") else os.cpu_count()
+
+
+def map_in_processes(function, arguments, workers=WORKERS):
+    """Return ``[function(*args) for args in arguments]``, computed in up to
+    ``workers`` processes.
+
+    ``function`` and its arguments must be picklable (e.g. a module-level
+    function and DataFrames).
+    """
+    arguments = list(arguments)
+    workers = min(workers or 1, len(arguments))
+
+    if workers <= 1:
+        return [function(*args) for args in arguments]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if not instrument.ENABLED:
+            futures = [pool.submit(function, *args) for args in arguments]
+            return [future.result() for future in futures]
+
+        futures = [pool.submit(instrument.collect, function, *args) for args in arguments]
+        results = []
+        for future in futures:
+            result, spans = future.result()
+            instrument.SPANS.extend(spans)
+            results.append(result)
+        return results
@@ -0,0 +1,196 @@
+"""Group delay data into similar sets of incidents (see 03-parse_codes)."""
+
+from ttc_analysis.classify import compile_prefix_rules
+from ttc_analysis.clean import CLEANED_CONSTRAINTS
+from ttc_analysis.instrument import instrumented, span
+from ttc_analysis.normalise import Normaliser
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.validate import validate
+
+VALID_INCIDENTS = {"Equipment/Mechanical", "Miscellaneous", "Operator", "Security/Safety"}
+
+# Group bus incidents
+BUS_INCIDENT_MAP = {
+    "Diversion": "Miscellaneous",
+    "Security": "Security/Safety",
+    "Cleaning - Unsanitary": "Security/Safety",
+    "Emergency Services": "Security/Safety",
+    "Collision - TTC": "Operator",
+    "Mechanical": "Equipment/Mechanical",
+    "Operations - Operator": "Operator",
+    "Investigation": "Security/Safety",
+    "Utilized Off Route": "Miscellaneous",
+    "General Delay": "Miscellaneous",
+    "Road Blocked - NON-TTC Collision": "Miscellaneous",
+    "Held By": "Miscellaneous",
+    "Vision": "Security/Safety"
+}
+
+# Clean up line data
+LINE_MAP = {
+    "YU": "Yonge-University",
+    "YUS": "Yonge-University",
+    "BD": "Bloor-Danforth",
+    "BD LINE 2": "Bloor-Danforth",
+    "SRT": "Scarborough-RT",
+    "SHP": "Sheppard",
+    "YU / BD": "Yonge-University/Bloor-Danforth",
+    "BD/YU": "Yonge-University/Bloor-Danforth",
+    "YU/BD": "Yonge-University/Bloor-Danforth",
+    "YUS/BD": "Yonge-University/Bloor-Danforth",
+    "YU & BD": "Yonge-University/Bloor-Danforth",
+    "BLOOR DANFORTH & YONGE": "Yonge-University/Bloor-Danforth"
+}
+
+# Lines written out by number, for spellings not in LINE_MAP (matched
+# against the folded spelling, see ttc_analysis/normalise.py)
+LINE_PATTERNS = {
+    r"\bLINE 1\b": "Yonge-University",
+    r"\bLINE 2\b": "Bloor-Danforth",
+    r"\bLINE 3\b": "Scarborough-RT",
+    r"\bLINE 4\b": "Sheppard"
+}
+
+# Bus incidents and lines are looked up ignoring case, spacing and
+# separators, once per distinct spelling; lines matching nothing are "Other"
+normalise_bus_incident = Normaliser("bus_incident", BUS_INCIDENT_MAP)
+normalise_line = Normaliser("line", LINE_MAP, LINE_PATTERNS, default="Other")
+
+
+# Constraints on the grouped delay tables (see ttc_analysis/validate.py):
+# those of the cleaned tables, plus the incident groups (missing where a
+# bus incident has no group) and lines
+GROUPED_CONSTRAINTS = {
+    "bus": {
+        **CLEANED_CONSTRAINTS["bus"],
+        "incident": {"dtype": "category", "values": VALID_INCIDENTS}
+    },
+    "subway": {
+        **CLEANED_CONSTRAINTS["subway"],
+        "incident": {"dtype": "category", "values": VALID_INCIDENTS, "required": True},
+        "line": {"dtype": "category", "values": {*LINE_MAP.values(), "Other"}, "required": True}
+    }
+}
+
+# Bus incidents that BUS_INCIDENT_MAP groups; delays with any other are
+# kept with a missing incident, so they are reported as warnings
+BUS_INCIDENT_CONSTRAINTS = {
+    "incident": {"mapped_by": normalise_bus_incident, "required": True, "severity": "warning"}
+}
+
+
+def ungrouped_subway_constraints(subway_codes):
+    """Return constraints flagging (as warnings) the subway delays without
+    a code from ``subway_codes``, which ``group_subway_incidents`` drops,
+    and those whose line isn't in LINE_MAP or LINE_PATTERNS (so is
+    "Other")."""
+    return {
+        "code": {"values": set(subway_codes["code"].dropna()), "required": True, "severity": "warning"},
+        "line": {"mapped_by": normalise_line, "severity": "warning"}
+    }
+
+
+# Section subway codes into incident groups by prefix; the longest matching
+# prefix wins (so "MUD"/"MUE" take precedence over any shorter "MU" rule) and
+# codes matching none are "Miscellaneous"
+SUBWAY_INCIDENT_RULES = {
+    "E": "Equipment/Mechanical",
+    "MUI": "Security/Safety",
+    "MUS": "Security/Safety",
+    "MUP": "Security/Safety",
+    "MUD": "Equipment/Mechanical",
+    "MUE": "Equipment/Mechanical",
+    "P": "Equipment/Mechanical",
+    "S": "Security/Safety",
+    "T": "Operator"
+}
+
+classify_subway_incident = compile_prefix_rules(SUBWAY_INCIDENT_RULES, default="Miscellaneous")
+
+
+@instrumented("transform")
+def group_bus_incidents(bus_delay_data):
+    """Replace the bus incident descriptions with their incident group."""
+    cleaned_bus_delay_data = bus_delay_data.copy()
+    cleaned_bus_delay_data["incident"] = normalise_bus_incident(cleaned_bus_delay_data["incident"])
+
+    return apply_schema(cleaned_bus_delay_data)
+
+
+@instrumented("transform")
+def classify_subway_codes(subway_codes):
+    """Add the incident group of each subway delay code."""
+    cleaned_subway_codes = subway_codes.copy()
+    cleaned_subway_codes["incident"] = classify_subway_incident(cleaned_subway_codes["code"])
+
+    return apply_schema(cleaned_subway_codes)
+
+
+@instrumented("transform")
+def group_subway_incidents(subway_delay_data, subway_codes):
+    """Attach incident groups to the subway delays and clean up line names."""
+    # Keep only delays with a code from the code table and classify their
+    # codes directly, rather than merging in the classified code table
+    with span("parse_codes.match_codes", "merge", len(subway_delay_data)) as step:
+        known_code = subway_delay_data["code"].isin(subway_codes["code"])
+        cleaned_subway_delay_data = subway_delay_data[known_code].assign(
+            incident=lambda df: classify_subway_incident(df["code"])
+        )
+        step.rows_out = len(cleaned_subway_delay_data)
+
+    # Select and reorder relevant columns
+    cleaned_subway_delay_data = cleaned_subway_delay_data[[
+        "timestamp",
+        "day",
+        "incident",
+        "min_delay",
+        "min_gap",
+        "line",
+        "station",
+        "bound",
+        "vehicle"
+    ]]
+
+    # Map line names to their line, and anything else to "Other"
+    cleaned_subway_delay_data["line"] = normalise_line(cleaned_subway_delay_data["line"])
+
+    # Sort data by date and time (stable, so delays at the same minute keep
+    # their order)
+    cleaned_subway_delay_data = cleaned_subway_delay_data.sort_values(by="timestamp", kind="stable")
+
+    return apply_schema(cleaned_subway_delay_data)
+
+
+def grouped_constraints(mode, all_incidents=False):
+    """Return the constraints on a grouped ``mode`` table, with every
+    incident group required to occur if ``all_incidents``."""
+    constraints = GROUPED_CONSTRAINTS[mode]
+    if all_incidents:
+        constraints = {**constraints, "incident": {**constraints["incident"], "all_occur": True}}
+    return constraints
+
+
+def validate_grouped_data(grouped_data, mode, all_incidents=False, whole_table=True):
+    """Check a grouped ``mode`` ("bus" or "subway") table, or only part of
+    it unless ``whole_table``, against ``GROUPED_CONSTRAINTS`` (with every
+    incident group required to occur if ``all_incidents``); return the
+    report."""
+    return validate(
+        grouped_data,
+        grouped_constraints(mode, all_incidents),
+        f"grouped {mode} delays",
+        whole_table=whole_table
+    )
+
+
+def validate_bus_incidents(bus_delay_data):
+    """Warn about bus delays whose incident ``group_bus_incidents`` can't
+    group; return the report."""
+    return validate(bus_delay_data, BUS_INCIDENT_CONSTRAINTS, "bus incidents")
+
+
+def validate_ungrouped_subway_data(subway_delay_data, subway_codes):
+    """Warn about the subway delays ``group_subway_incidents`` drops for
+    not having a code from ``subway_codes``, or whose line it can't map;
+    return the report."""
+    return validate(subway_delay_data, ungrouped_subway_constraints(subway_codes), "ungrouped subway delays")
@@ -0,0 +1,72 @@
+"""Data locations used by the pipeline, relative to the repository root.
+
+Table paths without a suffix are read and written through
+``ttc_analysis.store``, which adds ``.parquet`` (and ``.csv`` on export).
+"""
+
+from pathlib import Path
+
+INPUT_DATA_DIR = Path("inputs/data")
+OUTPUT_DATA_DIR = Path("outputs/data")
+SUMMARY_DIR = OUTPUT_DATA_DIR / "summaries"
+
+# Copy of the data directories with simulated raw tables, written by
+# 00-simulate_data (see ttc_analysis.simulate)
+SIMULATION_DIR = Path("simulation")
+
+# Simulated data and results of ``python -m ttc_analysis benchmark`` (see
+# ttc_analysis.benchmark)
+BENCHMARK_DIR = Path("benchmarks")
+BENCHMARK_RESULTS = BENCHMARK_DIR / "results.json"
+
+# Run reports written when TTC_INSTRUMENT is set (see ttc_analysis.instrument)
+REPORT_DIR = Path("reports")
+
+# Fingerprints of the last successful run of each step (see ttc_analysis.cache)
+BUILD_CACHE = Path(".build_cache.json")
+
+# Labels of the spellings of each normalised label column, kept between
+# runs (see ttc_analysis.normalise)
+NORMALISE_CACHE_DIR = Path(".normalise_cache")
+
+# Downloaded workbooks, cached by URL (see ttc_analysis.download)
+DOWNLOAD_CACHE_DIR = INPUT_DATA_DIR / "downloads"
+
+# Raw downloads, saved as CSV by 01-download_data
+RAW_SUBWAY_CODES = INPUT_DATA_DIR / "raw_subway_delay_codes.csv"
+RAW_SUBWAY_DELAYS = INPUT_DATA_DIR / "raw_subway_delay_statistics.csv"
+RAW_BUS_DELAYS = INPUT_DATA_DIR / "raw_bus_delay_statistics.csv"
+
+# Selected but not mutated tables, written by 02-clean_data
+BUS_DELAYS = INPUT_DATA_DIR / "bus_delay_statistics"
+SUBWAY_DELAYS = INPUT_DATA_DIR / "subway_delay_statistics"
+FILTERED_SUBWAY_DELAYS = INPUT_DATA_DIR / "filtered_subway_delay_statistics"
+SUBWAY_CODES = INPUT_DATA_DIR / "subway_delay_codes"
+
+# Cleaned tables, written by 03-parse_codes
+CLEANED_BUS_DELAYS = OUTPUT_DATA_DIR / "cleaned_bus_delay_statistics"
+CLEANED_SUBWAY_DELAYS = OUTPUT_DATA_DIR / "cleaned_subway_delay_statistics"
+CLEANED_SUBWAY_CODES = OUTPUT_DATA_DIR / "cleaned_subway_codes"
+
+# Rollup cubes of the cleaned tables, written by 04-summarise_data (see
+# ttc_analysis.cube)
+BUS_CUBE = OUTPUT_DATA_DIR / "bus_delay_cube"
+SUBWAY_CUBE = OUTPUT_DATA_DIR / "subway_delay_cube"
+
+# Clusters of knock-on subway delays, written by 05-find_incident_clusters
+# (see ttc_analysis.cascade)
+SUBWAY_DELAY_CLUSTERS = OUTPUT_DATA_DIR / "subway_delay_clusters"
+
+# Figures and tables of the paper, drawn from the summaries by ``python -m
+# ttc_analysis figures`` (see ttc_analysis.figures)
+FIGURE_DIR = Path("outputs/figures")
+
+# Cleaned tables partitioned by year/month, maintained by ``python -m
+# ttc_analysis ingest`` (see ttc_analysis.incremental)
+PARTITION_DIR = OUTPUT_DATA_DIR / "partitions"
+BUS_PARTITIONS = PARTITION_DIR / "bus_delays"
+SUBWAY_PARTITIONS = PARTITION_DIR / "subway_delays"
+
+# Cleaned tables sorted by timestamp, with bitmaps of their lines, incidents
+# and days, for ``python -m ttc_analysis query`` (see ttc_analysis.query)
+INDEX_DIR = OUTPUT_DATA_DIR / "index"
@@ -0,0 +1,287 @@
+"""Run download, clean, parse_codes and summarise in a single process.
+
+The numbered scripts hand their results to each other through files on
+disk. ``run`` chains the same steps as functions and passes the DataFrames
+directly from one step to the next, only saving the artifacts asked for.
+
+Bus and subway data go through independent branches, which run in
+separate processes (see ``ttc_analysis.parallel``). Each branch is
+fingerprinted (see ``ttc_analysis.cache``) and skipped when its raw data,
+code, parameters and requested artifacts are unchanged since the last run.
+"""
+
+import sys
+
+from ttc_analysis import (
+    cascade,
+    classify,
+    clean,
+    cube,
+    download,
+    heavy_hitters,
+    instrument,
+    normalise,
+    parse_codes,
+    schema,
+    shared,
+    store,
+    stream,
+    summarise,
+    validate,
+    xlsx
+)
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.cascade import CLUSTER_COLUMNS, WINDOW, cluster_delays, summarise_clusters, summarise_root_incidents
+from ttc_analysis.clean import (
+    DELAY_COLUMNS,
+    clean_bus_data,
+    clean_subway_codes,
+    clean_subway_data,
+    filter_subway_data,
+    validate_cleaned_data
+)
+from ttc_analysis.cube import compute_cube
+from ttc_analysis.download import download_raw_data, read_raw_data, save_raw_data
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.parse_codes import (
+    BUS_INCIDENT_MAP,
+    LINE_MAP,
+    LINE_PATTERNS,
+    SUBWAY_INCIDENT_RULES,
+    classify_subway_codes,
+    group_bus_incidents,
+    group_subway_incidents,
+    validate_bus_incidents,
+    validate_grouped_data,
+    validate_ungrouped_subway_data
+)
+from ttc_analysis.paths import (
+    BUS_CUBE,
+    BUS_DELAYS,
+    CLEANED_BUS_DELAYS,
+    CLEANED_SUBWAY_CODES,
+    CLEANED_SUBWAY_DELAYS,
+    FILTERED_SUBWAY_DELAYS,
+    SUBWAY_CODES,
+    SUBWAY_CUBE,
+    SUBWAY_DELAY_CLUSTERS,
+    SUBWAY_DELAYS,
+    SUMMARY_DIR
+)
+from ttc_analysis.shared import publish_table
+from ttc_analysis.store import columns_path, csv_path, parquet_path, write_table
+from ttc_analysis.summarise import save_summaries, summarise_bus_data, summarise_subway_data
+
+# Artifacts that can be saved, in pipeline order
+ARTIFACTS = ("raw", "intermediate", "cleaned", "summaries")
+
+# What the paper reads
+DEFAULT_ARTIFACTS = ("cleaned", "summaries")
+
+# Modules whose source is part of every branch fingerprint: the pipeline
+# itself and the modules it reads, parses, transforms and writes with
+PIPELINE_MODULES = (
+    sys.modules[__name__],
+    cascade,
+    classify,
+    clean,
+    cube,
+    download,
+    heavy_hitters,
+    instrument,
+    normalise,
+    parse_codes,
+    schema,
+    shared,
+    store,
+    stream,
+    summarise,
+    validate,
+    xlsx
+)
+
+# Files written for each artifact, per branch (raw files are always
+# written together by save_raw_data, so they aren't tracked per branch)
+BRANCH_OUTPUTS = {
+    "bus": {
+        "intermediate": [parquet_path(BUS_DELAYS)],
+        "cleaned": [
+            parquet_path(CLEANED_BUS_DELAYS),
+            csv_path(CLEANED_BUS_DELAYS),
+            columns_path(CLEANED_BUS_DELAYS) / "schema.json"
+        ],
+        "summaries": [
+            SUMMARY_DIR / "avg_num_bus_delays_by_day.csv",
+            SUMMARY_DIR / "total_bus_delay_time_by_date.csv",
+            SUMMARY_DIR / "total_num_bus_delays_by_incident.csv",
+            SUMMARY_DIR / "bus_delays_by_hour.csv",
+            SUMMARY_DIR / "bus_peak_periods.csv",
+            SUMMARY_DIR / "bus_delay_quantiles_by_date.csv",
+            SUMMARY_DIR / "bus_delay_quantiles_by_day.csv",
+            SUMMARY_DIR / "bus_delay_quantiles_by_incident.csv",
+            parquet_path(BUS_CUBE)
+        ]
+    },
+    "subway": {
+        "intermediate": [
+            parquet_path(SUBWAY_DELAYS),
+            parquet_path(FILTERED_SUBWAY_DELAYS),
+            parquet_path(SUBWAY_CODES)
+        ],
+        "cleaned": [
+            parquet_path(CLEANED_SUBWAY_DELAYS),
+            csv_path(CLEANED_SUBWAY_DELAYS),
+            columns_path(CLEANED_SUBWAY_DELAYS) / "schema.json",
+            parquet_path(CLEANED_SUBWAY_CODES),
+            csv_path(CLEANED_SUBWAY_CODES)
+        ],
+        "summaries": [
+            SUMMARY_DIR / "avg_num_subway_delays_by_day.csv",
+            SUMMARY_DIR / "total_subway_delay_time_by_date.csv",
+            SUMMARY_DIR / "total_num_subway_delays_by_incident.csv",
+            SUMMARY_DIR / "total_num_subway_delays_by_line.csv",
+            SUMMARY_DIR / "subway_delays_by_hour.csv",
+            SUMMARY_DIR / "subway_peak_periods.csv",
+            SUMMARY_DIR / "subway_delay_quantiles_by_date.csv",
+            SUMMARY_DIR / "subway_delay_quantiles_by_day.csv",
+            SUMMARY_DIR / "subway_delay_quantiles_by_incident.csv",
+            SUMMARY_DIR / "subway_delay_quantiles_by_line.csv",
+            SUMMARY_DIR / "subway_top_stations.csv",
+            SUMMARY_DIR / "subway_top_vehicles.csv",
+            SUMMARY_DIR / "subway_cascades_by_root_incident.csv",
+            parquet_path(SUBWAY_CUBE),
+            parquet_path(SUBWAY_DELAY_CLUSTERS),
+            csv_path(SUBWAY_DELAY_CLUSTERS)
+        ]
+    }
+}
+
+
+def run_bus_branch(raw_bus_data, save):
+    """Clean, group and summarise the bus data; return its summaries."""
+    cleaned_bus_data = clean_bus_data(raw_bus_data)
+    validate_cleaned_data(cleaned_bus_data, "bus")
+    if "intermediate" in save:
+        write_table(cleaned_bus_data, BUS_DELAYS)
+
+    validate_bus_incidents(cleaned_bus_data)
+    grouped_bus_data = group_bus_incidents(cleaned_bus_data)
+    validate_grouped_data(grouped_bus_data, "bus")
+    if "cleaned" in save:
+        write_table(grouped_bus_data, CLEANED_BUS_DELAYS, export_csv=True)
+        publish_table([parquet_path(CLEANED_BUS_DELAYS)], CLEANED_BUS_DELAYS)
+
+    summaries = summarise_bus_data(grouped_bus_data)
+    if "summaries" in save:
+        save_summaries(summaries)
+        write_table(compute_cube(grouped_bus_data, "bus"), BUS_CUBE)
+
+    return summaries
+
+
+def run_subway_branch(raw_subway_data, raw_subway_codes, save):
+    """Clean, group and summarise the subway data; return its summaries."""
+    cleaned_subway_data = clean_subway_data(raw_subway_data)
+    validate_cleaned_data(cleaned_subway_data, "subway")
+    subway_codes = clean_subway_codes(raw_subway_codes)
+    if "intermediate" in save:
+        write_table(cleaned_subway_data, SUBWAY_DELAYS)
+        write_table(filter_subway_data(cleaned_subway_data), FILTERED_SUBWAY_DELAYS, export_csv=True)
+        write_table(subway_codes, SUBWAY_CODES)
+
+    cleaned_subway_codes = classify_subway_codes(subway_codes)
+    validate_ungrouped_subway_data(cleaned_subway_data, cleaned_subway_codes)
+    grouped_subway_data = group_subway_incidents(cleaned_subway_data, cleaned_subway_codes)
+    validate_grouped_data(grouped_subway_data, "subway", all_incidents=True)
+    if "cleaned" in save:
+        write_table(grouped_subway_data, CLEANED_SUBWAY_DELAYS, export_csv=True)
+        publish_table([parquet_path(CLEANED_SUBWAY_DELAYS)], CLEANED_SUBWAY_DELAYS)
+        write_table(cleaned_subway_codes, CLEANED_SUBWAY_CODES, export_csv=True)
+
+    # The branch already runs in its own process, so the lines are swept
+    # here together rather than one per process as in 05-find_incident_clusters
+    clusters = summarise_clusters(cluster_delays(grouped_subway_data[CLUSTER_COLUMNS]))
+    summaries = summarise_subway_data(grouped_subway_data)
+    summaries["subway_cascades_by_root_incident"] = summarise_root_incidents(clusters)
+    if "summaries" in save:
+        save_summaries(summaries)
+        write_table(compute_cube(grouped_subway_data, "subway"), SUBWAY_CUBE)
+        write_table(clusters, SUBWAY_DELAY_CLUSTERS, export_csv=True)
+
+    return summaries
+
+
+# Functions running each branch on its raw tables
+BRANCHES = {
+    "bus": run_bus_branch,
+    "subway": run_subway_branch
+}
+
+
+def run_branch(branch, frames, save):
+    """Run the ``branch`` ("bus" or "subway") on its raw ``frames`` and
+    return its summaries."""
+    return BRANCHES[branch](*frames, save)
+
+
+def run(download=True, save=DEFAULT_ARTIFACTS, force=False, workers=WORKERS):
+    """Run the whole pipeline and return the summaries of the branches
+    that ran.
+
+    If ``download`` is false the raw CSV files saved by a previous download
+    are used instead. ``save`` lists which of ``ARTIFACTS`` to write to disk;
+    everything else only lives in memory for the duration of the run. A
+    branch whose fingerprint matches the last run, and whose saved artifacts
+    are still on disk, is skipped unless ``force`` is set. The branches
+    that do run are spread over up to ``workers`` processes.
+    """
+    if download:
+        # The raw CSV files keep every column; otherwise only the columns
+        # the pipeline uses are streamed out of the delay workbooks
+        if "raw" in save:
+            raw = download_raw_data()
+            save_raw_data(raw)
+        else:
+            raw = download_raw_data(columns=DELAY_COLUMNS)
+    else:
+        raw = read_raw_data()
+
+    branches = {
+        "bus": [raw["bus_delays"]],
+        "subway": [raw["subway_delays"], raw["subway_codes"]]
+    }
+    params = {
+        "bus_incident_map": BUS_INCIDENT_MAP,
+        "subway_incident_rules": SUBWAY_INCIDENT_RULES,
+        "line_map": LINE_MAP,
+        "line_patterns": LINE_PATTERNS,
+        "cluster_window": WINDOW,
+        "save": sorted(save)
+    }
+
+    cache = BuildCache()
+    stale = {}
+
+    for branch, frames in branches.items():
+        branch_fingerprint = fingerprint(frames=frames, modules=PIPELINE_MODULES, params=params)
+        outputs = [path for artifact in save for path in BRANCH_OUTPUTS[branch].get(artifact, [])]
+
+        if not force and cache.is_fresh(f"pipeline/{branch}", branch_fingerprint, outputs):
+            print(f"{branch}: unchanged since the last run, skipping")
+            continue
+
+        stale[branch] = branch_fingerprint
+
+    results = map_in_processes(
+        run_branch,
+        [(branch, branches[branch], save) for branch in stale],
+        workers
+    )
+
+    # Merge in branch order, whichever process finished first
+    summaries = {}
+    for branch, branch_summaries in zip(stale, results):
+        summaries.update(branch_summaries)
+        cache.record(f"pipeline/{branch}", stale[branch])
+
+    return summaries
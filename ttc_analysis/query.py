@@ -0,0 +1,209 @@
+"""Indexed queries over the cleaned delay tables.
+
+Questions like "total minutes of Security/Safety delay on Bloor-Danforth on
+Fridays in Q3" only touch a small part of a cleaned table. ``build_index``
+stores a copy of the table sorted by timestamp, plus a bitmap of the rows of
+every line, incident and day of the week. A query then finds its time range
+with a binary search over the timestamps and its rows by combining the
+bitmaps of the values asked for, instead of scanning and comparing every
+row. Only the bitmaps of those values, and only the row groups of the
+sorted table within the time range, are read.
+
+The index is rebuilt by ``load_index`` whenever the cleaned table (or the
+code building it) changed since it was built, e.g.::
+
+    index = load_index("subway")
+    index.query(start="2023-07-01", end="2023-10-01", line="Bloor-Danforth",
+                incident="Security/Safety", day="Friday")
+
+or, from the command line, ``python -m ttc_analysis query subway --start
+2023-07-01 --end 2023-10-01 --line Bloor-Danforth --incident
+Security/Safety --day Friday``.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ttc_analysis import schema, store
+from ttc_analysis.cache import BuildCache, fingerprint
+from ttc_analysis.paths import CLEANED_BUS_DELAYS, CLEANED_SUBWAY_DELAYS, INDEX_DIR
+from ttc_analysis.schema import apply_schema
+from ttc_analysis.store import parquet_path, read_table
+
+# Cleaned table indexed for each mode
+MODE_TABLES = {
+    "bus": CLEANED_BUS_DELAYS,
+    "subway": CLEANED_SUBWAY_DELAYS
+}
+
+# Columns with a bitmap per value (bus delays have no line)
+INDEXED_COLUMNS = ("line", "incident", "day")
+
+# Rows per row group of the sorted table, the smallest piece a query reads
+ROW_GROUP_SIZE = 65_536
+
+
+def index_paths(mode, directory=INDEX_DIR):
+    """Return the sorted table (without suffix) and the bitmap file of the
+    ``mode`` index."""
+    return directory / f"{mode}_delays", directory / f"{mode}_bitmaps.npz"
+
+
+def build_index(mode, directory=INDEX_DIR):
+    """Build the index of the cleaned ``mode`` ("bus" or "subway") table."""
+    table_path, bitmap_path = index_paths(mode, directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Stable, so delays at the same minute keep their order
+    table = read_table(MODE_TABLES[mode]).sort_values("timestamp", kind="stable", ignore_index=True)
+    pq.write_table(
+        pa.Table.from_pandas(table, preserve_index=False),
+        parquet_path(table_path),
+        row_group_size=ROW_GROUP_SIZE
+    )
+
+    # One row of bits per indexed value, packed 8 rows to a byte
+    columns, values, bitmaps = [], [], []
+    for column in INDEXED_COLUMNS:
+        if column not in table:
+            continue
+        codes = table[column].cat.codes.to_numpy()
+        for code, value in enumerate(table[column].cat.categories):
+            columns.append(column)
+            values.append(value)
+            bitmaps.append(np.packbits(codes == code))
+
+    np.savez(
+        bitmap_path,
+        timestamps=table["timestamp"].to_numpy(),
+        columns=np.array(columns),
+        values=np.array(values),
+        bitmaps=np.array(bitmaps, dtype=np.uint8).reshape(len(bitmaps), -1)
+    )
+
+
+def load_index(mode, directory=INDEX_DIR, rebuild=False):
+    """Return the ``DelayIndex`` of the cleaned ``mode`` table, building it
+    first if it is missing or out of date (or if ``rebuild`` is set)."""
+    table_path, bitmap_path = index_paths(mode, directory)
+
+    cache = BuildCache()
+    index_fingerprint = fingerprint(
+        inputs=[parquet_path(MODE_TABLES[mode])],
+        modules=[sys.modules[__name__], schema, store]
+    )
+    outputs = [parquet_path(table_path), bitmap_path]
+
+    if rebuild or not cache.is_fresh(f"query/{mode}", index_fingerprint, outputs):
+        build_index(mode, directory)
+        cache.record(f"query/{mode}", index_fingerprint)
+
+    # The bitmaps stay packed until a query needs them
+    with np.load(bitmap_path) as stored:
+        bitmaps = {
+            (str(column), str(value)): bitmap
+            for column, value, bitmap in zip(stored["columns"], stored["values"], stored["bitmaps"])
+        }
+        return DelayIndex(table_path, stored["timestamps"], bitmaps)
+
+
+class DelayIndex:
+    """A cleaned delay table sorted by timestamp, with a bitmap of the rows
+    of each line, incident and day of the week."""
+
+    def __init__(self, table_path, timestamps, bitmaps):
+        self.table_path = table_path
+        self.timestamps = timestamps
+        self.bitmaps = bitmaps
+
+    def values(self, column):
+        """Return the indexed values of ``column``."""
+        return sorted(value for indexed, value in self.bitmaps if indexed == column)
+
+    def select(self, start=None, end=None, **filters):
+        """Return the rows (as a slice of the sorted table and a boolean mask
+        within it, or None for all of them) of the delays from ``start``
+        (inclusive) to ``end`` (exclusive) that match ``filters``.
+
+        Each filter maps an indexed column to a value or a list of values;
+        a row matches if it has any of the values of every filter.
+        """
+        first = 0 if start is None else np.searchsorted(self.timestamps, np.datetime64(pd.Timestamp(start)), "left")
+        last = len(self.timestamps) if end is None else np.searchsorted(self.timestamps, np.datetime64(pd.Timestamp(end)), "left")
+        rows = slice(first, max(first, last))
+
+        mask = None
+        for column, values in filters.items():
+            if values is None:
+                continue
+            if not self.values(column):
+                raise ValueError(f"{column} isn't indexed for this table")
+            if isinstance(values, str):
+                values = [values]
+
+            column_mask = np.zeros(rows.stop - rows.start, dtype=bool)
+            for value in values:
+                if (column, value) not in self.bitmaps:
+                    raise ValueError(f"unknown {column} {value!r}; use one of {self.values(column)}")
+                column_mask |= self.bitmap(column, value, rows)
+
+            mask = column_mask if mask is None else mask & column_mask
+
+        return rows, mask
+
+    def bitmap(self, column, value, rows):
+        """Return the bits of the ``rows`` (a slice) with ``column`` equal
+        to ``value``, unpacking only the bytes holding them."""
+        packed = self.bitmaps[(column, value)][rows.start // 8:(rows.stop + 7) // 8]
+        offset = rows.start % 8
+        return np.unpackbits(packed)[offset:offset + rows.stop - rows.start].astype(bool)
+
+    def read(self, rows, columns=None):
+        """Return ``columns`` (all by default) of the ``rows`` (a slice) of
+        the sorted table, reading only the row groups holding them."""
+        with pq.ParquetFile(parquet_path(self.table_path)) as parquet:
+            sizes = [parquet.metadata.row_group(group).num_rows for group in range(parquet.num_row_groups)]
+            starts = np.cumsum([0] + sizes)
+            groups = [
+                group for group in range(len(sizes))
+                if starts[group] < rows.stop and starts[group + 1] > rows.start
+            ]
+            table = parquet.read_row_groups(groups, columns=columns)
+
+        first = rows.start - starts[groups[0]] if groups else 0
+        return apply_schema(table.to_pandas()).iloc[first:first + rows.stop - rows.start].reset_index(drop=True)
+
+    def query(self, start=None, end=None, line=None, incident=None, day=None):
+        """Return the number, total and mean length (in minutes) and the
+        total gap of the delays from ``start`` to ``end`` on the given
+        ``line``, ``incident`` and ``day`` (each a value or a list of values;
+        None matches everything)."""
+        rows, mask = self.select(start, end, line=line, incident=incident, day=day)
+
+        lengths = self.read(rows, ["min_delay", "min_gap"])
+        min_delay = lengths["min_delay"].to_numpy()
+        min_gap = lengths["min_gap"].to_numpy()
+        if mask is not None:
+            min_delay = min_delay[mask]
+            min_gap = min_gap[mask]
+
+        delays = len(min_delay)
+        total_delay = int(min_delay.sum(dtype=np.int64))
+        return {
+            "delays": delays,
+            "total_delay": total_delay,
+            "mean_delay": total_delay / delays if delays else float("nan"),
+            "total_gap": int(min_gap.sum(dtype=np.int64))
+        }
+
+    def rows(self, start=None, end=None, line=None, incident=None, day=None):
+        """Return the delays from ``start`` to ``end`` on the given ``line``,
+        ``incident`` and ``day``, in timestamp order."""
+        rows, mask = self.select(start, end, line=line, incident=incident, day=day)
+
+        selected = self.read(rows)
+        return selected if mask is None else selected[mask].reset_index(drop=True)
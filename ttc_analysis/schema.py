@@ -0,0 +1,185 @@
+"""Column types for the delay tables handed between pipeline stages.
+
+Dates and times come in (and go out to the CSV exports) as ``YYYY-MM-DD``
+and ``HH:MM`` strings. A table has thousands of rows per date and only 1440
+distinct times, so ``parse_dates``, ``parse_times``, ``format_dates`` and
+``format_times`` factorise the column and convert each distinct value once,
+then spread the results over the rows, instead of parsing or formatting
+every row.
+"""
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.instrument import instrumented
+
+# Days of the week in alphabetical order, so grouped summaries come out in
+# the same order as they did when ``day`` was a plain string column
+DAYS = sorted([
+    "Sunday",
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday"
+])
+
+# "HH:MM" of every minute of the day
+CLOCK_TIMES = np.array([f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)], dtype=object)
+
+# Low-cardinality label columns stored as categoricals
+CATEGORICAL_COLUMNS = ("day", "incident", "line", "code", "station", "bound")
+
+# Delay lengths in minutes; the longest recorded delays are well under
+# 1000 minutes, so 16 bits are plenty. Vehicle numbers have four digits.
+INTEGER_COLUMNS = {
+    "min_delay": "int16",
+    "min_gap": "int16",
+    "vehicle": "int16"
+}
+
+# Vehicle number of delays not involving a vehicle
+NO_VEHICLE = 0
+
+
+@instrumented("transform")
+def apply_schema(df):
+    """Return ``df`` with the compact column types of the delay tables.
+
+    - ``date`` and ``time`` are combined into a single datetime64
+      ``timestamp`` column in place of ``date``. A ``date`` without a
+      ``time`` (as in the summaries) becomes a datetime64 date.
+    - ``day``, ``incident``, ``line``, ``code``, ``station`` and ``bound``
+      become categoricals.
+    - ``min_delay``, ``min_gap`` and ``vehicle`` become 16-bit integers.
+
+    Columns that are missing are ignored and columns that already have the
+    right type are left untouched, so the function is safe to call on the
+    output of any stage.
+    """
+    typed = {}
+
+    if "date" in df and not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        typed["date"] = parse_dates(df["date"])
+
+    if "time" in df and not pd.api.types.is_timedelta64_dtype(df["time"]):
+        typed["time"] = parse_times(df["time"])
+
+    if "day" in df and not isinstance(df["day"].dtype, pd.CategoricalDtype):
+        typed["day"] = pd.Categorical(df["day"], categories=DAYS)
+
+    for column in CATEGORICAL_COLUMNS:
+        if column == "day" or column not in df:
+            continue
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            typed[column] = df[column].astype("category")
+
+    for column, dtype in INTEGER_COLUMNS.items():
+        if column in df and df[column].dtype != dtype:
+            typed[column] = to_integer(df[column], dtype)
+
+    typed_df = df.assign(**typed) if typed else df
+
+    if "date" in typed_df and "time" in typed_df:
+        timestamp = typed_df["date"] + typed_df["time"]
+        typed_df = typed_df.drop(columns=["time"])
+        typed_df = typed_df.rename(columns={"date": "timestamp"}).assign(timestamp=timestamp)
+
+    return typed_df
+
+
+def parse_dates(values):
+    """Parse ``YYYY-MM-DD`` strings into datetime64 dates, parsing each
+    distinct string once."""
+    codes, uniques = pd.factorize(values)
+    dates = pd.to_datetime(uniques, format="%Y-%m-%d").take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(dates, index=values.index, name=values.name)
+
+
+def parse_times(values):
+    """Parse ``HH:MM`` strings (any seconds are ignored) into durations since
+    midnight, parsing each distinct string once."""
+    codes, uniques = pd.factorize(values)
+
+    minutes = []
+    for value in uniques:
+        hours, minute = str(value).split(":")[:2]
+        minutes.append(int(hours) * 60 + int(minute))
+
+    # Missing values (code -1) pick the NaT at the end
+    durations = np.append(np.array(minutes, dtype="timedelta64[m]"), np.timedelta64("NaT", "m"))
+    return pd.Series(durations[codes].astype("timedelta64[us]"), index=values.index, name=values.name)
+
+
+def calendar_dates(timestamps):
+    """Return the dates (midnight) of datetimes, for grouping by date.
+
+    Truncates the underlying integers to whole days, which is cheaper than
+    ``Series.dt.normalize``.
+    """
+    values = timestamps.to_numpy()
+    return pd.Series(values.astype("datetime64[D]").astype(values.dtype), index=timestamps.index, name=timestamps.name)
+
+
+def hours_of_day(timestamps):
+    """Return the hour of the day (0 to 23) of datetimes, for grouping by
+    hour."""
+    values = timestamps.to_numpy()
+    hours = (values - values.astype("datetime64[D]")) // np.timedelta64(1, "h")
+    return pd.Series(hours.astype(np.int8), index=timestamps.index, name="hour")
+
+
+def format_dates(timestamps):
+    """Format datetimes as ``YYYY-MM-DD`` strings, formatting each distinct
+    date once."""
+    codes, uniques = pd.factorize(timestamps.to_numpy().astype("datetime64[D]"))
+
+    # Missing values (code -1) pick the NaN at the end
+    strings = np.append(np.asarray(pd.DatetimeIndex(uniques).strftime("%Y-%m-%d"), dtype=object), np.nan)
+    return pd.Series(strings[codes], index=timestamps.index, name=timestamps.name)
+
+
+def format_times(timestamps):
+    """Format the times of day of datetimes as ``HH:MM`` strings."""
+    values = timestamps.to_numpy()
+    minutes = (values - values.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int64)
+
+    # Missing values pick the NaN at the end
+    minutes[np.isnat(values)] = len(CLOCK_TIMES)
+    return pd.Series(np.append(CLOCK_TIMES, np.nan)[minutes], index=timestamps.index, name=timestamps.name)
+
+
+def to_integer(values, dtype):
+    """Convert ``values`` to the integer ``dtype``, refusing missing values
+    and values that don't fit rather than wrapping them around."""
+    numbers = pd.to_numeric(values)
+    if numbers.isna().any():
+        raise ValueError(f"{values.name} has missing values")
+
+    limits = np.iinfo(dtype)
+    if len(numbers) and (numbers.min() < limits.min or numbers.max() > limits.max):
+        raise ValueError(f"{values.name} has values outside the range of {dtype}")
+
+    return numbers.astype(dtype)
+
+
+@instrumented("transform")
+def format_for_csv(df):
+    """Return ``df`` with ``date`` and ``time`` written back as the
+    ``YYYY-MM-DD`` and ``HH:MM`` strings used by the published CSV files.
+
+    A ``timestamp`` column is split back into ``date`` and ``time``.
+    """
+    if "timestamp" in df and pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        position = df.columns.get_loc("timestamp")
+        timestamp = df["timestamp"]
+        df = df.drop(columns=["timestamp"])
+        df.insert(position, "date", format_dates(timestamp))
+        df.insert(position + 1, "time", format_times(timestamp))
+        return df
+
+    if "date" in df and pd.api.types.is_datetime64_any_dtype(df["date"]):
+        return df.assign(date=format_dates(df["date"]))
+
+    return df
@@ -0,0 +1,168 @@
+"""Memory-mapped, read-only copies of the cleaned delay tables.
+
+Every process that reads a Parquet or CSV file decodes it into its own
+memory, so N notebooks, dashboards or paper renders hold N copies of the
+cleaned tables. ``publish_table`` also writes each cleaned table as a
+directory of NumPy column files (``<path>.columns/<column>.npy``, plus the
+categories of its label columns in ``schema.json``), each laid out exactly
+as the column is in memory. ``load_table`` memory-maps those files, so the
+columns are read straight from the operating system's page cache and every
+process on the machine shares the same pages::
+
+    from ttc_analysis.shared import load_delays
+    subway = load_delays("subway")
+
+Label columns are stored as categorical codes, timestamps as datetime64 and
+delay lengths as 16-bit integers, so the DataFrame is built around the
+mapped arrays without copying them (the categoricals keep their codes on
+the mapped files). The frames are read-only. A table is
+published by writing a new directory and moving it into place, so
+processes that still have the old files mapped keep reading a consistent
+copy.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.paths import CLEANED_BUS_DELAYS, CLEANED_SUBWAY_DELAYS
+from ttc_analysis.schema import CATEGORICAL_COLUMNS, DAYS
+from ttc_analysis.store import columns_path
+
+# Published cleaned table of each mode
+SHARED_TABLES = {
+    "bus": CLEANED_BUS_DELAYS,
+    "subway": CLEANED_SUBWAY_DELAYS
+}
+
+# Rows per batch when publishing
+BATCH_SIZE = 1_000_000
+
+
+def code_dtype(categories):
+    """Return the dtype pandas uses for the codes of ``categories``."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(categories) < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def collect_categories(parquet_files, columns):
+    """Return the sorted distinct values of each of ``columns`` across the
+    Parquet files (days of the week in the order of ``DAYS``)."""
+    values = {column: set() for column in columns}
+
+    for parquet_file in parquet_files:
+        with pq.ParquetFile(parquet_file) as parquet:
+            for batch in parquet.iter_batches(batch_size=BATCH_SIZE, columns=columns):
+                for column in columns:
+                    distinct = pc.unique(batch.column(column).cast(pa.string())).drop_null()
+                    values[column].update(distinct.to_pylist())
+
+    return {
+        column: DAYS if column == "day" else sorted(distinct)
+        for column, distinct in values.items()
+    }
+
+
+def column_values(array, categories=None):
+    """Return an Arrow column as a NumPy array: the codes of ``categories``
+    (-1 where missing) for a label column, the values otherwise."""
+    if categories is not None:
+        codes = pc.index_in(array.cast(pa.string()), value_set=pa.array(categories, pa.string()))
+        return codes.fill_null(-1).to_numpy().astype(code_dtype(categories))
+
+    if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_timestamp(array.type)):
+        raise ValueError(f"can't publish a column of type {array.type}")
+    return array.to_numpy(zero_copy_only=False)
+
+
+@instrumented("write")
+def publish_table(parquet_files, path):
+    """Publish the rows of ``parquet_files`` (in order, all with the same
+    columns) as the memory-mappable ``<path>.columns``.
+
+    The column files are allocated at their full length up front and filled
+    one batch at a time, in two passes over the Parquet files (one for the
+    categories of the label columns, one for the rows), so memory stays
+    bounded whatever the size of the table.
+    """
+    parquet_files = list(parquet_files)
+    target = columns_path(path)
+    temporary = target.with_name(target.name + ".tmp")
+    shutil.rmtree(temporary, ignore_errors=True)
+    temporary.mkdir(parents=True)
+
+    schema = pq.read_schema(parquet_files[0])
+    names = schema.names
+    rows = sum(pq.ParquetFile(parquet_file).metadata.num_rows for parquet_file in parquet_files)
+    categories = collect_categories(parquet_files, [name for name in names if name in CATEGORICAL_COLUMNS])
+
+    # Each column file takes the dtype of an empty column of its type, so a
+    # table without rows still has all of them
+    files = {}
+    for name in names:
+        dtype = column_values(pa.array([], schema.field(name).type), categories.get(name)).dtype
+        files[name] = np.lib.format.open_memmap(temporary / f"{name}.npy", mode="w+", dtype=dtype, shape=(rows,))
+
+    written = 0
+    for parquet_file in parquet_files:
+        with pq.ParquetFile(parquet_file) as parquet:
+            for batch in parquet.iter_batches(batch_size=BATCH_SIZE, columns=names):
+                for name in names:
+                    files[name][written:written + batch.num_rows] = column_values(batch.column(name), categories.get(name))
+                written += batch.num_rows
+
+    for values in files.values():
+        values.flush()
+    with open(temporary / "schema.json", "w") as f:
+        json.dump({"columns": names, "rows": rows, "categories": categories}, f, indent=2)
+
+    # Swap the new directory in; files still mapped by readers stay valid
+    # until they let go of them
+    previous = target.with_name(target.name + ".old")
+    shutil.rmtree(previous, ignore_errors=True)
+    if target.exists():
+        os.replace(target, previous)
+    os.replace(temporary, target)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def read_schema(path):
+    """Return the columns, row count and categories of a published table."""
+    with open(columns_path(path) / "schema.json") as f:
+        return json.load(f)
+
+
+@instrumented("load")
+def load_table(path, columns=None):
+    """Return the published table ``<path>.columns`` as a read-only
+    DataFrame backed by the memory-mapped column files, loading only
+    ``columns`` if given."""
+    schema = read_schema(path)
+
+    data = {}
+    for column in columns or schema["columns"]:
+        # A plain array viewing the mapped file, so results of operations
+        # on the frame aren't memmaps
+        values = np.load(columns_path(path) / f"{column}.npy", mmap_mode="r").view(np.ndarray)
+        if column in schema["categories"]:
+            # The codes were checked when published; validating them again
+            # would read every page of the file
+            dtype = pd.CategoricalDtype(schema["categories"][column])
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        data[column] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+def load_delays(mode, columns=None):
+    """Return the published cleaned ``mode`` ("bus" or "subway") table."""
+    return load_table(SHARED_TABLES[mode], columns)
@@ -0,0 +1,255 @@
+"""Simulate raw bus and subway delay tables at any scale (see 00-simulate_data).
+
+The simulated tables have the columns and formats of the downloaded ones
+(``RAW_BUS_DELAYS``, ``RAW_SUBWAY_DELAYS``), so every stage of the pipeline
+can be run on them. Rows are spread over ``days`` dates starting at
+``start``, more of them on the busier days of the week, and come out in
+date order. Times, incidents, codes, lines and delays are drawn from
+distributions loosely fitted to the 2023 data.
+
+Tables are generated in chunks of ``chunk_size`` rows. Each chunk has its
+own random stream spawned from ``seed``, so a table is the same whatever
+the chunk is generated by, and chunks are generated and written in up to
+``workers`` processes (see ``ttc_analysis.parallel``) before being joined
+into one CSV or Parquet file.
+"""
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from ttc_analysis.clean import clean_subway_codes
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.paths import RAW_BUS_DELAYS, RAW_SUBWAY_CODES, RAW_SUBWAY_DELAYS, SUMMARY_DIR
+from ttc_analysis.schema import CLOCK_TIMES
+
+# Rows per year at today's volume
+ROWS_PER_YEAR = {
+    "bus": 51_000,
+    "subway": 23_000
+}
+
+# Rows per generated chunk
+CHUNK_SIZE = 1_000_000
+
+# Assumption that delays change depending on the day (Sunday first)
+DAY_WEIGHTS = [
+    0.18,  # Sort of high on Sundays
+    0.14,  # Slightly lower as people go back to school/work
+    0.10,  # Low on Tuesday
+    0.10,  # Low on Wednesday
+    0.11,  # Low on Thursday
+    0.17,  # High on Friday
+    0.20   # High on Saturday
+]
+
+# Share of each raw bus incident description
+BUS_INCIDENT_WEIGHTS = {
+    "Mechanical": 0.365,
+    "Operations - Operator": 0.213,
+    "Security": 0.07,
+    "Collision - TTC": 0.067,
+    "Diversion": 0.066,
+    "General Delay": 0.047,
+    "Emergency Services": 0.046,
+    "Utilized Off Route": 0.044,
+    "Cleaning - Unsanitary": 0.041,
+    "Investigation": 0.02,
+    "Vision": 0.015,
+    "Road Blocked - NON-TTC Collision": 0.004,
+    "Held By": 0.001
+}
+
+# Share of each raw subway line name, including one that isn't in LINE_MAP
+LINE_WEIGHTS = {
+    "YU": 0.5,
+    "BD": 0.41,
+    "SRT": 0.03,
+    "SHP": 0.03,
+    "YU/BD": 0.015,
+    "999": 0.01,
+    "BD LINE 2": 0.005
+}
+
+# Stations (also used as bus locations)
+STATIONS = [
+    "BLOOR STATION",
+    "DON MILLS STATION",
+    "EGLINTON STATION",
+    "FINCH STATION",
+    "KENNEDY BD STATION",
+    "KIPLING STATION",
+    "MUSEUM STATION",
+    "SHEPPARD WEST STATION",
+    "SPADINA BD STATION",
+    "ST GEORGE YUS STATION",
+    "UNION STATION",
+    "VAUGHAN MC STATION"
+]
+
+DIRECTIONS = ["N", "S", "E", "W", "B"]
+
+# Raw column order of each table
+RAW_COLUMNS = {
+    "bus": ["Date", "Route", "Time", "Day", "Location", "Incident", "Min Delay", "Min Gap", "Direction", "Vehicle"],
+    "subway": ["Date", "Time", "Day", "Station", "Code", "Min Delay", "Min Gap", "Bound", "Line", "Vehicle"]
+}
+
+
+def normalised(weights):
+    """Return ``weights`` as probabilities summing to 1."""
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def date_counts(rows, start, days, seed):
+    """Return the dates and the number of rows on each, weighted by day of
+    the week."""
+    dates = pd.date_range(start, periods=days, freq="D")
+
+    # Sunday is 6 for pandas, 0 in DAY_WEIGHTS
+    weights = normalised(DAY_WEIGHTS)[(dates.dayofweek + 1) % 7]
+
+    rng = np.random.default_rng(seed)
+    return dates, rng.multinomial(rows, normalised(weights))
+
+
+def simulate_chunk(mode, first, last, dates, counts, seed, codes):
+    """Return rows ``first`` to ``last`` (exclusive) of a simulated raw
+    ``mode`` ("bus" or "subway") table with ``counts`` rows on ``dates``."""
+    rng = np.random.default_rng(seed)
+    size = last - first
+
+    # Dates of the rows, which come in date order, and times within each
+    # date, clustered around the evening rush
+    date_index = np.searchsorted(np.cumsum(counts), np.arange(first, last), side="right")
+    minutes = (rng.normal(loc=17 * 60, scale=6 * 60, size=size) % (24 * 60)).astype(np.int64)
+    order = np.lexsort((minutes, date_index))
+    date_index, minutes = date_index[order], minutes[order]
+
+    # Dates, days and times are formatted once and looked up per row
+    columns = {
+        "Date": np.asarray(dates.strftime("%Y-%m-%d"))[date_index],
+        "Time": CLOCK_TIMES[minutes],
+        "Day": np.asarray(dates.day_name())[date_index],
+        "Vehicle": rng.integers(1000, 9999, size=size)
+    }
+
+    if mode == "bus":
+        min_delay = np.minimum(np.rint(rng.gamma(shape=1.5, scale=14, size=size)), 999).astype(np.int64)
+        columns.update({
+            "Route": rng.integers(1, 999, size=size),
+            "Location": rng.choice(STATIONS, size=size),
+            "Incident": rng.choice(list(BUS_INCIDENT_WEIGHTS), size=size, p=normalised(list(BUS_INCIDENT_WEIGHTS.values()))),
+            "Min Delay": min_delay,
+            "Min Gap": min_delay + rng.poisson(11, size=size),
+            "Direction": rng.choice(DIRECTIONS, size=size)
+        })
+    else:
+        # Most subway delays are recorded as 0 minutes
+        delayed = rng.random(size) > 0.64
+        min_delay = np.where(delayed, np.rint(rng.gamma(shape=1.2, scale=7, size=size)) + 1, 0).astype(np.int64)
+        columns.update({
+            "Station": rng.choice(STATIONS, size=size),
+            "Code": rng.choice(codes, size=size),
+            "Min Delay": min_delay,
+            "Min Gap": min_delay + delayed * rng.poisson(3, size=size),
+            "Bound": rng.choice(DIRECTIONS, size=size),
+            "Line": rng.choice(list(LINE_WEIGHTS), size=size, p=normalised(list(LINE_WEIGHTS.values())))
+        })
+
+    return pd.DataFrame({column: np.asarray(columns[column]) for column in RAW_COLUMNS[mode]})
+
+
+def write_chunk(mode, first, last, dates, counts, seed, codes, path):
+    """Simulate one chunk and write it to ``path`` (CSV without a header, or
+    Parquet)."""
+    chunk = simulate_chunk(mode, first, last, dates, counts, seed, codes)
+    if path.suffix == ".parquet":
+        chunk.to_parquet(path, index=False)
+    else:
+        chunk.to_csv(path, header=False, index=False)
+    return path
+
+
+def simulate_table(mode, rows, path, start="2023-01-01", days=365, seed=302,
+                   codes=None, chunk_size=CHUNK_SIZE, workers=WORKERS):
+    """Write a simulated raw ``mode`` table of ``rows`` rows to ``path``, as
+    Parquet if it ends in ``.parquet`` and as CSV otherwise.
+
+    Subway codes are drawn from ``codes`` (by default the codes of
+    ``RAW_SUBWAY_CODES``).
+    """
+    path = Path(path)
+    if mode == "subway" and codes is None:
+        codes = clean_subway_codes(pd.read_csv(RAW_SUBWAY_CODES))["code"].dropna().astype(str).unique()
+
+    # One random stream for the dates and one for each chunk
+    starts = range(0, rows, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts) + 1)
+    dates, counts = date_counts(rows, start, days, seeds[0])
+
+    parts_dir = path.with_name(path.name + ".parts")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    parts_dir.mkdir(parents=True)
+
+    parts = map_in_processes(
+        write_chunk,
+        [
+            (mode, first, min(first + chunk_size, rows), dates, counts, chunk_seed, codes,
+             parts_dir / f"part-{number:05d}{path.suffix}")
+            for number, (first, chunk_seed) in enumerate(zip(starts, seeds[1:]))
+        ],
+        workers
+    )
+
+    # Join the parts in order
+    if path.suffix == ".parquet":
+        writer = None
+        for part in parts:
+            table = pq.read_table(part)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        with open(path, "wb") as f:
+            f.write((",".join(RAW_COLUMNS[mode]) + "\n").encode())
+            for part in parts:
+                with open(part, "rb") as part_file:
+                    shutil.copyfileobj(part_file, f)
+
+    shutil.rmtree(parts_dir)
+
+
+def simulate_raw_data(root, scale=1.0, years=1, start="2023-01-01", seed=302,
+                      chunk_size=CHUNK_SIZE, workers=WORKERS):
+    """Lay out a copy of the repository's data directories under ``root``
+    with simulated raw tables of ``scale`` times today's yearly volume over
+    ``years`` years.
+
+    The numbered scripts can then be run on the simulated data from
+    ``root``, e.g. ``cd <root> && python <repo>/scripts/02-clean_data.py``.
+    """
+    root = Path(root)
+    days = (pd.Timestamp(start) + pd.DateOffset(years=years) - pd.Timestamp(start)).days
+
+    for directory in (RAW_BUS_DELAYS.parent, SUMMARY_DIR):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(RAW_SUBWAY_CODES, root / RAW_SUBWAY_CODES)
+
+    # Separate random streams for the bus and subway tables
+    for mode, path, mode_seed in (("bus", RAW_BUS_DELAYS, seed), ("subway", RAW_SUBWAY_DELAYS, seed + 1)):
+        simulate_table(
+            mode,
+            int(ROWS_PER_YEAR[mode] * scale * years),
+            root / path,
+            start=start,
+            days=days,
+            seed=mode_seed,
+            chunk_size=chunk_size,
+            workers=workers
+        )
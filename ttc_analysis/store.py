@@ -0,0 +1,115 @@
+"""Columnar storage for the tables handed between pipeline stages.
+
+Tables are written once as Parquet with their schema applied (see
+``ttc_analysis.schema``) and read back with only the columns a stage needs,
+instead of every stage re-parsing the CSV the previous one wrote. CSV is
+still available as an export, e.g. for the files the paper reads.
+
+Paths are given without a suffix; ``.parquet`` and ``.csv`` are added here.
+
+Tables that grow over time can also be stored partitioned by the year and
+month of their ``timestamp`` column, one Parquet file per month under
+``<directory>/year=YYYY/month=MM/``, so new months are added without
+rewriting the history.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.schema import apply_schema, format_for_csv
+
+
+def parquet_path(path):
+    """Return the Parquet file of the table at ``path``."""
+    return Path(path).with_suffix(".parquet")
+
+
+def csv_path(path):
+    """Return the CSV export of the table at ``path``."""
+    return Path(path).with_suffix(".csv")
+
+
+def columns_path(path):
+    """Return the directory of memory-mappable column files of the table at
+    ``path`` (see ``ttc_analysis.shared``)."""
+    return Path(path).with_suffix(".columns")
+
+
+@instrumented("write")
+def write_table(df, path, export_csv=False):
+    """Write ``df`` to ``<path>.parquet`` (and ``<path>.csv`` if asked).
+
+    Returns the typed frame that was written so callers can keep working
+    with it without reading it back.
+    """
+    table = apply_schema(df)
+
+    table.to_parquet(parquet_path(path), index=False)
+    if export_csv:
+        format_for_csv(table).to_csv(csv_path(path), index=False)
+
+    return table
+
+
+@instrumented("load")
+def read_table(path, columns=None):
+    """Read ``<path>.parquet`` into a typed frame, loading only ``columns``
+    if given."""
+    return apply_schema(pd.read_parquet(parquet_path(path), columns=columns))
+
+
+@instrumented("write")
+def append_csv(df, path):
+    """Append the rows of ``df`` to the CSV export ``<path>.csv``, creating
+    it (with a header) if it doesn't exist yet."""
+    path = csv_path(path)
+    exists = path.exists()
+    format_for_csv(df).to_csv(path, mode="a" if exists else "w", header=not exists, index=False)
+
+
+def partition_path(directory, month, name="part-0"):
+    """Return the file of the ``month`` (a monthly ``pd.Period``) partition.
+
+    Other ``name``s are tables kept next to the partition's rows, such as
+    its partial aggregates.
+    """
+    return Path(directory) / f"year={month.year}" / f"month={month.month:02d}" / f"{name}.parquet"
+
+
+def stored_partitions(directory):
+    """Return the months stored under ``directory``, oldest first."""
+    return sorted(
+        pd.Period(year=int(path.parent.parent.name[5:]), month=int(path.parent.name[6:]), freq="M")
+        for path in Path(directory).glob("year=*/month=*/part-0.parquet")
+    )
+
+
+@instrumented("write")
+def write_partition_table(df, directory, month, name):
+    """Write ``df`` as the ``name`` table of the ``month`` partition."""
+    path = partition_path(directory, month, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write next to the target and move it into place, so readers never see
+    # a half-written file
+    temporary = path.with_name(path.name + ".tmp")
+    df.to_parquet(temporary, index=False)
+    os.replace(temporary, path)
+
+
+@instrumented("load")
+def read_partitions(directory, columns=None, months=None):
+    """Read the partitions under ``directory`` (only ``months`` if given)
+    into one typed frame, loading only ``columns`` if given."""
+    if months is None:
+        months = stored_partitions(directory)
+
+    parts = [pd.read_parquet(partition_path(directory, month), columns=columns) for month in months]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+
+    # Each month has its own categories, so they are rebuilt after stacking
+    return apply_schema(pd.concat(parts, ignore_index=True))
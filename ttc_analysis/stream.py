@@ -0,0 +1,130 @@
+"""Chunked processing of the delay tables (see 02-clean_data to 04-summarise_data).
+
+The scripts read each table as a stream of chunks of at most ``CHUNK_SIZE``
+rows and pass them through a chain of generators: every chunk is cleaned,
+grouped and written to its output (``write_chunks``) or folded into the
+partial aggregates of the summaries (``summarise_chunks``) before the next
+one is read, so memory is bounded by the chunk size rather than by the
+length of the history.
+
+Streaming is switched on by setting the ``TTC_CHUNK_SIZE`` environment
+variable, e.g. ``TTC_CHUNK_SIZE=100000 python scripts/02-clean_data.py``.
+Without it every table is read as a single chunk, which gives exactly the
+same output as processing it whole. With it the summaries are the same,
+but the cleaned subway delays are only sorted by date and time within
+each chunk.
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ttc_analysis.instrument import instrumented, span
+from ttc_analysis.schema import CATEGORICAL_COLUMNS, apply_schema, format_for_csv
+from ttc_analysis.store import csv_path, parquet_path
+from ttc_analysis.summarise import MODE_PARTIALS, compute_partials, finalise_summaries, merge_partials
+from ttc_analysis.validate import Validator
+
+# Rows per chunk, or None to read every table whole
+CHUNK_SIZE = int(os.environ["TTC_CHUNK_SIZE"]) if os.environ.get("TTC_CHUNK_SIZE") else None
+
+
+@instrumented("load")
+def read_csv_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield the rows of the CSV file ``path`` in chunks of ``chunk_size``."""
+    if chunk_size is None:
+        yield pd.read_csv(path)
+        return
+
+    with pd.read_csv(path, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+@instrumented("load")
+def read_table_chunks(path, chunk_size=CHUNK_SIZE, columns=None):
+    """Yield the rows of ``<path>.parquet`` in typed chunks of ``chunk_size``,
+    loading only ``columns`` if given."""
+    if chunk_size is None:
+        yield apply_schema(pd.read_parquet(parquet_path(path), columns=columns))
+        return
+
+    with pq.ParquetFile(parquet_path(path)) as parquet:
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield apply_schema(batch.to_pandas())
+
+
+def write_chunks(chunks, path, export_csv=False):
+    """Write each chunk to ``<path>.parquet`` (and ``<path>.csv`` if asked)
+    as it passes through, yielding it on to the next step.
+
+    The files are only complete once every chunk has been consumed.
+    """
+    writer = None
+    exported = False
+
+    try:
+        for chunk in chunks:
+            with span("stream.write_chunks", "write", len(chunk)) as step:
+                table = pa.Table.from_pandas(apply_schema(chunk), preserve_index=False)
+
+                # Every chunk has its own categories, so label columns are
+                # written as plain strings (and typed again when read)
+                if writer is None:
+                    schema = pa.schema([
+                        pa.field(field.name, pa.string()) if field.name in CATEGORICAL_COLUMNS else field
+                        for field in table.schema
+                    ])
+                    writer = pq.ParquetWriter(parquet_path(path), schema)
+                writer.write_table(table.cast(schema))
+
+                if export_csv:
+                    format_for_csv(chunk).to_csv(
+                        csv_path(path),
+                        mode="a" if exported else "w",
+                        header=not exported,
+                        index=False
+                    )
+                    exported = True
+
+                step.rows_out = len(chunk)
+
+            yield chunk
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def validate_chunks(chunks, constraints, name):
+    """Check each chunk against ``constraints`` (see ``ttc_analysis.validate``)
+    as it passes through, yielding it on.
+
+    Checks that need the whole table (e.g. every day of the week occurs)
+    are made, and the violations of the table ``name`` reported, once the
+    last chunk has passed.
+    """
+    validator = Validator(name, constraints)
+
+    for chunk in chunks:
+        validator.check(chunk)
+        yield chunk
+
+    validator.finish()
+
+
+def consume(chunks):
+    """Run a chain of chunk generators to the end; return the number of rows."""
+    return sum(len(chunk) for chunk in chunks)
+
+
+def summarise_chunks(chunks, mode):
+    """Return the ``mode`` ("bus" or "subway") summaries of a table read in
+    chunks, folding each chunk into the partial aggregates as it is read."""
+    partials = None
+
+    for chunk in chunks:
+        chunk_partials = compute_partials(chunk, MODE_PARTIALS[mode])
+        partials = chunk_partials if partials is None else merge_partials([partials, chunk_partials])
+
+    return finalise_summaries(partials, mode)
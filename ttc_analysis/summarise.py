@@ -0,0 +1,350 @@
+"""Summarise the cleaned delay data (see 04-summarise_data).
+
+Every summary is derived from a few partial aggregates that only hold
+counts and sums, keyed by date, incident, line or hour of the day (or
+also by delay length, for the quantiles of the delay lengths), or
+bounded-size sketches of the busiest stations and vehicles (see
+``ttc_analysis.heavy_hitters``). Partials computed on
+separate pieces of a table (months of the partitioned store, chunks, new
+rows) are combined with ``merge_partials``, and the published summaries,
+including the means, are derived from the combined partials with
+``finalise_summaries``.
+"""
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.heavy_hitters import heavy_hitters, merge_heavy_hitters, top_k
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.parallel import WORKERS, map_in_processes
+from ttc_analysis.paths import SUMMARY_DIR
+from ttc_analysis.schema import NO_VEHICLE, calendar_dates, format_for_csv, hours_of_day
+from ttc_analysis.store import (
+    partition_path,
+    read_partitions,
+    stored_partitions,
+    write_partition_table
+)
+
+# Columns each summary needs from the cleaned tables
+BUS_COLUMNS = ["timestamp", "day", "incident", "min_delay", "min_gap"]
+SUBWAY_COLUMNS = ["timestamp", "day", "incident", "min_delay", "min_gap", "line", "station", "vehicle"]
+
+# Keys of each partial aggregate
+PARTIAL_KEYS = {
+    "by_date": ["date", "day"],
+    "by_incident": ["incident"],
+    "by_line": ["line"],
+    "by_hour": ["hour", "day", "incident"],
+    "by_hour_line": ["hour", "day", "incident", "line"],
+    "delay_histogram": ["date", "day", "incident", "min_delay"],
+    "delay_histogram_line": ["date", "day", "incident", "line", "min_delay"],
+    "gap_histogram": ["date", "day", "incident", "min_gap"],
+    "gap_histogram_line": ["date", "day", "incident", "line", "min_gap"]
+}
+
+# Partials counting the rows with each delay (or gap) length, from which
+# its quantiles are derived. Lengths are whole minutes, so exact histograms
+# per key stand in for an approximate quantile sketch (t-digest or KLL):
+# they merge exactly and hold one row per distinct key and length, so they
+# grow with the dates of the history but not with the number of delays.
+# Rows with a missing key are kept, so every delay counts towards the
+# quantiles of its date.
+HISTOGRAM_PARTIALS = ("delay_histogram", "delay_histogram_line", "gap_histogram", "gap_histogram_line")
+
+# Partials holding the number of rows and of recorded delays and their
+# total time, rather than just the number of rows
+TIMED_PARTIALS = ("by_date", "by_hour", "by_hour_line")
+
+# Partials keeping the rows with a missing key (e.g. bus delays whose
+# incident has no group), so the delays per hour add up to every delay
+KEEP_MISSING_PARTIALS = (*HISTOGRAM_PARTIALS, "by_hour", "by_hour_line")
+
+# Heavy-hitters sketches, named "top_<key>s_by_<value>": the key each ranks
+# and the column its weights are the sum of (None to count delays)
+SKETCH_PARTIALS = {
+    "top_stations_by_n": ("station", None),
+    "top_stations_by_total_delay_time": ("station", "min_delay"),
+    "top_vehicles_by_n": ("vehicle", None),
+    "top_vehicles_by_total_delay_time": ("vehicle", "min_delay")
+}
+
+# Partials needed for the summaries of each mode (bus locations are free
+# text, so only the subway has station and vehicle rankings)
+MODE_PARTIALS = {
+    "bus": ("by_date", "by_incident", "by_hour", "delay_histogram", "gap_histogram"),
+    "subway": (
+        "by_date",
+        "by_incident",
+        "by_line",
+        "by_hour_line",
+        "delay_histogram_line",
+        "gap_histogram_line",
+        *SKETCH_PARTIALS
+    )
+}
+
+# Percentiles of the delay and gap lengths reported per group
+QUANTILES = (50, 90, 99)
+
+# Keys of the groups the quantiles are reported for, by summary name
+QUANTILE_GROUPS = {
+    "date": ["date", "day"],
+    "day": ["day"],
+    "incident": ["incident"],
+    "line": ["line"]
+}
+
+# Stations and vehicles listed in each ranking
+TOP_K = 10
+
+# Length in hours of the peak period found for each day of the week
+PEAK_HOURS = 3
+
+
+@instrumented("groupby")
+def compute_partials(delay_data, names):
+    """Compute the partial aggregates ``names`` of a bus or subway table.
+
+    The timed partials hold the number of rows, of recorded delays and
+    their total time per key (see ``PARTIAL_KEYS``), the sketches the
+    busiest stations or vehicles, and the others the number of rows per
+    key.
+    """
+    partials = {}
+
+    # Summaries by date and hour group on the calendar date and the hour of
+    # each delay, binned from the integer timestamps
+    keys = {key for name in names if name in PARTIAL_KEYS for key in PARTIAL_KEYS[name]}
+    if "date" in keys and "date" not in delay_data:
+        delay_data = delay_data.assign(date=calendar_dates(delay_data["timestamp"]))
+    if "hour" in keys and "hour" not in delay_data:
+        delay_data = delay_data.assign(hour=hours_of_day(delay_data["timestamp"]))
+
+    for name in names:
+        if name in SKETCH_PARTIALS:
+            key, weight = SKETCH_PARTIALS[name]
+            keys = delay_data[key]
+            if key == "vehicle":
+                keys = keys.astype("Int16").mask(keys == NO_VEHICLE)
+            partials[name] = heavy_hitters(keys, None if weight is None else delay_data[weight])
+            continue
+
+        grouped = delay_data.groupby(PARTIAL_KEYS[name], observed=True, dropna=name not in KEEP_MISSING_PARTIALS)
+        if name in TIMED_PARTIALS:
+            partials[name] = grouped.agg(
+                rows=("min_delay", "size"),
+                n=("min_delay", "count"),
+                total_delay_time=("min_delay", "sum")
+            ).reset_index()
+        else:
+            partials[name] = grouped.size().reset_index(name="n")
+
+    return partials
+
+
+@instrumented("merge")
+def merge_partials(partials_list):
+    """Combine partial aggregates computed on separate pieces of a table.
+
+    Pieces may overlap on a key (e.g. two chunks of the same date); their
+    counts and sums are added up. Rows with missing keys only occur in the
+    histograms, and are kept.
+    """
+    partials_list = list(partials_list)
+    merged = {}
+
+    for name in partials_list[0]:
+        if name in SKETCH_PARTIALS:
+            merged[name] = merge_heavy_hitters(partials[name] for partials in partials_list)
+            continue
+
+        stacked = pd.concat([partials[name] for partials in partials_list], ignore_index=True)
+        merged[name] = (
+            stacked
+            .groupby(PARTIAL_KEYS[name], observed=True, dropna=False)
+            .sum()
+            .reset_index()
+        )
+
+    return merged
+
+
+@instrumented("groupby")
+def finalise_summaries(partials, mode):
+    """Derive the published ``mode`` ("bus" or "subway") summaries from
+    its partial aggregates, keyed by the name of their output file."""
+    by_date = partials["by_date"]
+    summaries = {}
+
+    # Summarize into average number of delays per day of the week (Mon, Tues, ...)
+    summaries[f"avg_num_{mode}_delays_by_day"] = (
+        by_date
+        .groupby("day", observed=True)["rows"]
+        .mean()
+        .reset_index(name="mean_num_delays")
+    )
+
+    # Summarize into total delay time and number of delays per date (Jan 1st, 2nd, ...)
+    total_delay_time_by_date = by_date[["date", "day", "total_delay_time", "n"]].copy()
+    total_delay_time_by_date["mean_delay_time"] = total_delay_time_by_date["total_delay_time"] / total_delay_time_by_date["n"]
+    summaries[f"total_{mode}_delay_time_by_date"] = total_delay_time_by_date
+
+    # Summarize into the total number of delays per incident type (e.g. Equipment/Mechanical)
+    summaries[f"total_num_{mode}_delays_by_incident"] = partials["by_incident"]
+
+    # Summarize into the total number of delays per line (e.g. BY (Bloor-Yonge))
+    if "by_line" in partials:
+        summaries[f"total_num_{mode}_delays_by_line"] = partials["by_line"]
+
+    # Summarize into the number of delays and total delay time per hour of the
+    # day, day of the week and incident type (and line, for the subway), and
+    # the busiest PEAK_HOURS hours of each day of the week
+    hourly = "by_hour_line" if "by_hour_line" in partials else "by_hour"
+    by_hour = partials[hourly]
+    summaries[f"{mode}_delays_by_hour"] = by_hour[PARTIAL_KEYS[hourly] + ["n", "total_delay_time"]]
+    summaries[f"{mode}_peak_periods"] = peak_periods(by_hour)
+
+    # The TOP_K stations and vehicles with the most delays and with the most
+    # delay time, with the most each count may be short by
+    rankings = {}
+    for name in SKETCH_PARTIALS:
+        if name in partials:
+            ranked, ranked_by = name.split("_by_", 1)
+            ranking = top_k(partials[name], TOP_K).rename(columns={"weight": "value"})
+            ranking.insert(0, "ranked_by", ranked_by)
+            rankings.setdefault(f"{mode}_{ranked}", []).append(ranking)
+    for name, ranking in rankings.items():
+        summaries[name] = pd.concat(ranking, ignore_index=True)
+
+    # The QUANTILES of the delay and gap lengths per date, day of the week,
+    # incident type (and line)
+    suffix = "_line" if "delay_histogram_line" in partials else ""
+    delays = partials[f"delay_histogram{suffix}"]
+    gaps = partials[f"gap_histogram{suffix}"]
+    for group, keys in QUANTILE_GROUPS.items():
+        if all(key in delays for key in keys):
+            summaries[f"{mode}_delay_quantiles_by_{group}"] = (
+                histogram_quantiles(delays, keys, "min_delay")
+                .merge(histogram_quantiles(gaps, keys, "min_gap").drop(columns="n"), on=keys)
+            )
+
+    return summaries
+
+
+def histogram_quantiles(histogram, keys, value, quantiles=QUANTILES):
+    """Return the number of rows and the ``quantiles`` (in percent) of
+    ``value`` per ``keys`` from a histogram partial.
+
+    The p-th percentile is the smallest value at least p% of the group's
+    rows are at most (numpy's "inverted_cdf" method), so it is always a
+    value that occurs.
+    """
+    counts = histogram.groupby([*keys, value], observed=True)["n"].sum().reset_index()
+    grouped = counts.groupby(keys, observed=True, sort=False)["n"]
+    cumulative = grouped.cumsum()
+    totals = grouped.transform("sum")
+
+    result = counts.groupby(keys, observed=True)["n"].sum().to_frame()
+    for quantile in quantiles:
+        # Rows needed to reach the quantile: ceil(quantile * n / 100), in
+        # integers to avoid rounding errors
+        needed = (quantile * totals + 99) // 100
+        reached = counts[cumulative >= needed]
+        result[f"{value}_p{quantile}"] = reached.groupby(keys, observed=True)[value].first()
+
+    return result.reset_index()
+
+
+def peak_periods(by_hour, hours=PEAK_HOURS):
+    """Return the ``hours`` consecutive hours with the most delays on each
+    day of the week, with their number of delays, total delay time and share
+    of the day's delays.
+
+    Periods may wrap around midnight (into the early hours of the same day
+    of the week).
+    """
+    totals = by_hour.groupby(["day", "hour"], observed=True)[["n", "total_delay_time"]].sum()
+    days = totals.index.get_level_values("day").unique()
+    grid = pd.MultiIndex.from_product([days, range(24)], names=["day", "hour"])
+    totals = totals.reindex(grid, fill_value=0)
+
+    # Rolling sums over each day's 24 hours (wrapped around), from the
+    # differences of cumulative sums: window[d, h] covers hours h to
+    # h + hours - 1
+    def windows(column):
+        counts = totals[column].to_numpy().reshape(len(days), 24)
+        wrapped = np.concatenate([np.zeros((len(days), 1), counts.dtype), counts, counts[:, :hours - 1]], axis=1)
+        cumulative = wrapped.cumsum(axis=1)
+        return cumulative[:, hours:] - cumulative[:, :-hours], counts.sum(axis=1)
+
+    n, day_n = windows("n")
+    total_delay_time, _ = windows("total_delay_time")
+    start = n.argmax(axis=1)
+    rows = np.arange(len(days))
+
+    return pd.DataFrame({
+        "day": days,
+        "start_hour": start,
+        "end_hour": (start + hours) % 24,
+        "n": n[rows, start],
+        "total_delay_time": total_delay_time[rows, start],
+        "share_of_delays": n[rows, start] / day_n
+    })
+
+
+def write_partition_partials(delay_data, directory, month, mode):
+    """Compute and store the partial aggregates of one month of the
+    partitioned store; return them."""
+    partials = compute_partials(delay_data, MODE_PARTIALS[mode])
+    for name, partial in partials.items():
+        write_partition_table(partial, directory, month, f"partials_{name}")
+    return partials
+
+
+def read_partition_partials(directory, month, mode):
+    """Return the stored partial aggregates of one month, computing them
+    from the month's rows if they haven't been stored yet."""
+    names = MODE_PARTIALS[mode]
+    paths = {name: partition_path(directory, month, f"partials_{name}") for name in names}
+
+    if not all(path.exists() for path in paths.values()):
+        delay_data = read_partitions(directory, months=[month])
+        return write_partition_partials(delay_data, directory, month, mode)
+
+    return {name: pd.read_parquet(path) for name, path in paths.items()}
+
+
+def summarise_partitions(directory, mode, workers=WORKERS):
+    """Return the ``mode`` summaries of the whole partitioned store, merged
+    from the partial aggregates of each month without reading its rows.
+
+    The partials of the months are read (or computed, if missing) in up to
+    ``workers`` processes and merged in month order.
+    """
+    months = stored_partitions(directory)
+    return finalise_summaries(
+        merge_partials(map_in_processes(
+            read_partition_partials,
+            [(directory, month, mode) for month in months],
+            workers
+        )),
+        mode
+    )
+
+
+def summarise_bus_data(bus_delay_data):
+    """Return the bus summaries, keyed by the name of their output file."""
+    return finalise_summaries(compute_partials(bus_delay_data, MODE_PARTIALS["bus"]), "bus")
+
+
+def summarise_subway_data(subway_delay_data):
+    """Return the subway summaries, keyed by the name of their output file."""
+    return finalise_summaries(compute_partials(subway_delay_data, MODE_PARTIALS["subway"]), "subway")
+
+
+@instrumented("write")
+def save_summaries(summaries, directory=SUMMARY_DIR):
+    """Save each summary as ``<directory>/<name>.csv``."""
+    for name, summary in summaries.items():
+        format_for_csv(summary).to_csv(directory / f"{name}.csv", index=False)
@@ -0,0 +1,190 @@
+"""Declarative checks of the delay tables.
+
+The checks of a table are written as constraints on its columns, e.g.::
+
+    CLEANED_CONSTRAINTS = {
+        "day": {"dtype": "category", "values": DAYS, "required": True, "all_occur": True},
+        "min_delay": {"dtype": "int16", "min": 0}
+    }
+
+A constraint may give the column's ``dtype``, whether it is ``required``,
+the ``values`` it may take (or a ``Normaliser`` they must be ``mapped_by``),
+its ``min`` and ``max``, and whether ``all_occur`` (each of ``values``
+occurs in the table). Its ``severity`` is "error" (the default) or
+"warning", for rows that are expected to be lost but should be seen.
+
+A ``Validator`` checks each chunk of a table as it passes, counting and
+sampling the rows breaking each rule, and makes the ``all_occur`` checks
+once the table ends (unless it only sees part of the table). ``finish``
+prints the violations and raises ``ValidationError`` on errors, unless
+``on_error`` (``TTC_VALIDATION``) is "warn".
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ttc_analysis.instrument import span
+from ttc_analysis.schema import format_for_csv
+
+# "fail" to stop on errors or "warn" to only report them
+ON_ERROR = os.environ.get("TTC_VALIDATION") or "fail"
+
+# Offending rows kept per check
+SAMPLE_ROWS = 5
+
+# Rules a column constraint may have, in the order they're checked
+RULES = ("dtype", "required", "values", "mapped_by", "min", "max", "all_occur")
+
+SEVERITIES = ("error", "warning")
+
+
+class ValidationError(AssertionError):
+    """A table broke one of its constraints (an ``AssertionError``, as
+    raised by the asserts the constraints replaced)."""
+
+
+def has_dtype(values, dtype):
+    """Return whether a column has the constraint's ``dtype``."""
+    if dtype == "category":
+        return isinstance(values.dtype, pd.CategoricalDtype)
+    if dtype == "datetime":
+        return pd.api.types.is_datetime64_any_dtype(values)
+    return values.dtype == np.dtype(dtype)
+
+
+def check_constraints(constraints, on_error):
+    """Refuse constraints with unknown rules or severities, and an unknown
+    ``on_error``, before any data is read."""
+    if on_error not in ("fail", "warn"):
+        raise ValueError(f"unknown on_error {on_error!r}; use fail or warn")
+
+    for column, constraint in constraints.items():
+        unknown = set(constraint) - set(RULES) - {"severity"}
+        if unknown:
+            raise ValueError(f"unknown rule(s) {sorted(unknown)} for {column}; use some of {RULES}")
+        if constraint.get("severity", "error") not in SEVERITIES:
+            raise ValueError(f"unknown severity {constraint['severity']!r} for {column}; use one of {SEVERITIES}")
+        if constraint.get("all_occur") and "values" not in constraint:
+            raise ValueError(f"all_occur for {column} needs values")
+
+
+class Validator:
+    """Check the chunks of the table ``name`` against ``constraints``."""
+
+    def __init__(self, name, constraints, on_error=ON_ERROR, whole_table=True):
+        check_constraints(constraints, on_error)
+        self.name = name
+        self.constraints = constraints
+        self.on_error = on_error
+        self.rows = 0
+        self.violations = {}
+        self.samples = {}
+        # A few days or months of a table needn't have every value
+        self.occurring = {
+            column: set()
+            for column, constraint in constraints.items()
+            if constraint.get("all_occur") and whole_table
+        }
+
+    def record(self, column, rule, count, sample=()):
+        """Add ``count`` violations of ``column``'s ``rule``, and rows of
+        ``sample`` up to SAMPLE_ROWS."""
+        check = (column, rule)
+        self.violations[check] = self.violations.get(check, 0) + count
+        kept = self.samples.setdefault(check, [])
+        kept.extend(list(sample)[:SAMPLE_ROWS - len(kept)])
+
+    def check(self, chunk):
+        """Check the rows of one chunk (or of the whole table)."""
+        with span("validate.check", "validate", len(chunk)):
+            for column, constraint in self.constraints.items():
+                if column not in chunk:
+                    self.record(column, "present", 1, [{"columns": list(chunk.columns)}])
+                    continue
+
+                values = chunk[column]
+                if "dtype" in constraint and not has_dtype(values, constraint["dtype"]):
+                    self.record(column, "dtype", 1, [{"dtype": str(values.dtype)}])
+
+                missing = values.isna()
+                broken = {}
+                if constraint.get("required"):
+                    broken["required"] = missing
+                if "values" in constraint:
+                    broken["values"] = ~missing & ~values.isin(list(constraint["values"]))
+                if "mapped_by" in constraint:
+                    broken["mapped_by"] = ~missing & ~constraint["mapped_by"].mapped(values)
+                if "min" in constraint:
+                    broken["min"] = values < constraint["min"]
+                if "max" in constraint:
+                    broken["max"] = values > constraint["max"]
+
+                for rule, mask in broken.items():
+                    count = int(mask.sum())
+                    self.record(column, rule, count, self.sample_rows(chunk, mask) if count else ())
+
+                if column in self.occurring:
+                    self.occurring[column].update(values.dropna().unique())
+
+            self.rows += len(chunk)
+
+    def sample_rows(self, chunk, mask):
+        """Return up to SAMPLE_ROWS of the rows of ``chunk`` flagged by
+        ``mask``, with their position in the table, written as in the CSV
+        exports."""
+        positions = np.flatnonzero(mask.to_numpy())[:SAMPLE_ROWS]
+        sample = format_for_csv(chunk.iloc[positions])
+        sample = sample.astype(object).where(sample.notna(), None)
+        return [{"row": self.rows + int(position), **row} for position, row in zip(positions, sample.to_dict("records"))]
+
+    def report(self):
+        """Return the number of violations of each check, with its severity
+        and a sample of the offending rows."""
+        return pd.DataFrame([
+            {
+                "column": column,
+                "rule": rule,
+                "severity": self.constraints[column].get("severity", "error"),
+                "violations": count,
+                "sample": self.samples.get((column, rule), [])
+            }
+            for (column, rule), count in self.violations.items()
+        ], columns=["column", "rule", "severity", "violations", "sample"])
+
+    def finish(self):
+        """Make the checks that need every row, print the violations or,
+        if there are errors and ``on_error`` is "fail", raise
+        ``ValidationError``. Return the report."""
+        for column, seen in self.occurring.items():
+            absent = [value for value in self.constraints[column]["values"] if value not in seen]
+            self.record(column, "all_occur", len(absent), [{"absent": value} for value in absent])
+
+        report = self.report()
+        broken = report[report["violations"] > 0]
+        if broken.empty:
+            return report
+
+        lines = [f"Validation of {self.name} ({self.rows} rows):"]
+        for check in broken.itertuples():
+            lines.append(f"  {check.severity}: {check.column} {check.rule}, {check.violations} violation(s), e.g.")
+            lines.extend(f"    {row}" for row in check.sample)
+        message = "\n".join(lines)
+
+        if self.on_error == "fail" and (broken["severity"] == "error").any():
+            raise ValidationError(message)
+        print(message, file=sys.stderr)
+        return report
+
+
+def validate(df, constraints, name, on_error=ON_ERROR, whole_table=True):
+    """Check a table against ``constraints``; return the report.
+
+    Unless ``whole_table``, ``df`` is only part of the table (e.g. the
+    months being ingested) and the ``all_occur`` checks are skipped.
+    """
+    validator = Validator(name, constraints, on_error, whole_table)
+    validator.check(df)
+    return validator.finish()
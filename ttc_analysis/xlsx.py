@@ -0,0 +1,219 @@
+"""Streaming reader for the delay workbooks.
+
+``pandas.read_excel`` builds every cell of the workbook as a Python object
+before the cleaning step throws most columns away. ``stream_workbook``
+instead parses the first worksheet's XML incrementally (``iterparse``),
+normalises the header names the same way ``clean_names`` does, keeps only
+the requested columns and yields them in typed chunks of ``chunk_size``
+rows. ``workbook_to_parquet`` writes those chunks straight into a Parquet
+file, one row group per chunk, so peak memory is bounded by the chunk size
+rather than by the size of the workbook.
+"""
+
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ttc_analysis.clean import clean_name
+from ttc_analysis.instrument import instrumented
+from ttc_analysis.schema import parse_dates, parse_times
+
+MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIPS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Rows per chunk (and per Parquet row group)
+CHUNK_SIZE = 100_000
+
+# Arrow type of each column that isn't text, in the microseconds the
+# schema parses the CSV dates and times to
+COLUMN_TYPES = {
+    "date": pa.timestamp("us"),
+    "time": pa.duration("us"),
+    "min_delay": pa.int64(),
+    "min_gap": pa.int64(),
+    "vehicle": pa.int64()
+}
+
+
+def column_index(reference):
+    """Return the zero-based column of a cell reference such as ``"AB12"``."""
+    index = 0
+    for character in reference:
+        if not character.isalpha():
+            break
+        index = index * 26 + ord(character.upper()) - ord("A") + 1
+    return index - 1
+
+
+def first_sheet_path(archive):
+    """Return the archive path of the workbook's first worksheet."""
+    with archive.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{MAIN}sheet":
+                relationship = element.get(f"{RELATIONSHIPS}id")
+                break
+
+    with archive.open("xl/_rels/workbook.xml.rels") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{PACKAGE_RELATIONSHIPS}Relationship" and element.get("Id") == relationship:
+                target = element.get("Target")
+                break
+
+    # Targets are either absolute within the package or relative to xl/
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join("xl", target))
+
+
+def read_shared_strings(archive):
+    """Return the workbook's shared strings table."""
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{MAIN}si":
+                strings.append("".join(text.text or "" for text in element.iter(f"{MAIN}t")))
+                element.clear()
+    return strings
+
+
+def cell_value(cell, shared_strings):
+    """Return the raw value of a ``<c>`` element: a string or a float."""
+    kind = cell.get("t")
+
+    if kind == "inlineStr":
+        return "".join(text.text or "" for text in cell.iter(f"{MAIN}t"))
+
+    value = cell.find(f"{MAIN}v")
+    if value is None or value.text is None:
+        return None
+    if kind == "s":
+        return shared_strings[int(value.text)]
+    if kind in ("str", "e"):
+        return value.text
+    if kind == "b":
+        return value.text == "1"
+    return float(value.text)
+
+
+def convert_dates(values):
+    """Convert Excel serial dates or ``YYYY-MM-DD`` strings to datetimes."""
+    values = pd.Series(values, dtype="object")
+    serial = pd.to_numeric(values, errors="coerce")
+    dates = pd.to_datetime(serial, unit="D", origin="1899-12-30").dt.floor("D")
+
+    text = serial.isna() & values.notna()
+    if text.any():
+        dates[text] = parse_dates(values[text].astype(str).str[:10])
+    return dates
+
+
+def convert_times(values):
+    """Convert Excel day fractions or ``HH:MM`` strings to durations."""
+    values = pd.Series(values, dtype="object")
+    fraction = pd.to_numeric(values, errors="coerce")
+    times = pd.to_timedelta((fraction * 24 * 60).round(), unit="min")
+
+    text = fraction.isna() & values.notna()
+    if text.any():
+        times[text] = parse_times(values[text].astype(str))
+    return times
+
+
+def to_arrow(columns, values):
+    """Build an Arrow table from per-column lists of raw cell values."""
+    arrays = []
+    for column, column_values in zip(columns, values):
+        if column == "date":
+            array = pa.array(convert_dates(column_values), type=COLUMN_TYPES[column], from_pandas=True)
+        elif column == "time":
+            array = pa.array(convert_times(column_values), type=COLUMN_TYPES[column], from_pandas=True)
+        elif column in COLUMN_TYPES:
+            numbers = pd.to_numeric(pd.Series(column_values, dtype="object"), errors="coerce")
+            array = pa.array(numbers, type=COLUMN_TYPES[column], from_pandas=True)
+        else:
+            # Empty strings are missing, as with read_excel
+            text = [None if value is None or value == "" else str(value) for value in column_values]
+            array = pa.array(text, type=pa.string())
+        arrays.append(array)
+    return pa.table(arrays, names=list(columns))
+
+
+def stream_workbook(path, columns, header=0, chunk_size=CHUNK_SIZE):
+    """Yield the normalised ``columns`` of the first worksheet of ``path``
+    as Arrow tables of at most ``chunk_size`` rows.
+
+    ``header`` is the zero-based row holding the column names, as in
+    ``read_excel``. Rows above it are skipped.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared_strings = read_shared_strings(archive)
+        positions = None
+        chunk = [[] for _ in columns]
+        row_number = -1
+
+        with archive.open(first_sheet_path(archive)) as f:
+            sheet_data = None
+            for event, element in iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if element.tag == f"{MAIN}sheetData":
+                        sheet_data = element
+                    continue
+                if element.tag != f"{MAIN}row":
+                    continue
+
+                # Empty rows may be left out of the sheet, so prefer the
+                # row's own (one-based) number over counting
+                reference = element.get("r")
+                row_number = int(reference) - 1 if reference else row_number + 1
+
+                cells = {}
+                if row_number >= header:
+                    for cell in element.iter(f"{MAIN}c"):
+                        cells[column_index(cell.get("r"))] = cell_value(cell, shared_strings)
+
+                # Drop the parsed row so the tree never holds more than one
+                sheet_data.remove(element)
+
+                if row_number < header:
+                    continue
+
+                if positions is None:
+                    names = {clean_name(str(name)): index for index, name in cells.items() if name is not None}
+                    missing = [column for column in columns if column not in names]
+                    if missing:
+                        raise KeyError(f"{path} has no column(s) {missing}")
+                    positions = [names[column] for column in columns]
+                    continue
+
+                # Skip fully blank rows
+                if all(cells.get(position) is None for position in positions):
+                    continue
+
+                for values, position in zip(chunk, positions):
+                    values.append(cells.get(position))
+
+                if len(chunk[0]) == chunk_size:
+                    yield to_arrow(columns, chunk)
+                    chunk = [[] for _ in columns]
+
+        if chunk[0]:
+            yield to_arrow(columns, chunk)
+
+
+@instrumented("load")
+def workbook_to_parquet(path, parquet_file, columns, header=0, chunk_size=CHUNK_SIZE):
+    """Stream the ``columns`` of the workbook at ``path`` into
+    ``parquet_file``, one row group per chunk."""
+    schema = pa.schema([(column, COLUMN_TYPES.get(column, pa.string())) for column in columns])
+
+    with pq.ParquetWriter(parquet_file, schema) as writer:
+        for table in stream_workbook(path, columns, header, chunk_size):
+            writer.write_table(table)